@@ -1,16 +1,209 @@
 import csv
+import json
 import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
 from datetime import datetime
 from typing import List
 
+from report_store import ReportStore
+
+class ReportWriter:
+    """Escribe los reportes acumulativos en segundo plano a medida que ocurren los eventos.
+
+    Los workers solo encolan tuplas (cola acotada); un hilo las agrupa y las escribe en
+    bloque cada `flush_every` filas o `flush_interval` segundos, con los archivos abiertos
+    durante toda la sesión. Con `store_path` todos los eventos (incluidos los enlaces) y
+    los resúmenes de sesión van a un ReportStore (SQLite); `csv_reports=False` deja de
+    escribir los CSV, que se pueden generar desde el almacén. Opcionalmente todos los
+    eventos se escriben también en un JSONL.
+    """
+
+    CSV_REPORTS = {
+        'new_person': ("reporte_nuevas_personas.csv", ['name', 'id', 'created_at']),
+        'error': ("reporte_errores.csv", ['contract_id', 'person_name', 'error', 'timestamp']),
+        'properties_updated': ("reporte_propiedades_actualizadas.csv",
+                               ['person_id', 'person_name', 'updated_props', 'timestamp']),
+    }
+    EVENT_FIELDS = {kind: fieldnames for kind, (_, fieldnames) in CSV_REPORTS.items()}
+    EVENT_FIELDS['link'] = ['contract_id', 'person_name', 'person_id', 'timestamp']
+
+    def __init__(self, directory: str = ".", events_jsonl: str = None, flush_every: int = 500,
+                 flush_interval: float = 2.0, max_queue: int = 10000, store_path: str = None,
+                 csv_reports: bool = True):
+        self.directory = directory
+        self.events_jsonl = events_jsonl
+        self.store_path = store_path
+        self.csv_reports = csv_reports
+        self.store = None  # Se abre en el hilo escritor (las conexiones SQLite no se comparten entre hilos)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)  # Si el disco se atrasa, los workers esperan
+        self.files = {}
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="report-writer", daemon=True)
+        self.start_lock = threading.Lock()
+        self.started = False  # El hilo se inicia con el primer envío: una ejecución sin eventos no lo crea
+
+    def wants(self, kind: str) -> bool:
+        """True si algún reporte recibe este tipo de evento."""
+        return (self.csv_reports and kind in self.CSV_REPORTS) or self.events_jsonl is not None or self.store_path is not None
+
+    def write(self, kind: str, *values):
+        """Encola una fila (valores en el orden de columnas del CSV; el último es un time.time())."""
+        self._put(('row', kind, values))
+
+    def write_session(self, summary: dict):
+        """Encola el resumen de una sesión para el almacén (si hay `store_path`)."""
+        if self.store_path is not None:
+            self._put(('session', summary))
+
+    def flush(self):
+        """Espera a que todo lo encolado hasta ahora esté escrito en disco."""
+        if self.closed or not self.started: return
+        done = threading.Event()
+        self.queue.put(('flush', done))
+        done.wait()
+
+    def close(self):
+        """Escribe lo pendiente, detiene el hilo y cierra los archivos."""
+        if self.closed: return
+        self.closed = True
+        if not self.started: return
+        self.queue.put(('close', None))
+        self.thread.join()
+
+    def _put(self, item: tuple):
+        if not self.started:
+            with self.start_lock:
+                if not self.started:
+                    self.thread.start()
+                    self.started = True
+        self.queue.put(item)
+
+    def _file(self, name: str, header: List[str] = None):
+        if name not in self.files:
+            path = os.path.join(self.directory, name)
+            new_file = not os.path.isfile(path) or os.path.getsize(path) == 0
+            handle = open(path, 'a', newline='', encoding='utf-8')
+            if new_file and header:
+                csv.writer(handle).writerow(header)
+            self.files[name] = handle
+        return self.files[name]
+
+    def _write_pending(self, pending: dict):
+        """Escribe en bloque las filas acumuladas (una llamada por archivo)."""
+        if not pending: return
+        try:
+            for kind, rows in pending.items():
+                formatted = [values[:-1] + (datetime.fromtimestamp(values[-1]).strftime('%Y-%m-%d %H:%M:%S'),)
+                             for values in rows]
+                if self.store_path is not None:
+                    self._store().add_events(kind, self.EVENT_FIELDS[kind], formatted)
+                if self.csv_reports and kind in self.CSV_REPORTS:
+                    filename, fieldnames = self.CSV_REPORTS[kind]
+                    csv.writer(self._file(filename, fieldnames)).writerows(formatted)
+                if self.events_jsonl is not None:
+                    self._file(self.events_jsonl).write(
+                        "".join(json.dumps({'event': kind, **dict(zip(self.EVENT_FIELDS[kind], row))},
+                                           ensure_ascii=False) + "\n" for row in formatted))
+            for handle in self.files.values():
+                handle.flush()
+        except (IOError, sqlite3.Error) as e:
+            print(f"Error al escribir los reportes: {e}")
+        pending.clear()
+
+    def _store(self) -> ReportStore:
+        if self.store is None:
+            self.store = ReportStore(os.path.join(self.directory, self.store_path))
+        return self.store
+
+    def _write_session(self, summary: dict):
+        try:
+            self._store().add_session(summary)
+        except sqlite3.Error as e:
+            print(f"Error al guardar la sesión en {self.store_path}: {e}")
+
+    def _run(self):
+        pending, count = {}, 0
+        while True:
+            try:
+                action, *payload = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._write_pending(pending); count = 0
+                continue
+            if action == 'row':
+                kind, values = payload
+                pending.setdefault(kind, []).append(values)
+                count += 1
+                if count >= self.flush_every:
+                    self._write_pending(pending); count = 0
+                continue
+            self._write_pending(pending); count = 0
+            if action == 'session':
+                self._write_session(payload[0])
+                continue
+            if action == 'close':
+                for handle in self.files.values():
+                    handle.close()
+                self.files = {}
+                if self.store is not None:
+                    self.store.close()
+                    self.store = None
+                return
+            payload[0].set()
+
+class QueueReportWriter:
+    """Escritor de reportes de un worker de otro proceso: reenvía los eventos al coordinador.
+
+    El coordinador los pasa a su propio ReportWriter, así que los CSV tienen un solo
+    escritor aunque haya varios procesos.
+    """
+
+    def __init__(self, events_queue, kinds):
+        self.queue = events_queue
+        self.kinds = frozenset(kinds)
+
+    def wants(self, kind: str) -> bool:
+        return kind in self.kinds
+
+    def write(self, kind: str, *values):
+        self.queue.put((kind, values))
+
+    def flush(self):
+        pass
+
+    def write_session(self, summary: dict):
+        pass  # El resumen de la sesión lo guarda el coordinador
+
+    def close(self):
+        pass
+
 class ProcessingAnalyzer:
-    """Clase para analizar y reportar estadísticas del procesamiento."""
+    """Clase para analizar y reportar estadísticas del procesamiento.
+
+    En memoria solo guarda contadores y los últimos errores; el detalle de cada evento se
+    envía al `ReportWriter` (si se indica), que lo escribe en segundo plano.
+    """
+
+    RECENT_ERRORS = 20  # Errores detallados que se muestran en el reporte de sesión
     
-    def __init__(self):
+    def __init__(self, report_writer: ReportWriter = None):
         """Inicializa las estadísticas para la sesión."""
         self.stats = {}
+        self.lock = threading.Lock()  # Los workers concurrentes registran eventos en paralelo
+        self.report_writer = report_writer
+        self.recent_errors = deque(maxlen=self.RECENT_ERRORS)
         self.start_session()
 
+    def _emit(self, kind: str, *values):
+        """Envía un evento al escritor de reportes (con marca de tiempo) si lo quiere."""
+        if self.report_writer is not None and self.report_writer.wants(kind):
+            self.report_writer.write(kind, *values, time.time())
+
     def start_session(self):
         """Inicia o resetea una nueva sesión de procesamiento para un lote."""
         self.stats = {
@@ -19,53 +212,135 @@ class ProcessingAnalyzer:
             'existing_persons_found': 0, 'cache_hits': 0,
             'properties_updated': 0,
             'start_time': datetime.now(), 'end_time': None,
-            'error_details': [], 'new_persons_list': [],
-            'properties_updated_list': [],
-            'processed_contracts': []
+            'api_metrics': {}
         }
+        self.recent_errors.clear()
         print(f"🕐 Iniciando sesión de lote: {self.stats['start_time'].strftime('%Y-%m-%d %H:%M:%S')}")
     
     def end_session(self):
         """Finaliza la sesión de procesamiento del lote."""
         self.stats['end_time'] = datetime.now()
 
+    def record_contract_processed(self):
+        """Registra un contrato tomado para procesar."""
+        with self.lock:
+            self.stats['total_processed'] += 1
+
     def record_properties_updated(self, person_id: str, person_name: str, updated_props: List[str]):
         """Registra una actualización de propiedades para una persona existente."""
-        self.stats['properties_updated'] += 1
-        self.stats['properties_updated_list'].append({
-            'person_id': person_id,
-            'person_name': person_name,
-            'updated_props': ", ".join(updated_props),
-            'timestamp': datetime.now()
-        })
+        with self.lock:
+            self.stats['properties_updated'] += 1
+        self._emit('properties_updated', person_id, person_name, ", ".join(updated_props))
     
     def record_successful_link(self, contract_id: str, person_name: str, person_id: str):
         """Registra un enlace exitoso."""
-        self.stats['successful_links'] += 1
-        self.stats['processed_contracts'].append({'contract_id': contract_id, 'person_name': person_name, 'person_id': person_id, 'status': 'success', 'timestamp': datetime.now()})
+        with self.lock:
+            self.stats['successful_links'] += 1
+        self._emit('link', contract_id, person_name, person_id)
 
     def record_error(self, contract_id: str, person_name: str, error_message: str):
         """Registra un error durante el procesamiento."""
-        self.stats['errors'] += 1
-        self.stats['error_details'].append({'contract_id': contract_id, 'person_name': person_name, 'error': error_message, 'timestamp': datetime.now()})
+        with self.lock:
+            self.stats['errors'] += 1
+            self.recent_errors.append((person_name, error_message))
+        self._emit('error', contract_id, person_name, error_message)
 
     def record_skipped_empty_name(self, contract_id: str):
         """Registra un contrato saltado por nombre vacío."""
-        self.stats['skipped_empty_names'] += 1
+        with self.lock:
+            self.stats['skipped_empty_names'] += 1
 
     def record_new_person_created(self, person_name: str, person_id: str):
         """Registra una nueva persona creada."""
-        self.stats['new_persons_created'] += 1
-        self.stats['new_persons_list'].append({'name': person_name, 'id': person_id, 'created_at': datetime.now()})
+        with self.lock:
+            self.stats['new_persons_created'] += 1
+        self._emit('new_person', person_name, person_id)
 
     def record_existing_person_found(self, person_name: str, person_id: str):
         """Registra una persona existente encontrada."""
-        self.stats['existing_persons_found'] += 1
+        with self.lock:
+            self.stats['existing_persons_found'] += 1
 
     def record_cache_hit(self):
         """Registra un hit en el caché."""
-        self.stats['cache_hits'] += 1
+        with self.lock:
+            self.stats['cache_hits'] += 1
+    
+    def merge_stats(self, counters: dict, recent_errors: list = ()):
+        """Suma los contadores y los últimos errores de otra sesión (p. ej. un worker de shard)."""
+        with self.lock:
+            for key, value in counters.items():
+                self.stats[key] = self.stats.get(key, 0) + value
+            self.recent_errors.extend(tuple(error) for error in recent_errors)
+
+    def counters(self) -> dict:
+        """Contadores de la sesión (sin tiempos ni métricas de la API)."""
+        return {k: v for k, v in self.stats.items() if isinstance(v, int)}
     
+    def set_api_metrics(self, api_metrics: dict):
+        """Adjunta las métricas por endpoint de NotionService.get_api_metrics() a la sesión."""
+        self.stats['api_metrics'] = api_metrics or {}
+
+    def get_time_breakdown(self) -> dict:
+        """Reparte la duración del lote entre API (red), espera del rate limiter y procesamiento local.
+
+        Con concurrencia los tiempos de API y espera son acumulados entre workers y
+        pueden superar la duración; el tiempo local se estima como el remanente.
+        """
+        if not self.stats.get('end_time'): self.end_session()
+        duration = (self.stats['end_time'] - self.stats['start_time']).total_seconds()
+        metrics = self.stats['api_metrics'].values()
+        api_time = sum(m['api_time_s'] for m in metrics)
+        limiter_wait = sum(m['limiter_wait_s'] for m in metrics)
+        return {
+            'duration_s': round(duration, 3),
+            'api_time_s': round(api_time, 3),
+            'limiter_wait_s': round(limiter_wait, 3),
+            'local_time_s': round(max(0.0, duration - api_time - limiter_wait), 3),
+            'api_calls': sum(m['calls'] for m in metrics),
+            'retries': sum(m['retries'] for m in metrics),
+            'throttled': sum(m['throttled'] for m in metrics),
+        }
+
+    def _api_metrics_lines(self) -> List[str]:
+        """Tabla de métricas por endpoint para los reportes de consola y de sesión."""
+        if not self.stats['api_metrics']: return []
+        breakdown = self.get_time_breakdown()
+        lines = [
+            "\n📡 LLAMADAS A LA API",
+            f"   Llamadas: {breakdown['api_calls']} | Reintentos: {breakdown['retries']} | 429: {breakdown['throttled']}",
+            f"   Tiempo en API: {breakdown['api_time_s']}s | Espera rate limiter: {breakdown['limiter_wait_s']}s"
+            f" | Local (estimado): {breakdown['local_time_s']}s",
+            "┌──────────────────────────┬─────────┬──────────┬───────┬──────────┬──────────┬────────────┐",
+            "│ Endpoint                 │ Llamadas│ Reintent.│  429  │ p50 (ms) │ p99 (ms) │ Espera (s) │",
+            "├──────────────────────────┼─────────┼──────────┼───────┼──────────┼──────────┼────────────┤",
+        ]
+        for endpoint, m in sorted(self.stats['api_metrics'].items()):
+            lines.append(f"│ {endpoint:<24} │ {m['calls']:>7} │ {m['retries']:>8} │ {m['throttled']:>5} │"
+                         f" {m['latency_p50_ms']:>8g} │ {m['latency_p99_ms']:>8g} │ {m['limiter_wait_s']:>10} │")
+        lines.append("└──────────────────────────┴─────────┴──────────┴───────┴──────────┴──────────┴────────────┘")
+        return lines
+
+    def export_metrics_json(self, filename: str = None) -> str:
+        """Exporta contadores de la sesión, desglose de tiempos y métricas de la API a JSON."""
+        if not self.stats.get('end_time'): self.end_session()
+        filename = filename or f"reporte_metricas_{self.stats['start_time'].strftime('%Y%m%d_%H%M%S')}.json"
+        counters = self.counters()
+        data = {
+            'start_time': self.stats['start_time'].isoformat(timespec='seconds'),
+            'end_time': self.stats['end_time'].isoformat(timespec='seconds'),
+            'counters': counters,
+            'time_breakdown': self.get_time_breakdown(),
+            'api_metrics': self.stats['api_metrics'],
+        }
+        try:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            print(f"📋 Métricas exportadas a: {filename}")
+        except IOError as e:
+            print(f"Error exportando métricas JSON: {e}")
+        return filename
+
     def generate_console_report(self):
         """Genera un reporte completo del lote en la consola."""
         if not self.stats.get('end_time'): self.end_session()
@@ -79,42 +354,38 @@ class ProcessingAnalyzer:
         print(f"🔄 Propiedades actualizadas: {self.stats['properties_updated']}")
         print(f"❌ Errores: {self.stats['errors']}")
         print(f"⏱️  Duración del lote: {duration}")
+        for line in self._api_metrics_lines():
+            print(line)
         print("="*60)
 
-    def _append_to_csv(self, filename: str, data_list: List[dict], fieldnames: List[str]):
-        """Función interna para añadir datos a un CSV de forma segura."""
-        if not data_list: return
-        file_exists = os.path.isfile(filename)
-        try:
-            with open(filename, 'a', newline='', encoding='utf-8') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                if not file_exists:
-                    writer.writeheader()
-                for item in data_list:
-                    row = {k: v for k, v in item.items() if k in fieldnames}
-                    if 'timestamp' in row and isinstance(row['timestamp'], datetime):
-                        row['timestamp'] = row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
-                    if 'created_at' in row and isinstance(row['created_at'], datetime):
-                        row['created_at'] = row['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-                    writer.writerow(row)
-        except IOError as e:
-            print(f"Error al escribir en el archivo CSV {filename}: {e}")
-
     def export_cumulative_reports(self):
-        """Exporta los datos detallados a archivos CSV fijos, añadiendo la información."""
-        print("💾 Actualizando reportes CSV acumulativos...")
-        self._append_to_csv("reporte_nuevas_personas.csv", self.stats['new_persons_list'], ['name', 'id', 'created_at'])
-        self._append_to_csv("reporte_errores.csv", self.stats['error_details'], ['contract_id', 'person_name', 'error', 'timestamp'])
-        self._append_to_csv("reporte_propiedades_actualizadas.csv", self.stats['properties_updated_list'], ['person_id', 'person_name', 'updated_props', 'timestamp'])
-        print("✅ Reportes CSV actualizados.")
+        """Asegura que los reportes acumulativos (escritos durante el lote) estén en disco."""
+        if self.report_writer is None: return
+        print("💾 Actualizando reportes acumulativos...")
+        self.report_writer.flush()
+        print("✅ Reportes acumulativos actualizados.")
 
-    def save_session_table_report(self):
-        """Guarda un reporte de la sesión actual en formato de tabla en un archivo de texto."""
+    def record_session(self):
+        """Envía el resumen de la sesión (contadores, métricas de la API y reporte en tabla) al almacén de reportes."""
+        if self.report_writer is None: return
+        if not self.stats.get('end_time'): self.end_session()
+        self.report_writer.write_session({
+            'start_time': self.stats['start_time'].strftime('%Y-%m-%d %H:%M:%S'),
+            'end_time': self.stats['end_time'].strftime('%Y-%m-%d %H:%M:%S'),
+            'counters': self.counters(),
+            'api_metrics': self.stats['api_metrics'],
+            'report': "\n".join(self.session_table_lines()),
+        })
+
+    def close(self):
+        """Escribe los eventos pendientes y detiene el escritor de reportes."""
+        if self.report_writer is not None:
+            self.report_writer.close()
+
+    def session_table_lines(self) -> List[str]:
+        """Reporte de la sesión actual en formato de tabla, línea por línea."""
         if not self.stats.get('end_time'): self.end_session()
         duration = self.stats['end_time'] - self.stats['start_time']
-        timestamp = self.stats['start_time'].strftime("%Y%m%d_%H%M%S")
-        filename = f"reporte_sesion_{timestamp}.txt"
-        
         table = [
             "=" * 80,
             "📊 REPORTE DE SESIÓN - NOTION LINKER",
@@ -134,11 +405,22 @@ class ProcessingAnalyzer:
             "└─────────────────────────────────┴─────────────┘"
         ]
         
-        if self.stats['error_details']:
-            table.append("\n❌ ERRORES DETALLADOS EN ESTA SESIÓN:")
-            for error in self.stats['error_details']:
-                table.append(f"  • {error['person_name']}: {error['error']}")
+        table.extend(self._api_metrics_lines())
         
+        if self.recent_errors:
+            table.append("\n❌ ERRORES DETALLADOS EN ESTA SESIÓN:")
+            for person_name, error in self.recent_errors:
+                table.append(f"  • {person_name}: {error}")
+            if self.stats['errors'] > len(self.recent_errors):
+                table.append(f"  ... y {self.stats['errors'] - len(self.recent_errors)} más "
+                             f"(ver reporte_errores.csv o python report_store.py errors)")
+        return table
+
+    def save_session_table_report(self):
+        """Guarda un reporte de la sesión actual en formato de tabla en un archivo de texto."""
+        table = self.session_table_lines()
+        timestamp = self.stats['start_time'].strftime("%Y%m%d_%H%M%S")
+        filename = f"reporte_sesion_{timestamp}.txt"
         try:
             with open(filename, 'w', encoding='utf-8') as f:
                 f.write("\n".join(table))
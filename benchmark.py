@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Benchmark del Notion Linker contra una API de Notion simulada en proceso (fake_notion.py)
+Ejecutar con: python benchmark.py --help
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_notion import FakeNotionClient, synthetic_name
+from notion_service import NotionService
+
+def percentile(values: list, p: float) -> float:
+    """Percentil p (0-100) por el método del rango más cercano."""
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+class TimedNotionService(NotionService):
+    """NotionService que mide la latencia observada por el cliente (incluye rate limiting y reintentos)."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.call_latencies = []
+
+    def _retry_api_call(self, api_call, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super()._retry_api_call(api_call, *args, **kwargs)
+        finally:
+            self.call_latencies.append(time.perf_counter() - start)
+
+def build_fake(args) -> FakeNotionClient:
+    return FakeNotionClient(
+        contracts=args.contracts, persons=args.persons, latency=args.latency, jitter=args.jitter,
+        rate_limit_probability=args.rate_limit_probability, retry_after=args.retry_after,
+        server_requests_per_second=args.server_rps,
+    )
+
+def summarize(label: str, items: int, elapsed: float, fake: FakeNotionClient, client_latencies: list) -> dict:
+    return {
+        'benchmark': label,
+        'items': items,
+        'elapsed_seconds': round(elapsed, 3),
+        'items_per_second': round(items / elapsed, 2) if elapsed else 0.0,
+        'api_calls': fake.total_calls,
+        'api_calls_per_item': round(fake.total_calls / items, 3) if items else 0.0,
+        'calls_by_endpoint': dict(fake.calls),
+        'throttled_429': fake.throttled,
+        'server_latency_p50_ms': round(percentile(fake.latencies, 50) * 1000, 3),
+        'server_latency_p99_ms': round(percentile(fake.latencies, 99) * 1000, 3),
+        'client_latency_p50_ms': round(percentile(client_latencies, 50) * 1000, 3),
+        'client_latency_p99_ms': round(percentile(client_latencies, 99) * 1000, 3),
+    }
+
+def bench_service(args) -> dict:
+    """Mide NotionService directamente: búsquedas, creaciones y enlaces en proporción 2:1:2."""
+    fake = build_fake(args)
+    notion = TimedNotionService(contract_relation_prop="PERSONAS", requests_per_second=args.rps, burst=args.burst,
+                                max_concurrency=args.concurrency, adaptive_rate=args.adaptive,
+                                max_requests_per_second=args.max_rps, client=fake)
+    operations = args.operations
+
+    def operation(k):
+        name = synthetic_name(k % fake.person_pool)
+        page = notion.find_person_by_name("personas", "NOMBRE", name)
+        if page is None:
+            page = notion.create_person("personas", "NOMBRE", name, f"bench{k}@example.cl", "F")
+        if page:
+            notion.link_person_to_contract(f"c-{k % fake.contracts:08d}", page["id"])
+
+    start = time.perf_counter()
+    notion.run_concurrently(operation, range(operations))
+    return summarize("NotionService", operations, time.perf_counter() - start, fake, notion.call_latencies)
+
+def bench_main(args) -> dict:
+    """Ejecuta main() completo contra el fake en un directorio temporal."""
+    fake = build_fake(args)
+    services = []
+    workdir = tempfile.mkdtemp(prefix="notion_linker_bench_")
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    os.environ.update({"NOTION_API_KEY": "bench", "CONTRATOS_DB_ID": "contratos", "PERSONAS_DB_ID": "personas"})
+    try:
+        import main
+        logging.getLogger(main.__name__).setLevel(logging.WARNING)
+
+        def service_factory(**kwargs):
+            service = TimedNotionService(client=fake, **kwargs)
+            services.append(service)
+            return service
+
+        overrides = {
+            'NotionService': service_factory,
+            'REQUESTS_PER_SECOND': args.rps,
+            'RATE_LIMIT_BURST': args.burst,
+            'MAX_CONCURRENCY': args.concurrency,
+            'ADAPTIVE_RATE_LIMIT': args.adaptive,
+            'MAX_REQUESTS_PER_SECOND': args.max_rps,
+            'STREAM_ALL_CONTRACTS': not args.batch,
+            'BATCH_SIZE': args.batch or main.BATCH_SIZE,
+            'PRELOAD_PERSON_INDEX': args.preload_index,
+        }
+        originals = {name: getattr(main, name) for name in overrides}
+        for name, value in overrides.items():
+            setattr(main, name, value)
+        try:
+            start = time.perf_counter()
+            main.main()
+            elapsed = time.perf_counter() - start
+        finally:
+            for name, value in originals.items():
+                setattr(main, name, value)
+    finally:
+        os.chdir(previous_cwd)
+    processed = len(fake.linked)
+    latencies = [latency for service in services for latency in service.call_latencies]
+    result = summarize("main()", processed, elapsed, fake, latencies)
+    result['workdir'] = workdir
+    return result
+
+def bench_normalize(args) -> dict:
+    """Compara la normalización contrato por contrato con la de main.extract_contract_columns (solo CPU)."""
+    import timeit
+    import main
+    fake = FakeNotionClient(contracts=args.contracts, persons=args.persons)
+    pages = [fake.contract_page(i) for i in range(args.contracts)]
+    for page in pages[::10]:
+        # Una parte de los nombres con tildes, espacios y minúsculas, como en una BD real
+        texts = page["properties"][main.CONTRATO_NOMBRE_PROP]["rich_text"]
+        texts[0]["plain_text"] = f"  {texts[0]['plain_text'].lower()} Núñez "
+
+    def per_item():
+        return [(contract["id"], main.clean_name(main.extract_property_value(contract["properties"], main.CONTRATO_NOMBRE_PROP)),
+                 main.extract_property_value(contract["properties"], main.CONTRATO_CORREO_PROP).strip(),
+                 main.extract_property_value(contract["properties"], main.CONTRATO_SEXO_PROP)) for contract in pages]
+
+    def batch():
+        return [row for chunk in range(0, len(pages), 100)
+                for row in zip(*main.extract_contract_columns(pages[chunk:chunk + 100]))]
+
+    if per_item() != batch():
+        raise AssertionError("La normalización por columnas no coincide con la función por contrato.")
+    per_item_s = min(timeit.repeat(per_item, number=1, repeat=7))
+    batch_s = min(timeit.repeat(batch, number=1, repeat=7))
+    return {
+        'benchmark': "normalización (CPU)",
+        'items': len(pages),
+        'per_item_seconds': round(per_item_s, 4),
+        'batch_seconds': round(batch_s, 4),
+        'per_item_us_per_contract': round(per_item_s / len(pages) * 1e6, 3),
+        'batch_us_per_contract': round(batch_s / len(pages) * 1e6, 3),
+        'speedup': round(per_item_s / batch_s, 2) if batch_s else 0.0,
+    }
+
+# Proceso hijo del benchmark de arranque: importa main y ejecuta main() una vez, sin nada que enlazar
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {repo!r})
+import main
+imported = time.perf_counter()
+main.SNAPSHOT_FILE = "notion_snapshot.db"
+if not {local_check}: main.nothing_to_link = lambda *args: False
+main.main()
+print(json.dumps({{'import': imported - started, 'main': time.perf_counter() - imported,
+                  'notion_client': 'notion_client' in sys.modules}}))
+"""
+
+def bench_startup(args) -> dict:
+    """Arranque en frío de main.py cuando no hay contratos sin enlace (un proceso nuevo por ejecución).
+
+    Compara el intérprete vacío, una ejecución que crea el servicio de Notion para consultar
+    (sin la comprobación local) y la que responde desde el snapshot antes de cargar nada.
+    """
+    from snapshot_store import SnapshotStore
+    import main
+    fake = FakeNotionClient(contracts=args.contracts, persons=0)
+    fake.linked.update((i, ["persona"]) for i in range(args.contracts))
+    workdir = tempfile.mkdtemp(prefix="notion_linker_startup_")
+    store = SnapshotStore(os.path.join(workdir, "notion_snapshot.db"))
+    try:
+        store.import_database("contratos", (fake.contract_page(i) for i in range(args.contracts)),
+                              [main.CONTRATO_NOMBRE_PROP, main.CONTRATO_RELACION_PROP],
+                              relation_prop=main.CONTRATO_RELACION_PROP)
+    finally:
+        store.close()
+    env = dict(os.environ, NOTION_API_KEY="bench", CONTRATOS_DB_ID="contratos", PERSONAS_DB_ID="personas")
+    repo = os.path.dirname(os.path.abspath(__file__))
+
+    def measure(script: str) -> dict:
+        walls, runs = [], []
+        for _ in range(args.startup_runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", script], cwd=workdir, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            walls.append(time.perf_counter() - start)
+            if output.strip(): runs.append(json.loads(output.strip().splitlines()[-1]))
+        result = {'wall_ms': round(statistics.median(walls) * 1000, 1)}
+        if runs:
+            result.update(import_ms=round(statistics.median(run['import'] for run in runs) * 1000, 1),
+                          main_ms=round(statistics.median(run['main'] for run in runs) * 1000, 1),
+                          notion_client=runs[0]['notion_client'])
+        return result
+
+    return {
+        'benchmark': "arranque sin trabajo",
+        'runs': args.startup_runs,
+        'interpreter': measure("pass"),
+        'without_local_check': measure(STARTUP_SCRIPT.format(repo=repo, local_check=False)),
+        'with_local_check': measure(STARTUP_SCRIPT.format(repo=repo, local_check=True)),
+        'workdir': workdir,
+    }
+
+def print_result(result: dict):
+    if 'speedup' in result:
+        print_cpu_result(result)
+        return
+    if 'interpreter' in result:
+        print_startup_result(result)
+        return
+    print("\n" + "=" * 60)
+    print(f"⏱️  BENCHMARK: {result['benchmark']}")
+    print("=" * 60)
+    print(f"📈 Procesados: {result['items']} en {result['elapsed_seconds']}s "
+          f"({result['items_per_second']}/s)")
+    print(f"📡 Llamadas API: {result['api_calls']} ({result['api_calls_per_item']} por ítem) {result['calls_by_endpoint']}")
+    print(f"🚦 Respuestas 429: {result['throttled_429']}")
+    print(f"🌐 Latencia servidor p50/p99: {result['server_latency_p50_ms']} / {result['server_latency_p99_ms']} ms")
+    print(f"🧑‍💻 Latencia cliente p50/p99: {result['client_latency_p50_ms']} / {result['client_latency_p99_ms']} ms")
+    print("=" * 60)
+
+def print_cpu_result(result: dict):
+    print("\n" + "=" * 60)
+    print(f"⏱️  BENCHMARK: {result['benchmark']}")
+    print("=" * 60)
+    print(f"📈 Contratos: {result['items']}")
+    print(f"🐢 Por contrato: {result['per_item_seconds']}s ({result['per_item_us_per_contract']} µs/contrato)")
+    print(f"🚀 Por columnas: {result['batch_seconds']}s ({result['batch_us_per_contract']} µs/contrato)")
+    print(f"⚡ Aceleración: x{result['speedup']}")
+    print("=" * 60)
+
+def print_startup_result(result: dict):
+    print("\n" + "=" * 60)
+    print(f"⏱️  BENCHMARK: {result['benchmark']} (mediana de {result['runs']} procesos)")
+    print("=" * 60)
+    print(f"🐍 Intérprete vacío: {result['interpreter']['wall_ms']} ms")
+    for label, key in (("Sin comprobación local", 'without_local_check'), ("Con comprobación local", 'with_local_check')):
+        run = result[key]
+        print(f"🚀 {label}: {run['wall_ms']} ms (import {run['import_ms']} ms + main() {run['main_ms']} ms, "
+              f"notion_client {'cargado' if run['notion_client'] else 'sin cargar'})")
+    print("=" * 60)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del Notion Linker contra una API simulada.")
+    parser.add_argument("--mode", choices=["main", "service", "normalize", "startup", "all"], default="all")
+    parser.add_argument("--contracts", type=int, default=10000, help="Contratos en la BD simulada")
+    parser.add_argument("--persons", type=int, default=10000, help="Personas existentes en la BD simulada")
+    parser.add_argument("--operations", type=int, default=2000, help="Operaciones del benchmark de NotionService")
+    parser.add_argument("--latency", type=float, default=0.005, help="Latencia simulada por llamada (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Variación uniforme de la latencia (s)")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="Probabilidad de inyectar un 429")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After de los 429 simulados (s)")
+    parser.add_argument("--server-rps", type=float, default=None, help="Rate limit del servidor simulado")
+    parser.add_argument("--rps", type=float, default=1000.0, help="REQUESTS_PER_SECOND del cliente")
+    parser.add_argument("--max-rps", type=float, default=None, help="Techo del rate adaptativo")
+    parser.add_argument("--burst", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=3)
+    parser.add_argument("--adaptive", action="store_true", help="Activa el rate adaptativo")
+    parser.add_argument("--batch", type=int, default=0, help="Procesa un solo lote de este tamaño en vez de toda la BD")
+    parser.add_argument("--preload-index", action="store_true", help="Activa PRELOAD_PERSON_INDEX")
+    parser.add_argument("--startup-runs", type=int, default=10, help="Procesos por variante del benchmark de arranque")
+    parser.add_argument("--json", help="Guarda los resultados en este archivo JSON")
+    return parser.parse_args(argv)
+
+def run_benchmarks(argv=None) -> list:
+    args = parse_args(argv)
+    logging.getLogger("notion_service").setLevel(logging.ERROR)
+    results = []
+    if args.mode in ("service", "all"):
+        results.append(bench_service(args))
+    if args.mode in ("main", "all"):
+        results.append(bench_main(args))
+    if args.mode in ("normalize", "all"):
+        results.append(bench_normalize(args))
+    if args.mode in ("startup", "all"):
+        results.append(bench_startup(args))
+    for result in results:
+        print_result(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados guardados en: {args.json}")
+    return results
+
+if __name__ == "__main__":
+    run_benchmarks()
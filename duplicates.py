@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Detección de personas duplicadas y plan de fusión sobre la BD de Personas.
+Generar el plan: python duplicates.py --output merge_plan.jsonl
+Aplicarlo:       python duplicates.py --apply merge_plan.jsonl
+"""
+
+import json
+import logging
+import os
+from collections import Counter
+
+from person_index import match_key
+from write_planner import PERSON_FIELDS, person_properties, resolve_value
+
+logger = logging.getLogger(__name__)
+
+class DisjointSet:
+    """Unión-búsqueda sobre índices 0..n-1 (compresión de caminos y unión por tamaño)."""
+
+    def __init__(self):
+        self.parent = []
+        self.size = []
+
+    def add(self) -> int:
+        self.parent.append(len(self.parent))
+        self.size.append(1)
+        return len(self.parent) - 1
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a == b: return
+        if self.size[a] < self.size[b]: a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+
+def _field_values(records: list, members: list, field: str) -> set:
+    """Valores no vacíos de un campo (sin distinguir mayúsculas) entre las personas indicadas."""
+    return {(records[i].get(field) or "").strip().lower() for i in members} - {""}
+
+def find_duplicate_groups(persons):
+    """Agrupa personas duplicadas en una sola pasada, con tablas hash en vez de comparar pares.
+
+    `persons` es un iterable de {'id', 'name', 'correo', 'sexo', 'created_time'}. Dos personas
+    son la misma si comparten la clave de nombre normalizada (`match_key`, que respeta el orden
+    de las palabras) y no tienen correos ni sexos distintos. Los nombres iguales con correo o
+    sexo distinto (homónimos) y los correos iguales con nombres distintos (p. ej. un correo
+    familiar compartido) no se fusionan: se devuelven aparte para revisión manual.
+    Devuelve (grupos, conflictos), ambos listas de listas de personas.
+    """
+    records, keys, sets = [], [], DisjointSet()
+    by_email, by_name = {}, {}
+    for person in persons:
+        i = sets.add()
+        records.append(person)
+        email = (person.get('correo') or "").strip().lower()
+        if email:
+            by_email.setdefault(email, []).append(i)
+        key = match_key(person.get('name', ""))
+        keys.append(key)
+        if key:
+            by_name.setdefault(key, []).append(i)
+    conflicts = []
+    for members in by_email.values():
+        if len(members) < 2: continue
+        if len({keys[i] for i in members}) > 1 or len(_field_values(records, members, 'sexo')) > 1:
+            conflicts.append([records[i] for i in members])
+            continue
+        for i in members[1:]:
+            sets.union(members[0], i)
+    for members in by_name.values():
+        if len(members) < 2: continue
+        if len(_field_values(records, members, 'correo')) > 1 or len(_field_values(records, members, 'sexo')) > 1:
+            conflicts.append([records[i] for i in members])
+            continue
+        for i in members[1:]:
+            sets.union(members[0], i)
+    groups = {}
+    for i, person in enumerate(records):
+        groups.setdefault(sets.find(i), []).append(person)
+    return [group for group in groups.values() if len(group) > 1], conflicts
+
+def conflict_reason(group: list) -> str:
+    """Describe por qué un grupo de `find_duplicate_groups` quedó sin fusionar."""
+    members = range(len(group))
+    if len({match_key(person.get('name', "")) for person in group}) > 1:
+        return f"Mismo correo con nombres distintos ({_field_values(group, members, 'correo').pop()})"
+    if len(_field_values(group, members, 'correo')) > 1:
+        return f"Homónimos con correos distintos ({group[0]['name']})"
+    return f"Homónimos con sexo distinto ({group[0]['name']})"
+
+def choose_canonical(group: list) -> dict:
+    """Elige la persona que se conserva: la más completa (correo/sexo) y, a igualdad, la más antigua."""
+    return min(group, key=lambda p: (-sum(1 for field in PERSON_FIELDS if p.get(field)),
+                                     p.get('created_time') or "", p['id']))
+
+def build_merge_plan(groups: list, contracts, relation_prop: str) -> list:
+    """Calcula las operaciones de fusión: duplicados, campos a completar en la canónica y reenlaces.
+
+    `contracts` se recorre una sola vez (basta con los que tienen la relación no vacía);
+    cada contrato que apunta a un duplicado queda en el plan con los duplicados que tiene.
+    La relación no se guarda: se vuelve a leer al aplicar el plan.
+    """
+    operations, replacement = [], {}
+    for group in groups:
+        canonical = choose_canonical(group)
+        duplicates = [person for person in group if person['id'] != canonical['id']]
+        for person in duplicates:
+            replacement[person['id']] = canonical['id']
+            operations.append({'op': 'duplicate', 'page_id': person['id'], 'name': person['name'],
+                               'canonical_id': canonical['id'], 'canonical_name': canonical['name']})
+        fill = {field: resolve_value(Counter(p[field] for p in duplicates if p.get(field)))
+                for field in PERSON_FIELDS if not canonical.get(field)}
+        if any(fill.values()):
+            operations.append({'op': 'update', 'page_id': canonical['id'], 'name': canonical['name'],
+                               **{field: fill.get(field, "") for field in PERSON_FIELDS}})
+    for contract in contracts:
+        relation = contract.get("properties", {}).get(relation_prop, {}).get("relation") or []
+        ids = [item["id"] for item in relation]
+        replaced = [page_id for page_id in ids if page_id in replacement]
+        if replaced:
+            operations.append({'op': 'relink', 'contract_id': contract["id"], 'replaced': replaced})
+    return operations
+
+def write_merge_plan(path: str, operations: list) -> Counter:
+    """Escribe el plan como JSONL de forma atómica; devuelve la cantidad de operaciones por tipo."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for operation in operations:
+            f.write(json.dumps(operation, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+    return Counter(operation['op'] for operation in operations)
+
+def apply_merge_plan(notion, path: str, batch_size: int = 100) -> Counter:
+    """Ejecuta un plan de fusión: completa las personas canónicas y reenlaza los contratos en lotes.
+
+    Cada reenlace lee la relación actual del contrato y solo cambia los duplicados por su
+    persona canónica: se conservan los enlaces agregados después de generar el plan y volver
+    a aplicarlo tras una interrupción no escribe los contratos ya reenlazados. Los duplicados
+    no se archivan: quedan sin contratos y listados en el plan para borrarlos a mano.
+    """
+    with open(path, encoding='utf-8') as f:
+        operations = [json.loads(line) for line in f if line.strip()]
+    results = Counter()
+    updates = [op for op in operations if op['op'] == 'update']
+    for ok in notion.run_concurrently(
+            lambda op: notion.update_person_properties(op['page_id'], person_properties(op['correo'], op['sexo'])),
+            updates):
+        results['update_ok' if ok else 'update_failed'] += 1
+    replacement = {op['page_id']: op['canonical_id'] for op in operations if op['op'] == 'duplicate'}
+    relinks = [op for op in operations if op['op'] == 'relink']
+    for start in range(0, len(relinks), batch_size):
+        batch = relinks[start:start + batch_size]
+        for ok in notion.run_concurrently(
+                lambda op: notion.replace_contract_relations(op['contract_id'], replacement), batch):
+            results['relink_ok' if ok else 'relink_failed'] += 1
+        logger.info(f"🔗 Reenlazados {min(start + batch_size, len(relinks))}/{len(relinks)} contratos.")
+    return results
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Detecta personas duplicadas y reenlaza sus contratos.")
+    parser.add_argument("--output", default="merge_plan.jsonl", help="Archivo JSONL donde se guarda el plan")
+    parser.add_argument("--apply", metavar="PLAN", help="Aplica un plan generado previamente")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    import main
+    args = parse_args()
+    snapshot = main.SnapshotStore(main.SNAPSHOT_FILE) if main.SNAPSHOT_FILE else None
+    notion = main.build_notion_service(snapshot)
+    try:
+        if args.apply:
+            print(dict(apply_merge_plan(notion, args.apply, main.WRITE_BATCH_SIZE)))
+        else:
+            main.plan_person_merges(notion, os.getenv("CONTRATOS_DB_ID"), os.getenv("PERSONAS_DB_ID"), args.output)
+    finally:
+        if snapshot is not None: snapshot.close()
@@ -0,0 +1,395 @@
+import bisect
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from notion_client import APIResponseError
+
+# Vocabulario para nombres sintéticos: 40 * 40 * 60 * 60 = 5.76M combinaciones distintas
+FIRST_NAMES = [
+    "JUAN", "MARIA", "JOSE", "ANA", "LUIS", "CARMEN", "PEDRO", "CAMILA", "DIEGO", "VALENTINA",
+    "JORGE", "FRANCISCA", "CARLOS", "CONSTANZA", "MIGUEL", "JAVIERA", "ANDRES", "CATALINA", "PABLO", "FERNANDA",
+    "RODRIGO", "DANIELA", "FELIPE", "PAULA", "CRISTIAN", "MACARENA", "SEBASTIAN", "CAROLINA", "MATIAS", "ISIDORA",
+    "NICOLAS", "BARBARA", "TOMAS", "JOSEFA", "IGNACIO", "ANTONIA", "GONZALO", "BEATRIZ", "HERIBERTO", "MARCELA",
+]
+SECOND_NAMES = [
+    "ANDRES", "ELIZABETH", "ALEJANDRO", "ISABEL", "ANTONIO", "PAZ", "IGNACIO", "SOLEDAD", "ESTEBAN", "BELEN",
+    "RAFAEL", "VICTORIA", "EDUARDO", "ALEJANDRA", "MANUEL", "ROCIO", "SALVADOR", "INES", "ENRIQUE", "LORETO",
+    "ARTURO", "PILAR", "ALBERTO", "TERESA", "RICARDO", "AMPARO", "OSCAR", "GLORIA", "RAUL", "CECILIA",
+    "HUGO", "VERONICA", "MARIO", "LUCIA", "SERGIO", "MONICA", "VICENTE", "ROSA", "ERNESTO", "JULIA",
+]
+LAST_NAMES = [
+    "GONZALEZ", "MUNOZ", "ROJAS", "DIAZ", "PEREZ", "SOTO", "CONTRERAS", "SILVA", "MARTINEZ", "SEPULVEDA",
+    "MORALES", "RODRIGUEZ", "LOPEZ", "FUENTES", "HERNANDEZ", "TORRES", "ARAYA", "FLORES", "ESPINOZA", "VALENZUELA",
+    "CASTILLO", "TAPIA", "REYES", "GUTIERREZ", "CASTRO", "PIZARRO", "ALVAREZ", "VASQUEZ", "SANCHEZ", "FERNANDEZ",
+    "RAMIREZ", "CARRASCO", "GOMEZ", "CORTES", "HERRERA", "NUNEZ", "JARA", "VERGARA", "RIVERA", "FIGUEROA",
+    "SALINAS", "SALVATICI", "SALUM", "SALORT", "SALVADOR", "TURCHAN", "MUSTAFA", "GUTMANN", "BIZAMA", "SANTELICES",
+    "BRAVO", "MIRANDA", "VERA", "MOLINA", "VEGA", "CAMPOS", "SAAVEDRA", "OLIVARES", "ORELLANA", "ZUNIGA",
+]
+RADICES = (len(FIRST_NAMES), len(SECOND_NAMES), len(LAST_NAMES), len(LAST_NAMES))
+VOCABULARY = (FIRST_NAMES, SECOND_NAMES, LAST_NAMES, LAST_NAMES)
+WORD_INDEX = tuple({word: i for i, word in enumerate(words)} for words in VOCABULARY)
+BASE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+RELATION_INLINE_LIMIT = 25  # Relaciones que Notion incluye en una página; el resto va por pages.properties.retrieve
+
+def synthetic_name(j: int) -> str:
+    """Nombre determinista para el índice j (codificación en base mixta)."""
+    words = []
+    for radix, vocabulary in zip(RADICES, VOCABULARY):
+        words.append(vocabulary[j % radix])
+        j //= radix
+    return " ".join(words)
+
+def synthetic_index(name: str):
+    """Inverso de `synthetic_name`; devuelve None si el nombre no es sintético."""
+    words = name.split(" ")
+    if len(words) != 4: return None
+    j, multiplier = 0, 1
+    for word, radix, index in zip(words, RADICES, WORD_INDEX):
+        if word not in index: return None
+        j += index[word] * multiplier
+        multiplier *= radix
+    return j
+
+def notion_time(offset_seconds: float) -> str:
+    return (BASE_TIME + timedelta(seconds=offset_seconds)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+def api_error(status: int, code: str, message: str, headers: dict = None) -> APIResponseError:
+    """Construye un APIResponseError compatible con las distintas versiones de notion-client."""
+    headers = httpx.Headers(headers or {})
+    try:
+        return APIResponseError(code, status, message, headers, "")
+    except TypeError:
+        response = httpx.Response(status, headers=headers, request=httpx.Request("POST", "https://api.notion.com"))
+        return APIResponseError(response, message, code)
+
+class _Endpoint:
+    def __init__(self, fake):
+        self.fake = fake
+
+class _Databases(_Endpoint):
+    def query(self, database_id, filter=None, sorts=None, start_cursor=None, page_size=100):
+        return self.fake.call("databases.query", self.fake.query, database_id, filter, start_cursor, page_size, sorts)
+
+    def retrieve(self, database_id):
+        return self.fake.call("databases.retrieve", self.fake.retrieve, database_id)
+
+class _PagesProperties(_Endpoint):
+    def retrieve(self, page_id, property_id, start_cursor=None, page_size=None):
+        return self.fake.call("pages.properties.retrieve", self.fake.relation_items, page_id, property_id,
+                              start_cursor, page_size)
+
+class _Pages(_Endpoint):
+    def __init__(self, fake):
+        super().__init__(fake)
+        self.properties = _PagesProperties(fake)
+
+    def retrieve(self, page_id):
+        return self.fake.call("pages.retrieve", self.fake.retrieve_page, page_id)
+
+    def create(self, parent, properties):
+        return self.fake.call("pages.create", self.fake.create_page, parent["database_id"], properties)
+
+    def update(self, page_id, properties):
+        return self.fake.call("pages.update", self.fake.update_page, page_id, properties)
+
+class FakeNotionClient:
+    """Doble en proceso de la API de Notion (databases.query/retrieve, pages.retrieve/create/update,
+    pages.properties.retrieve para relaciones).
+
+    Genera bajo demanda una BD de Contratos y otra de Personas de cualquier tamaño: los
+    nombres se derivan del índice de cada página, así que 1M de contratos no ocupa 1M de
+    diccionarios. Se puede simular latencia por llamada, inyectar 429 con probabilidad
+    fija y/o aplicar un rate limit del lado del "servidor".
+    """
+
+    def __init__(self, contracts: int = 10000, persons: int = 10000, new_person_ratio: float = 0.1,
+                 latency: float = 0.0, jitter: float = 0.0, rate_limit_probability: float = 0.0,
+                 server_requests_per_second: float = None, retry_after: float = 1.0, seed: int = 7,
+                 contratos_db_id: str = "contratos", personas_db_id: str = "personas",
+                 relation_prop: str = "PERSONAS", contract_name_prop: str = "NOMBRE ORDENADO",
+                 person_name_prop: str = "NOMBRE"):
+        self.contracts = contracts
+        self.persons = persons
+        self.person_pool = max(1, int(persons * (1 + new_person_ratio)))
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_probability = rate_limit_probability
+        self.server_requests_per_second = server_requests_per_second
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.contratos_db_id = contratos_db_id
+        self.personas_db_id = personas_db_id
+        self.relation_prop = relation_prop
+        self.contract_name_prop = contract_name_prop
+        self.person_name_prop = person_name_prop
+        self.lock = threading.Lock()
+        self.linked = {}            # índice de contrato -> [person page_id]
+        self.contract_edits = {}    # índice de contrato -> last_edited_time
+        self.edit_log = []          # (last_edited_time, índice) de cada edición, ordenado (puede tener obsoletas)
+        self.person_overrides = {}  # page_id -> {'correo', 'sexo', 'last_edited_time'}
+        self.created = {}           # nombre -> page_id de personas creadas
+        self.created_order = []
+        self.deleted = set()
+        self.calls = {}
+        self.latencies = []
+        self.throttled = 0
+        self.server_allowance = server_requests_per_second or 0
+        self.server_last_check = time.monotonic()
+        self.databases = _Databases(self)
+        self.pages = _Pages(self)
+
+    # --- Infraestructura de llamadas ---
+    def call(self, endpoint: str, handler, *args):
+        """Aplica latencia y 429 simulados, ejecuta el handler y registra métricas."""
+        start = time.perf_counter()
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            throttled = self._server_throttled() or (
+                self.rate_limit_probability and self.random.random() < self.rate_limit_probability)
+            delay = self.latency + (self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            if throttled:
+                with self.lock: self.throttled += 1
+                raise api_error(429, "rate_limited", "Rate limited", {"Retry-After": str(self.retry_after)})
+            with self.lock:
+                return handler(*args)
+        finally:
+            with self.lock:
+                self.latencies.append(time.perf_counter() - start)
+
+    def _server_throttled(self) -> bool:
+        """Token bucket del lado del servidor (ráfaga de 1 segundo de capacidad)."""
+        if not self.server_requests_per_second: return False
+        now = time.monotonic()
+        rate = self.server_requests_per_second
+        self.server_allowance = min(rate, self.server_allowance + (now - self.server_last_check) * rate)
+        self.server_last_check = now
+        if self.server_allowance < 1: return True
+        self.server_allowance -= 1
+        return False
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset_metrics(self):
+        with self.lock:
+            self.calls, self.latencies, self.throttled = {}, [], 0
+
+    # --- Datos sintéticos ---
+    def contract_person_index(self, i: int) -> int:
+        return (i * 2654435761 + 12345) % self.person_pool
+
+    def contract_page(self, i: int) -> dict:
+        j = self.contract_person_index(i)
+        relation = self.linked.get(i, [])
+        correo = "" if i % 4 == 0 else f"persona{j}@example.cl"
+        sexo = "" if i % 5 == 0 else ("F" if j % 2 else "M")
+        return {
+            "object": "page", "id": f"c-{i:08d}",
+            "last_edited_time": self.contract_edits.get(i, notion_time(i)),
+            "properties": {
+                self.contract_name_prop: {"type": "rich_text", "rich_text": [{"plain_text": synthetic_name(j)}]},
+                "CORREO": {"type": "email", "email": correo or None},
+                "SEXO": {"type": "select", "select": {"name": sexo} if sexo else None},
+                self.relation_prop: {"id": self.relation_prop, "type": "relation",
+                                     "has_more": len(relation) > RELATION_INLINE_LIMIT,
+                                     "relation": [{"id": pid} for pid in relation[:RELATION_INLINE_LIMIT]]},
+            },
+        }
+
+    def person_page(self, page_id: str, name: str, correo: str = "", sexo: str = "", edited: str = None) -> dict:
+        override = self.person_overrides.get(page_id, {})
+        correo, sexo = override.get('correo', correo), override.get('sexo', sexo)
+        return {
+            "object": "page", "id": page_id,
+            "last_edited_time": override.get('last_edited_time', edited or notion_time(0)),
+            "properties": {
+                self.person_name_prop: {"type": "title", "title": [{"plain_text": name}]},
+                "CORREO": {"type": "email", "email": correo or None},
+                "SEXO": {"type": "select", "select": {"name": sexo} if sexo else None},
+            },
+        }
+
+    def existing_person_page(self, j: int) -> dict:
+        correo = "" if j % 3 == 0 else f"persona{j}@example.cl"
+        sexo = "" if j % 4 == 0 else ("F" if j % 2 else "M")
+        return self.person_page(f"p-{j:08d}", synthetic_name(j), correo, sexo)
+
+    def person_by_name(self, name: str):
+        j = synthetic_index(name)
+        if j is not None and j < self.persons and f"p-{j:08d}" not in self.deleted:
+            return self.existing_person_page(j)
+        page_id = self.created.get(name)
+        if page_id and page_id not in self.deleted:
+            return self.person_page(page_id, name)
+        return None
+
+    # --- Handlers de endpoints ---
+    def edit_contract(self, i: int, edited: str):
+        """Cambia el last_edited_time de un contrato (lo llama update_page; el llamador tiene el lock)."""
+        if self.contract_edits.get(i) == edited: return
+        self.contract_edits[i] = edited
+        bisect.insort(self.edit_log, (edited, i))
+
+    def query(self, database_id, filter, start_cursor, page_size, sorts=None):
+        page_size = min(page_size or 100, 100)
+        if database_id == self.contratos_db_id and sorts == [{"timestamp": "last_edited_time", "direction": "ascending"}]:
+            return self.query_contracts_by_edited(filter, start_cursor, page_size)
+        if database_id == self.personas_db_id and filter and "title" in filter:
+            page = self.person_by_name(filter["title"]["equals"])
+            return {"object": "list", "results": [page] if page else [], "has_more": False, "next_cursor": None}
+        if database_id == self.personas_db_id:
+            total = self.persons + len(self.created_order)
+            make = lambda k: (self.existing_person_page(k) if k < self.persons
+                              else self.person_page(self.created_order[k - self.persons][1],
+                                                    self.created_order[k - self.persons][0]))
+        elif database_id == self.contratos_db_id:
+            total, make = self.contracts, self.contract_page
+        else:
+            raise api_error(404, "object_not_found", f"Could not find database with ID: {database_id}.")
+        results, k = [], int(start_cursor or 0)
+        while k < total and len(results) < page_size:
+            page = make(k)
+            if page["id"] not in self.deleted and self._matches(page, filter):
+                results.append(page)
+            k += 1
+        has_more = k < total
+        return {"object": "list", "results": results, "has_more": has_more, "next_cursor": str(k) if has_more else None}
+
+    @staticmethod
+    def _edited_floor(filter: dict) -> str:
+        """Cota `on_or_after` de last_edited_time de un filtro ("" si no tiene)."""
+        if not filter: return ""
+        if "and" in filter: return max((FakeNotionClient._edited_floor(f) for f in filter["and"]), default="")
+        if filter.get("timestamp") == "last_edited_time": return filter["last_edited_time"]["on_or_after"]
+        return ""
+
+    def query_contracts_by_edited(self, filter, start_cursor, page_size):
+        """Contratos ordenados por (last_edited_time, índice), con cursor por clave "fecha|índice".
+
+        Los contratos sin editar tienen last_edited_time = notion_time(i), creciente con el
+        índice, así que la consulta empieza por búsqueda binaria en la cota del filtro y se
+        mezcla con `edit_log` en vez de recorrer la BD desde el principio.
+        """
+        lower = (self._edited_floor(filter), -1)
+        if start_cursor:
+            edited, i = start_cursor.rsplit("|", 1)
+            lower = max(lower, (edited, int(i)))
+        u = bisect.bisect_right(range(self.contracts), lower, key=lambda k: (notion_time(k), k))
+        e = bisect.bisect_right(self.edit_log, lower)
+        results, last = [], None
+        while True:
+            while u < self.contracts and u in self.contract_edits: u += 1
+            while e < len(self.edit_log) and self.contract_edits.get(self.edit_log[e][1]) != self.edit_log[e][0]: e += 1
+            unedited = (notion_time(u), u) if u < self.contracts else None
+            if unedited is None and e >= len(self.edit_log): break
+            if len(results) >= page_size:
+                return {"object": "list", "results": results, "has_more": True, "next_cursor": f"{last[0]}|{last[1]}"}
+            if e < len(self.edit_log) and (unedited is None or self.edit_log[e] < unedited):
+                last, e = self.edit_log[e], e + 1
+            else:
+                last, u = unedited, u + 1
+            page = self.contract_page(last[1])
+            if page["id"] not in self.deleted and self._matches(page, filter):
+                results.append(page)
+        return {"object": "list", "results": results, "has_more": False, "next_cursor": None}
+
+    def _matches(self, page: dict, filter: dict) -> bool:
+        """Evalúa el subconjunto de filtros que usa el enlazador."""
+        if not filter: return True
+        if "and" in filter: return all(self._matches(page, f) for f in filter["and"])
+        if "or" in filter: return any(self._matches(page, f) for f in filter["or"])
+        if filter.get("timestamp") == "last_edited_time":
+            return page["last_edited_time"] >= filter["last_edited_time"]["on_or_after"]
+        prop = page["properties"].get(filter.get("property"), {})
+        if "relation" in filter:
+            return not prop.get("relation") if filter["relation"].get("is_empty") else bool(prop.get("relation"))
+        if "title" in filter:
+            return prop.get("title", [{}])[0].get("plain_text") == filter["title"]["equals"]
+        return True
+
+    def retrieve(self, database_id):
+        if database_id == self.contratos_db_id:
+            properties = {self.contract_name_prop: "rich_text", "CORREO": "email", "SEXO": "select",
+                          self.relation_prop: "relation"}
+        elif database_id == self.personas_db_id:
+            properties = {self.person_name_prop: "title", "CORREO": "email", "SEXO": "select"}
+        else:
+            raise api_error(404, "object_not_found", f"Could not find database with ID: {database_id}.")
+        return {"object": "database", "id": database_id, "last_edited_time": notion_time(0),
+                "properties": {name: {"id": name, "name": name, "type": kind} for name, kind in properties.items()}}
+
+    def retrieve_page(self, page_id):
+        """Página de un contrato o una persona, con su BD en `parent`."""
+        if page_id.startswith("c-") and int(page_id[2:]) < self.contracts and page_id not in self.deleted:
+            return {**self.contract_page(int(page_id[2:])), "parent": {"type": "database_id", "database_id": self.contratos_db_id}}
+        for name, created_id in self.created_order:
+            if created_id == page_id and page_id not in self.deleted:
+                return {**self.person_page(page_id, name), "parent": {"type": "database_id", "database_id": self.personas_db_id}}
+        if page_id.startswith("p-") and page_id[2:].isdigit() and int(page_id[2:]) < self.persons and page_id not in self.deleted:
+            return {**self.existing_person_page(int(page_id[2:])), "parent": {"type": "database_id", "database_id": self.personas_db_id}}
+        raise api_error(404, "object_not_found", f"Could not find page with ID: {page_id}.")
+
+    def relation_items(self, page_id, property_id, start_cursor, page_size):
+        """Relación completa de un contrato, paginada como pages.properties.retrieve."""
+        if not page_id.startswith("c-") or int(page_id[2:]) >= self.contracts or property_id != self.relation_prop:
+            raise api_error(404, "object_not_found", f"Could not find property {property_id} of page {page_id}.")
+        relation = self.linked.get(int(page_id[2:]), [])
+        start, page_size = int(start_cursor or 0), min(page_size or 25, 100)
+        end = min(start + page_size, len(relation))
+        has_more = end < len(relation)
+        return {"object": "list", "type": "property_item",
+                "results": [{"object": "property_item", "type": "relation", "relation": {"id": pid}}
+                            for pid in relation[start:end]],
+                "has_more": has_more, "next_cursor": str(end) if has_more else None}
+
+    def create_page(self, database_id, properties):
+        name = properties[self.person_name_prop]["title"][0]["text"]["content"]
+        page_id = f"p-new-{len(self.created_order):08d}"
+        self.created[name] = page_id
+        self.created_order.append((name, page_id))
+        self.person_overrides[page_id] = {
+            'correo': (properties.get("CORREO") or {}).get("email") or "",
+            'sexo': ((properties.get("SEXO") or {}).get("select") or {}).get("name", ""),
+            'last_edited_time': datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        }
+        return self.person_page(page_id, name)
+
+    def update_page(self, page_id, properties):
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        if page_id.startswith("c-"):
+            i = int(page_id[2:])
+            if i >= self.contracts: raise api_error(404, "object_not_found", f"Could not find page {page_id}.")
+            relation = properties.get(self.relation_prop, {}).get("relation")
+            if relation is not None:
+                for item in relation:
+                    if self.person_exists(item["id"]) is False:
+                        raise api_error(400, "validation_error", f"Relation page {item['id']} does not exist.")
+                self.linked[i] = [item["id"] for item in relation]
+            self.edit_contract(i, now)
+            return self.contract_page(i)
+        if not self.person_exists(page_id):
+            raise api_error(404, "object_not_found", f"Could not find page with ID: {page_id}.")
+        override = self.person_overrides.setdefault(page_id, {})
+        if "CORREO" in properties:
+            override['correo'] = properties["CORREO"].get("email") or ""
+        if "SEXO" in properties:
+            override['sexo'] = (properties["SEXO"].get("select") or {}).get("name", "")
+        override['last_edited_time'] = now
+        return {"object": "page", "id": page_id}
+
+    def person_exists(self, page_id: str) -> bool:
+        if page_id in self.deleted: return False
+        if page_id.startswith("p-new-"): return int(page_id[6:]) < len(self.created_order)
+        return page_id.startswith("p-") and int(page_id[2:]) < self.persons
+
+    def delete_person(self, page_id: str):
+        """Simula el borrado manual de una persona (para probar cachés obsoletos)."""
+        with self.lock:
+            self.deleted.add(page_id)
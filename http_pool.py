@@ -0,0 +1,112 @@
+import importlib.util
+import threading
+
+import httpx
+from notion_client import Client
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None  # pip install httpx[http2]
+
+# Subrecursos con su propio Endpoint en notion_client: ApiMetrics los nombra por esa clase
+# (PagesPropertiesEndpoint.retrieve -> 'pagesproperties.retrieve'), no por el recurso padre
+SUB_ENDPOINTS = {("pages", "properties"): {"GET": "retrieve"},
+                 ("blocks", "children"): {"GET": "list", "PATCH": "append"}}
+
+def request_endpoint(method: str, path: str) -> str:
+    """Endpoint de una petición HTTP a la API con los mismos nombres que ApiMetrics, p. ej. 'pages.update'."""
+    parts = [part for part in path.split("/") if part and part != "v1"]
+    if not parts: return "unknown"
+    if len(parts) > 2 and (parts[0], parts[2]) in SUB_ENDPOINTS:
+        return f"{parts[0]}{parts[2]}.{SUB_ENDPOINTS[parts[0], parts[2]].get(method, method.lower())}"
+    resource = parts[0].replace("_", "")
+    if method == "POST":
+        action = parts[-1] if len(parts) > 2 else "create"
+    else:
+        action = {"GET": "retrieve" if len(parts) > 1 else "list", "PATCH": "update", "DELETE": "delete"}.get(method, method.lower())
+    return f"{resource}.{action}"
+
+class HttpConnectionPool:
+    """Pool de conexiones keep-alive compartido por los clientes de Notion de un proceso.
+
+    El pool vive en un único `httpx.HTTPTransport`: cada `notion_client.Client` creado con
+    `notion_client()` tiene su propio httpx.Client (cabeceras y token propios) pero reutiliza
+    las conexiones TLS abiertas. Usa HTTP/2 si `h2` está instalado. El timeout se fija por
+    endpoint en cada petición, y con la extensión `trace` de httpcore se cuentan las
+    conexiones nuevas frente a las reutilizadas.
+    """
+
+    def __init__(self, max_connections: int = 10, max_keepalive_connections: int = None,
+                 keepalive_expiry: float = 60.0, http2: bool = True, timeout: float = 60.0,
+                 endpoint_timeouts: dict = None, connect_timeout: float = 10.0, base_url: str = None):
+        self.http2 = bool(http2 and HTTP2_AVAILABLE)
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections or max_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        self.transport = httpx.HTTPTransport(http2=self.http2, limits=self.limits)
+        self.timeout = timeout
+        self.endpoint_timeouts = dict(endpoint_timeouts or {})
+        self.connect_timeout = connect_timeout
+        self.base_url = base_url
+        self.lock = threading.Lock()
+        self.clients = []
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = 0
+            self.connections_opened = 0
+            self.tls_handshakes = 0
+            self.http_versions = {}
+
+    def timeout_for(self, endpoint: str) -> httpx.Timeout:
+        """Timeout de lectura/escritura del endpoint (o el general) con un connect acotado."""
+        seconds = self.endpoint_timeouts.get(endpoint, self.timeout)
+        return httpx.Timeout(seconds, connect=min(seconds, self.connect_timeout))
+
+    def notion_client(self, auth: str = None) -> Client:
+        """Crea un Client de Notion que envía sus peticiones por el pool compartido."""
+        http_client = httpx.Client(transport=self.transport,
+                                   event_hooks={'request': [self._on_request], 'response': [self._on_response]})
+        options = {'auth': auth, 'timeout_ms': int(self.timeout * 1000)}
+        if self.base_url: options['base_url'] = self.base_url
+        self.clients.append(http_client)
+        return Client(options=options, client=http_client)
+
+    def _on_request(self, request: httpx.Request):
+        request.extensions["timeout"] = self.timeout_for(request_endpoint(request.method, request.url.path)).as_dict()
+        request.extensions["trace"] = self._trace
+
+    def _on_response(self, response: httpx.Response):
+        version = response.extensions.get("http_version", b"").decode("ascii", "replace") or "?"
+        with self.lock:
+            self.requests += 1
+            self.http_versions[version] = self.http_versions.get(version, 0) + 1
+
+    def _trace(self, event: str, info: dict):
+        """Callback de httpcore: cada connect_tcp/start_tls completo es una conexión (y un handshake) nueva."""
+        if event == "connection.connect_tcp.complete":
+            with self.lock: self.connections_opened += 1
+        elif event == "connection.start_tls.complete":
+            with self.lock: self.tls_handshakes += 1
+
+    def stats(self) -> dict:
+        """Uso del pool: peticiones, conexiones abiertas y proporción de peticiones que reutilizaron una conexión."""
+        with self.lock:
+            reused = max(0, self.requests - self.connections_opened)
+            return {
+                'requests': self.requests,
+                'connections_opened': self.connections_opened,
+                'tls_handshakes': self.tls_handshakes,
+                'reused_requests': reused,
+                'reuse_ratio': round(reused / self.requests, 3) if self.requests else 0.0,
+                'http_versions': dict(self.http_versions),
+                'http2': self.http2,
+                'max_connections': self.limits.max_connections,
+                'keepalive_expiry_s': self.limits.keepalive_expiry,
+            }
+
+    def close(self):
+        """Cierra las conexiones abiertas del pool."""
+        for http_client in self.clients:
+            http_client.close()
+        self.clients = []
+        self.transport.close()
@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+class WriteAheadJournal:
+    """Journal JSONL de operaciones planificadas y completadas (create, update, link).
+
+    Los registros se acumulan en memoria y se escriben con un único fsync por `flush()`.
+    Al abrirlo se reproduce el archivo existente: una ejecución reiniciada conoce los
+    page_id de las personas ya creadas y los contratos ya enlazados, y no repite esas
+    escrituras. Una ejecución completada vacía el journal con `checkpoint()`.
+    """
+
+    def __init__(self, path: str = "notion_linker.journal"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.created = {}          # nombre -> {'id', 'correo', 'sexo'}
+        self.updated = set()       # page_id
+        self.linked = {}           # contract_id -> {person page_id}
+        self.pending = set()       # (tipo, clave) planificadas sin confirmar
+        self._replay()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def _replay(self):
+        """Reconstruye el estado a partir de un journal previo (si existe)."""
+        if not os.path.isfile(self.path): return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Última línea truncada por una caída
+                self._apply(record)
+
+    def _apply(self, record: dict):
+        kind, key = record['kind'], record['key']
+        if record['op'] == 'plan':
+            self.pending.add((kind, key))
+            return
+        self.pending.discard((kind, key))
+        if kind == 'create':
+            self.created[key] = {'id': record['page_id'], 'correo': record.get('correo', ""), 'sexo': record.get('sexo', "")}
+        elif kind == 'update':
+            self.updated.add(key)
+        elif kind == 'link':
+            self.linked.setdefault(key, set()).add(record['page_id'])
+
+    def _record(self, op: str, kind: str, key: str, **data):
+        record = {'op': op, 'kind': kind, 'key': key, 'at': datetime.now().isoformat(timespec='seconds'), **data}
+        with self.lock:
+            self._apply(record)
+            self.buffer.append(json.dumps(record, ensure_ascii=False))
+
+    def plan(self, kind: str, key: str, **data):
+        """Registra una operación que se va a ejecutar."""
+        self._record('plan', kind, key, **data)
+
+    def complete(self, kind: str, key: str, **data):
+        """Registra una operación ejecutada con éxito."""
+        self._record('done', kind, key, **data)
+
+    def flush(self):
+        """Escribe en bloque los registros pendientes y fuerza su persistencia (fsync)."""
+        with self.lock:
+            if not self.buffer: return
+            self.file.write("\n".join(self.buffer) + "\n")
+            self.buffer = []
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def checkpoint(self):
+        """Vacía el journal tras una ejecución completa."""
+        with self.lock:
+            self.buffer = []
+            self.file.truncate(0)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.created, self.updated, self.linked, self.pending = {}, set(), {}, set()
+
+    def close(self):
+        self.flush()
+        self.file.close()
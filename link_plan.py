@@ -0,0 +1,54 @@
+import json
+import os
+from collections import Counter
+
+from write_planner import WritePlanner
+
+def write_link_plan(path: str, planner: WritePlanner, person_ids: dict) -> Counter:
+    """Escribe el plan como JSONL (creaciones, actualizaciones y enlaces, en ese orden).
+
+    Cada enlace lleva el nombre de la persona y su page_id si ya existe (los enlaces a
+    personas por crear se resuelven al aplicar el plan). La relación actual del contrato
+    no se guarda: puede cambiar antes de aplicar el plan, así que se vuelve a leer al
+    enlazar. La escritura es atómica (archivo temporal + reemplazo). Devuelve la cantidad
+    de operaciones por tipo.
+    """
+    counts = Counter()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for create in planner.create_operations():
+            f.write(json.dumps({'op': 'create', **create}, ensure_ascii=False) + "\n")
+            counts['create'] += 1
+        for update in planner.update_operations():
+            f.write(json.dumps({'op': 'update', **update}, ensure_ascii=False) + "\n")
+            counts['update'] += 1
+        for contract_id, name in planner.links:
+            record = {'op': 'link', 'contract_id': contract_id, 'name': name, 'page_id': person_ids.get(name)}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            counts['link'] += 1
+    os.replace(tmp_path, path)
+    return counts
+
+def read_link_plan(path: str):
+    """Lee un plan JSONL y lo reconstruye como (WritePlanner, {nombre: page_id existente}).
+
+    Se ignora la relación `current` que guardaban los planes antiguos: al aplicar se lee la actual.
+    """
+    planner = WritePlanner()
+    person_ids = {}
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip(): continue
+            record = json.loads(line)
+            op = record.get('op')
+            if op == 'create':
+                planner.plan_create(record['name'], record.get('correo', ""), record.get('sexo', ""))
+            elif op == 'update':
+                planner.plan_update(record['page_id'], record['name'], record.get('correo', ""), record.get('sexo', ""))
+            elif op == 'link':
+                planner.plan_link(record['contract_id'], record['name'])
+                if record.get('page_id'):
+                    person_ids[record['name']] = record['page_id']
+            else:
+                raise ValueError(f"Operación desconocida en {path}:{line_number}: {op!r}")
+    return planner, person_ids
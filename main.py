@@ -1,9 +1,30 @@
+from __future__ import annotations
+
 import os
 import logging
 import datetime
+import itertools
+import queue
+import signal
+import threading
+from collections import Counter
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-from notion_service import NotionService
-from analysis_service import ProcessingAnalyzer
+from notion_service import NotionService, inline_relation_ids
+from schema_cache import SchemaCache
+from analysis_service import ProcessingAnalyzer, ReportWriter, QueueReportWriter
+from person_index import PersonIndex
+from person_cache import PersistentPersonCache
+from sync_state import SyncState, notion_timestamp
+from write_planner import WritePlanner, person_properties
+from journal import WriteAheadJournal
+from link_plan import write_link_plan, read_link_plan
+from snapshot_store import SnapshotStore
+from duplicates import find_duplicate_groups, conflict_reason, build_merge_plan, write_merge_plan
+from polling import AdaptiveInterval, ContractPoller
+from sharding import shard_for, shard_path, api_tokens, assign_tokens, put_while_alive, QueueReader
+if TYPE_CHECKING:
+    from webhook import EventBuffer, WebhookServer  # http.server solo se carga en el modo webhook
 
 # --- CONFIGURACIÓN ---
 load_dotenv()
@@ -15,15 +36,51 @@ CONTRATO_RELACION_PROP = "PERSONAS"
 PERSONA_NOMBRE_PROP = "NOMBRE"
 # Configuraciones de ejecución
 BATCH_SIZE = 10
-DRY_RUN = False  # Poner en True para simular sin hacer cambios reales
+DRY_RUN = False  # True: modo plan; lee ambas BD en bloque y guarda en PLAN_FILE las escrituras sin hacerlas
+APPLY_PLAN = False  # True: ejecuta las escrituras de PLAN_FILE (generado con DRY_RUN) en vez de sincronizar
+PLAN_FILE = "link_plan.jsonl"
 REQUESTS_PER_SECOND = 2.5
+ADAPTIVE_RATE_LIMIT = True  # Ajusta el rate solo: baja ante 429 y sube tras rachas de éxitos
+MAX_REQUESTS_PER_SECOND = 3.0  # Techo del rate adaptativo (promedio documentado por Notion)
+RATE_LIMIT_BURST = 3  # Ráfaga máxima permitida por el token bucket (Notion tolera ráfagas sobre el promedio)
+MAX_CONCURRENCY = 3  # Llamadas en vuelo simultáneas; 1 = procesamiento secuencial
+HTTP_MAX_CONNECTIONS = 10  # Conexiones del pool HTTP compartido (keep-alive); al menos MAX_CONCURRENCY
+HTTP_KEEPALIVE_SECONDS = 60  # Tiempo que una conexión ociosa se mantiene abierta para reutilizarla
+HTTP2 = True  # Usa HTTP/2 si está instalado httpx[http2]; si no, HTTP/1.1
+HTTP_TIMEOUT_SECONDS = 60
+HTTP_ENDPOINT_TIMEOUTS = {'pages.update': 30, 'pages.create': 30}  # Timeouts por endpoint (s); el resto usa HTTP_TIMEOUT_SECONDS
+SCHEMA_CACHE_FILE = "schema_cache.json"  # Esquemas de las BD para validar propiedades sin databases.retrieve; None = solo en memoria
+SCHEMA_CACHE_TTL_HOURS = 24
+SHARD_WORKERS = 0  # >1: reparte los contratos por hash del nombre entre N procesos (tokens en NOTION_API_KEYS)
+WRITE_BATCH_SIZE = 100  # Contratos planificados juntos: una escritura por persona y un enlace por contrato
+PERSON_CACHE_FILE = "person_cache.db"  # Caché persistente de personas entre ejecuciones; None para desactivar
+PERSON_CACHE_TTL_DAYS = 30
+PERSON_CACHE_MAX_ENTRIES = 100000
+JOURNAL_FILE = "notion_linker.journal"  # Journal de escrituras para reanudar ejecuciones interrumpidas; None para desactivar
+INCREMENTAL_SYNC = False  # True: solo consulta contratos/personas editados desde la última ejecución
+SYNC_STATE_FILE = "sync_state.json"
+EXPORT_METRICS_JSON = False  # True: exporta contadores y métricas de la API a reporte_metricas_*.json
+REPORT_EVENTS_JSONL = None  # p. ej. "reporte_eventos.jsonl": además de los CSV, registra cada evento (incluidos los enlaces)
+REPORT_DB_FILE = "reportes.db"  # Almacén SQLite de eventos y sesiones (consultas: python report_store.py); None = solo CSV/TXT
+LEGACY_REPORT_FILES = False  # True: además escribe los CSV acumulativos y un reporte_sesion_*.txt por ejecución
+DAEMON_MODE = False  # True: queda en ejecución consultando Contratos sin enlace, con cliente, pool y cachés siempre cargados
+POLL_MIN_SECONDS = 5  # Intervalo del modo daemon mientras aparecen contratos
+POLL_MAX_SECONDS = 300  # Intervalo máximo: sin contratos nuevos se duplica en cada consulta hasta este valor
+WEBHOOK_MODE = False  # True: enlaza los contratos que llegan por webhooks de Notion en vez de consultar la BD
+WEBHOOK_HOST = "127.0.0.1"
+WEBHOOK_PORT = 8787  # Endpoint: http://WEBHOOK_HOST:WEBHOOK_PORT/webhook (firma con NOTION_WEBHOOK_SECRET, si está)
+WEBHOOK_DEDUP_SECONDS = 2  # Los eventos de una misma página dentro de esta ventana se procesan una vez
+STREAM_ALL_CONTRACTS = False  # True: recorre toda la BD de Contratos sin enlace en vez de un lote de BATCH_SIZE
+PRELOAD_PERSON_INDEX = False  # True: carga toda la BD de Personas al inicio (~N/100 consultas) en vez de buscar nombre por nombre
+SNAPSHOT_FILE = None  # Snapshot local (python snapshot_store.py) desde el que se leen las BD; None = leer de la API
+FUZZY_MATCH_THRESHOLD = None  # Con índice precargado: similitud mínima (0-1) para aceptar un casi-duplicado, p. ej. 0.85
 
 # --- Configuración de Logging ---
 logger = logging.getLogger(__name__)
 if not logger.handlers:
     logger.setLevel(logging.INFO)
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    fh = logging.FileHandler('notion_linker.log', 'a', 'utf-8')
+    fh = logging.FileHandler('notion_linker.log', 'a', 'utf-8', delay=True)  # El archivo se abre con el primer mensaje
     fh.setFormatter(formatter)
     logger.addHandler(fh)
     sh = logging.StreamHandler()
@@ -31,12 +88,14 @@ if not logger.handlers:
     logger.addHandler(sh)
 
 # --- Funciones Auxiliares ---
+NAME_REPLACEMENTS = (('Á', 'A'), ('É', 'E'), ('Í', 'I'), ('Ó', 'O'), ('Ú', 'U'), ('Ñ', 'N'))
+
 def clean_name(name: str) -> str:
     """Limpia y normaliza un nombre para consistencia."""
     if not name: return ""
     cleaned = name.strip().upper()
-    replacements = {'Á': 'A', 'É': 'E', 'Í': 'I', 'Ó': 'O', 'Ú': 'U', 'Ñ': 'N'}
-    for old, new in replacements.items():
+    if cleaned.isascii(): return cleaned  # La mayoría de los nombres: sin tildes que reemplazar
+    for old, new in NAME_REPLACEMENTS:
         cleaned = cleaned.replace(old, new)
     return cleaned
 
@@ -50,114 +109,921 @@ def extract_property_value(properties: dict, prop_name: str) -> str:
         key = "title" if prop_type == "title" else "rich_text"
         if prop.get(key): return prop[key][0].get("plain_text", "")
     elif prop_type == "email":
-        return prop.get("email", "")
+        return prop.get("email") or ""
     elif prop_type == "select" and prop.get("select"):
         return prop["select"].get("name", "")
     return ""
 
+def extract_contract_columns(contracts: list):
+    """Normaliza una página de contratos en una sola pasada: (ids, nombres limpios, correos, sexos).
+
+    Da los mismos valores que `clean_name`/`extract_property_value` contrato por contrato,
+    pero resuelve el tipo de cada propiedad una vez por página de resultados (todas las
+    páginas de una consulta lo comparten) y lee los valores sin una llamada por propiedad.
+    Si algún contrato no sigue ese formato se usa la extracción genérica.
+    """
+    ids, names, correos, sexos = [], [], [], []
+    if not contracts: return ids, names, correos, sexos
+    name_prop, correo_prop, sexo_prop = CONTRATO_NOMBRE_PROP, CONTRATO_CORREO_PROP, CONTRATO_SEXO_PROP
+    try:
+        first = contracts[0]["properties"]
+        name_type = first[name_prop]["type"]
+        if (name_type in ("title", "rich_text") and first[correo_prop]["type"] == "email"
+                and first[sexo_prop]["type"] == "select"):
+            for contract in contracts:
+                props = contract["properties"]
+                texts = props[name_prop][name_type]
+                option = props[sexo_prop]["select"]
+                ids.append(contract["id"])
+                names.append(clean_name(texts[0].get("plain_text", "")) if texts else "")
+                correos.append((props[correo_prop]["email"] or "").strip())
+                sexos.append(option.get("name", "") if option else "")
+            return ids, names, correos, sexos
+    except (KeyError, TypeError, IndexError, AttributeError):
+        ids, names, correos, sexos = [], [], [], []
+    for contract in contracts:
+        props = contract["properties"]
+        ids.append(contract["id"])
+        names.append(clean_name(extract_property_value(props, name_prop)))
+        correos.append(extract_property_value(props, correo_prop).strip())
+        sexos.append(extract_property_value(props, sexo_prop))
+    return ids, names, correos, sexos
+
+def person_record_from_page(page: dict) -> dict:
+    """Reduce una página de Personas a los datos usados por el enlazador."""
+    props = page.get("properties", {})
+    return {
+        'id': page["id"],
+        'correo': extract_property_value(props, "CORREO"),
+        'sexo': extract_property_value(props, "SEXO"),
+    }
+
+def build_person_index(notion: NotionService, personas_db_id: str) -> PersonIndex:
+    """Pagina la BD de Personas una sola vez y construye el índice por nombre limpio."""
+    logger.info("📚 Cargando índice de Personas...")
+    index = PersonIndex()
+    for page in notion.query_all_pages(personas_db_id, page_size=100):
+        record = person_record_from_page(page)
+        name = extract_property_value(page.get("properties", {}), PERSONA_NOMBRE_PROP)
+        index.add(name, record['id'], record['correo'], record['sexo'])
+    logger.info(f"📚 Índice de Personas cargado: {len(index)} nombres.")
+    return index
+
+def chunked(iterable, size: int):
+    """Divide un iterable (posiblemente un generador) en listas de tamaño máximo `size`."""
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+def refresh_person_cache(notion: NotionService, personas_db_id: str, cache: PersistentPersonCache, sync_state: SyncState):
+    """Actualiza el caché persistente solo con las personas editadas desde la última ejecución."""
+    since = sync_state.get_watermark("personas")
+    if not since:
+        # Primera ejecución incremental: el caché se llena bajo demanda desde ahora
+        sync_state.advance("personas", notion_timestamp())
+        return
+    refreshed = 0
+    edited_filter = notion.edited_since_filter(since)
+    for page in sync_state.track("personas", notion.query_all_pages(personas_db_id, filter=edited_filter)):
+        name = clean_name(extract_property_value(page.get("properties", {}), PERSONA_NOMBRE_PROP))
+        if not name: continue
+        record = person_record_from_page(page)
+        cache.put(name, record['id'], record['correo'], record['sexo'])
+        refreshed += 1
+    logger.info(f"🔄 Personas editadas desde {since}: {refreshed} actualizadas en caché.")
+
 # --- Lógica Principal ---
+class ContractLinker:
+    """Busca o crea la persona de cada contrato, la enriquece y enlaza el contrato.
+
+    Cada lote se procesa en tres fases: resolución de los nombres distintos, planificación
+    de las escrituras (WritePlanner) y ejecución, de modo que cada persona recibe como
+    máximo una creación o actualización por lote y cada contrato una sola escritura que
+    agrega sus personas a las que ya tenía enlazadas.
+    """
+
+    def __init__(self, notion: NotionService, analyzer: ProcessingAnalyzer, personas_db_id: str,
+                 person_index: PersonIndex = None, persistent_cache: PersistentPersonCache = None,
+                 journal: WriteAheadJournal = None):
+        self.notion = notion
+        self.analyzer = analyzer
+        self.personas_db_id = personas_db_id
+        self.person_index = person_index
+        self.persistent_cache = persistent_cache
+        self.journal = journal
+        self.person_cache = {}  # nombre -> {'id', 'correo', 'sexo'}
+        self.known_relations = {}  # contract_id -> relación actual del lote en curso (None si vino truncada)
+        self.edited_times = {}  # contract_id -> last_edited_time de los contratos del lote en curso
+        self.failed = {}  # contract_id -> last_edited_time de los contratos que no se pudieron enlazar
+
+    def process(self, contract: dict, position: str = ""):
+        """Procesa un contrato completo: búsqueda/creación, enriquecimiento y enlace."""
+        self.process_batch([contract], [position])
+
+    def process_all(self, contracts, total_label="?"):
+        """Procesa contratos en lotes de WRITE_BATCH_SIZE."""
+        processed = 0
+        for chunk in chunked(contracts, WRITE_BATCH_SIZE):
+            positions = [f"{processed + i + 1}/{total_label}" for i in range(len(chunk))]
+            processed += len(chunk)
+            self.process_batch(chunk, positions)
+
+    def process_batch(self, contracts: list, positions: list = None):
+        """Extrae nombre/correo/sexo de cada contrato y ejecuta el lote."""
+        entries = self._extract_entries(contracts, positions)
+        if entries:
+            self._link_entries(entries)
+        self.known_relations.clear()
+        self.edited_times.clear()
+
+    def plan_batch(self, contracts: list, planner: WritePlanner, person_ids: dict):
+        """Planifica un lote sin escribir en Notion: acumula las operaciones en `planner`
+        y los page_id de las personas existentes en `person_ids`."""
+        entries = self._extract_entries(contracts)
+        resolved = self._resolve(entries)
+        self._plan_entries(entries, resolved, planner)
+        person_ids.update({name: person['id'] for name, (person, _) in resolved.items() if person})
+        self.known_relations.clear()
+        self.edited_times.clear()
+
+    def apply_plan(self, planner: WritePlanner, person_ids: dict):
+        """Ejecuta un plan leído de PLAN_FILE: creaciones, actualizaciones y enlaces.
+
+        Antes de cada creación se busca de nuevo el nombre en Personas, así que aplicar dos
+        veces el mismo plan no duplica personas.
+        """
+        if self.journal is not None:
+            # Personas creadas por una aplicación interrumpida del mismo plan
+            for name in list(planner.creates):
+                if name in self.journal.created:
+                    person_ids[name] = self.journal.created[name]['id']
+                    del planner.creates[name]
+        # Personas que ya existen en Notion (p. ej. al aplicar de nuevo el mismo plan): se enlazan, no se crean
+        creates = planner.create_operations()
+        pages = self.notion.run_concurrently(
+            lambda create: self.notion.find_person_by_name(self.personas_db_id, PERSONA_NOMBRE_PROP, create['name']), creates)
+        for create, page in zip(creates, pages):
+            if page is None: continue
+            person = person_record_from_page(page)
+            person_ids[create['name']] = person['id']
+            del planner.creates[create['name']]
+            self.analyzer.record_existing_person_found(create['name'], person['id'])
+            planner.plan_update(person['id'], create['name'], create['correo'] if not person['correo'] else "",
+                                create['sexo'] if not person['sexo'] else "")
+        for _ in planner.links:
+            self.analyzer.record_contract_processed()
+        self._execute_plan(planner, dict(person_ids))
+
+    def refresh_persons(self, pages) -> int:
+        """Aplica a los cachés y al índice las personas editadas fuera del enlazador; devuelve cuántas."""
+        refreshed = 0
+        for page in pages:
+            name = clean_name(extract_property_value(page.get("properties", {}), PERSONA_NOMBRE_PROP))
+            if not name: continue
+            self._remember_person(name, person_record_from_page(page))
+            refreshed += 1
+        return refreshed
+
+    def _extract_entries(self, contracts: list, positions: list = None) -> list:
+        """Devuelve (contract_id, nombre, correo, sexo) de los contratos con nombre."""
+        entries = []
+        for idx, (contract_id, person_name, correo, sexo) in enumerate(zip(*extract_contract_columns(contracts))):
+            self.analyzer.record_contract_processed()
+            
+            if not person_name:
+                self.analyzer.record_skipped_empty_name(contract_id)
+                continue
+            
+            self.known_relations[contract_id] = inline_relation_ids(contracts[idx], CONTRATO_RELACION_PROP)
+            self.edited_times[contract_id] = contracts[idx].get("last_edited_time", "")
+            position = positions[idx] if positions else ""
+            logger.info(f"⚙️ ({position}) Procesando: {person_name}")
+            entries.append((contract_id, person_name, correo, sexo))
+        return entries
+
+    def _lookup_person(self, person_name: str, use_cache: bool = True, correo: str = "", sexo: str = ""):
+        """Busca una persona en los cachés, el índice precargado o la API.
+
+        `correo` y `sexo` son los del contrato: una coincidencia aproximada que los contradice
+        se descarta. Devuelve (registro, viene_de_cache); el registro es None si la persona no existe.
+        """
+        if use_cache and person_name in self.person_cache:
+            return self.person_cache[person_name], True
+        if use_cache and self.journal is not None and person_name in self.journal.created:
+            # Creada por una ejecución interrumpida: no se vuelve a buscar ni a crear
+            return dict(self.journal.created[person_name]), True
+        if use_cache and self.persistent_cache is not None:
+            person = self.persistent_cache.get(person_name)
+            if person:
+                return person, True
+        if self.person_index is not None:
+            person = self.person_index.get(person_name)
+            if person is None and FUZZY_MATCH_THRESHOLD:
+                match = self.person_index.find_similar(person_name, FUZZY_MATCH_THRESHOLD, correo, sexo)
+                if match:
+                    person, score, matched_key = match
+                    logger.warning(f"   -> {person_name}: coincidencia aproximada con '{matched_key}' (similitud {score:.2f}).")
+        else:
+            person_page = self.notion.find_person_by_name(self.personas_db_id, PERSONA_NOMBRE_PROP, person_name)
+            person = person_record_from_page(person_page) if person_page else None
+        return person, False
+
+    def _remember_person(self, person_name: str, person: dict):
+        """Propaga el estado conocido de una persona a los cachés y al índice."""
+        self.person_cache[person_name] = person
+        if self.person_index is not None:
+            if person_name in self.person_index:
+                self.person_index.update(person_name, correo=person['correo'], sexo=person['sexo'])
+            else:
+                self.person_index.add(person_name, person['id'], person['correo'], person['sexo'])
+        if self.persistent_cache is not None:
+            self.persistent_cache.put(person_name, person['id'], person['correo'], person['sexo'])
+
+    def _resolve(self, entries: list, use_cache: bool = True) -> dict:
+        """Resuelve cada nombre distinto una sola vez (en paralelo si MAX_CONCURRENCY > 1)."""
+        known = {}
+        for _, name, correo, sexo in entries:
+            previous_correo, previous_sexo = known.get(name, ("", ""))
+            known[name] = (previous_correo or correo, previous_sexo or sexo)
+        names = list(known)
+        return dict(zip(names, self.notion.run_concurrently(lambda name: self._lookup_person(name, use_cache, *known[name]),
+                                                            names)))
+
+    def _plan_entries(self, entries: list, resolved: dict, planner: WritePlanner):
+        """Planifica una creación o actualización por persona y un enlace por contrato."""
+        analyzer = self.analyzer
+        seen = set()
+        for contract_id, person_name, correo, sexo in entries:
+            person, from_cache = resolved[person_name]
+            if person_name in seen or (person and from_cache):
+                logger.info(f"   -> {person_name}: encontrado en caché.")
+                analyzer.record_cache_hit()
+            elif person:
+                analyzer.record_existing_person_found(person_name, person['id'])
+            seen.add(person_name)
+            if person:
+                planner.plan_update(person['id'], person_name,
+                                    correo if not person['correo'] else "", sexo if not person['sexo'] else "")
+            else:
+                planner.plan_create(person_name, correo, sexo)
+            planner.plan_link(contract_id, person_name, self.known_relations.get(contract_id))
+
+    def _link_entries(self, entries: list, use_cache: bool = True):
+        """Resuelve, planifica y ejecuta las escrituras de un lote de (contrato, nombre, correo, sexo)."""
+        resolved = self._resolve(entries, use_cache)
+        planner = WritePlanner()
+        self._plan_entries(entries, resolved, planner)
+        
+        person_ids = {name: person['id'] for name, (person, _) in resolved.items() if person}
+        from_cache = {name for name, (person, cached) in resolved.items() if person and cached}
+        for name, (person, cached) in resolved.items():
+            if person and cached:
+                self.person_cache[name] = person
+            elif person:
+                self._remember_person(name, person)
+        stale_contracts = self._execute_plan(planner, person_ids, from_cache)
+        
+        if stale_contracts:
+            # El page_id guardado puede apuntar a una persona borrada: se invalida y se resuelve de nuevo
+            stale = [entry for entry in entries if entry[0] in stale_contracts]
+            for name in {name for _, name, _, _ in stale}:
+                logger.warning(f"   -> Enlace fallido con ID en caché, invalidando '{name}'.")
+                self.person_cache.pop(name, None)
+                if self.persistent_cache is not None:
+                    self.persistent_cache.invalidate(name=name, page_id=person_ids.get(name))
+            self._link_entries(stale, use_cache=False)
+
+    def _execute_plan(self, planner: WritePlanner, person_ids: dict, from_cache: set = frozenset()) -> set:
+        """Ejecuta las escrituras planificadas; devuelve los contratos cuyo enlace falló con un ID de caché."""
+        notion, analyzer = self.notion, self.analyzer
+        journal = self.journal
+        if journal is not None:
+            for create in planner.create_operations():
+                journal.plan('create', create['name'], correo=create['correo'], sexo=create['sexo'])
+            for update in planner.update_operations():
+                journal.plan('update', update['page_id'], correo=update['correo'], sexo=update['sexo'])
+            for contract_id, person_name in planner.links:
+                journal.plan('link', contract_id, person_name=person_name)
+            journal.flush()
+        
+        # 5. Ejecutar las creaciones coalescidas: desbloquean los enlaces de las personas nuevas
+        for create, page_id in zip(planner.create_operations(),
+                                   notion.run_concurrently(self._create_person, planner.create_operations())):
+            if page_id:
+                person_ids[create['name']] = page_id
+                self._remember_person(create['name'], {'id': page_id, 'correo': create['correo'], 'sexo': create['sexo']})
+                if journal is not None:
+                    journal.complete('create', create['name'], page_id=page_id, correo=create['correo'], sexo=create['sexo'])
+        if journal is not None: journal.flush()
+        
+        # 6. Enlazar cada contrato con sus personas y completar los datos de las existentes;
+        #    van juntos y el scheduler de NotionService da turno a los enlaces antes que a las actualizaciones
+        def link(operation):
+            contract_id = operation['contract_id']
+            already_linked = journal.linked.get(contract_id, set()) if journal is not None else set()
+            pending = {}
+            for person_name in operation['names']:
+                person_page_id = person_ids.get(person_name)
+                if not person_page_id:
+                    self._record_link_error(contract_id, person_name, "No se pudo encontrar o crear la persona.")
+                elif person_page_id in already_linked:
+                    journal.complete('link', contract_id, page_id=person_page_id)
+                    analyzer.record_successful_link(contract_id, person_name, person_page_id)
+                else:
+                    pending[person_name] = person_page_id
+            if not pending:
+                return None
+            if notion.add_contract_relations(contract_id, list(pending.values()), operation['current']):
+                for person_name, person_page_id in pending.items():
+                    if journal is not None: journal.complete('link', contract_id, page_id=person_page_id)
+                    analyzer.record_successful_link(contract_id, person_name, person_page_id)
+                return None
+            if any(person_name in from_cache for person_name in pending):
+                return contract_id
+            for person_name in pending:
+                self._record_link_error(contract_id, person_name, "No se pudo enlazar el contrato con la persona.")
+            return None
+        links = planner.link_operations()
+        tasks = [(link, operation) for operation in links] + [(self._update_person, update) for update in planner.update_operations()]
+        results = notion.run_concurrently(lambda task: task[0](task[1]), tasks)
+        stale_contracts = set(filter(None, results[:len(links)]))
+        if journal is not None: journal.flush()
+        return stale_contracts
+
+    def _record_link_error(self, contract_id: str, person_name: str, message: str):
+        """Registra un enlace fallido; el contrato queda en `failed` para volver a consultarlo."""
+        self.analyzer.record_error(contract_id, person_name, message)
+        self.failed[contract_id] = self.edited_times.get(contract_id, "")
+
+    def _create_person(self, create: dict):
+        """Crea una persona con los valores resueltos del lote; devuelve su page_id o None."""
+        logger.info(f"   -> {create['name']}: no encontrado. Creando persona con datos: "
+                    f"Correo='{create['correo']}', Sexo='{create['sexo']}'")
+        new_person_page = self.notion.create_person(self.personas_db_id, PERSONA_NOMBRE_PROP, create['name'],
+                                                    create['correo'], create['sexo'])
+        page_id = new_person_page.get("id") if new_person_page else None
+        if page_id: self.analyzer.record_new_person_created(create['name'], page_id)
+        return page_id
+
+    def _update_person(self, update: dict):
+        """Aplica en una sola escritura los campos vacíos planificados para una persona."""
+        props_to_update = person_properties(update['correo'], update['sexo'])
+        if not props_to_update: return
+        logger.info(f"   -> {update['name']}: actualizando propiedades existentes: {list(props_to_update.keys())}")
+        if not self.notion.update_person_properties(update['page_id'], props_to_update):
+            return
+        if self.journal is not None:
+            self.journal.complete('update', update['page_id'], correo=update['correo'], sexo=update['sexo'])
+        person = self.person_cache.get(update['name'])
+        if person:
+            person.update({field: update[field] for field in ('correo', 'sexo') if update[field]})
+            self._remember_person(update['name'], person)
+        self.analyzer.record_properties_updated(update['page_id'], update['name'], list(props_to_update.keys()))
+
+def plan_backlog(notion: NotionService, contratos_db_id: str, personas_db_id: str, path: str):
+    """Modo plan: lee ambas BD con consultas paginadas, calcula en memoria todas las
+    creaciones, actualizaciones y enlaces, y los guarda en `path` sin escribir en Notion."""
+    person_index = build_person_index(notion, personas_db_id)
+    linker = ContractLinker(notion, ProcessingAnalyzer(), personas_db_id, person_index)
+    planner, person_ids = WritePlanner(), {}
+    # El plan no escribe: ningún contrato sale del filtro durante el recorrido y basta seguir el cursor
+    contracts = notion.query_all_pages(contratos_db_id, page_size=100, **notion._unlinked_query())
+    for chunk in chunked(contracts, WRITE_BATCH_SIZE):
+        linker.plan_batch(chunk, planner, person_ids)
+    counts = write_link_plan(path, planner, person_ids)
+    logger.info(f"📝 Plan guardado en {path}: {counts['create']} creaciones, {counts['update']} actualizaciones, "
+                f"{counts['link']} enlaces.")
+    return counts
+
+def plan_person_merges(notion: NotionService, contratos_db_id: str, personas_db_id: str, path: str) -> Counter:
+    """Busca personas duplicadas en una pasada por la BD de Personas y guarda en `path`
+    el plan que reenlaza sus contratos a la persona canónica."""
+    logger.info("🧬 Buscando personas duplicadas...")
+    persons = (
+        {**person_record_from_page(page), 'created_time': page.get("created_time", ""),
+         'name': extract_property_value(page.get("properties", {}), PERSONA_NOMBRE_PROP)}
+        for page in notion.query_all_pages(personas_db_id)
+    )
+    groups, conflicts = find_duplicate_groups(persons)
+    for group in conflicts:
+        logger.warning(f"   -> {conflict_reason(group)}, no se fusionan: {', '.join(person['id'] for person in group)}")
+    linked_filter = {"property": CONTRATO_RELACION_PROP, "relation": {"is_not_empty": True}}
+    # Los contratos con más de 25 personas vienen truncados: se completa su relación antes de reenlazar
+    contracts = (notion.with_full_relation(page, CONTRATO_RELACION_PROP)
+                 for page in notion.query_all_pages(contratos_db_id, filter=linked_filter))
+    counts = write_merge_plan(path, build_merge_plan(groups, contracts, CONTRATO_RELACION_PROP))
+    logger.info(f"🧬 Plan de fusión guardado en {path}: {len(groups)} grupos, {counts['duplicate']} duplicados, "
+                f"{counts['relink']} contratos a reenlazar, {len(conflicts)} grupos para revisar a mano.")
+    return counts
+
+def build_notion_service(snapshot: SnapshotStore = None, auth: str = None, rate_share: int = 1) -> NotionService:
+    """Crea el servicio de Notion con la configuración de rate limiting y concurrencia.
+
+    `rate_share` es la cantidad de procesos que usan el mismo token: cada uno recibe esa
+    fracción del rate configurado.
+    """
+    from http_pool import HttpConnectionPool  # httpx y notion_client solo se cargan si hay que llamar a la API
+    return NotionService(
+        contract_relation_prop=CONTRATO_RELACION_PROP,
+        requests_per_second=REQUESTS_PER_SECOND / rate_share,
+        burst=max(1, RATE_LIMIT_BURST // rate_share),
+        adaptive_rate=ADAPTIVE_RATE_LIMIT,
+        max_requests_per_second=MAX_REQUESTS_PER_SECOND and MAX_REQUESTS_PER_SECOND / rate_share,
+        max_concurrency=MAX_CONCURRENCY,
+        snapshot=snapshot,
+        auth=auth,
+        schema_cache=SchemaCache(SCHEMA_CACHE_FILE, SCHEMA_CACHE_TTL_HOURS * 3600),
+        http_pool=HttpConnectionPool(max_connections=max(HTTP_MAX_CONNECTIONS, MAX_CONCURRENCY),
+                                     keepalive_expiry=HTTP_KEEPALIVE_SECONDS, http2=HTTP2,
+                                     timeout=HTTP_TIMEOUT_SECONDS, endpoint_timeouts=HTTP_ENDPOINT_TIMEOUTS)
+    )
+
+def export_snapshot(notion: NotionService, contratos_db_id: str, personas_db_id: str, path: str) -> dict:
+    """Descarga ambas BD con consultas paginadas a un snapshot local, solo con las propiedades usadas."""
+    store = SnapshotStore(path)
+    try:
+        logger.info(f"📸 Descargando BD de Contratos a {path}...")
+        contratos = store.import_database(
+            contratos_db_id, notion.query_all_pages(contratos_db_id),
+            [CONTRATO_NOMBRE_PROP, CONTRATO_CORREO_PROP, CONTRATO_SEXO_PROP, CONTRATO_RELACION_PROP],
+            relation_prop=CONTRATO_RELACION_PROP)
+        logger.info(f"📸 Descargando BD de Personas a {path}...")
+        personas = store.import_database(
+            personas_db_id, notion.query_all_pages(personas_db_id),
+            [PERSONA_NOMBRE_PROP, "CORREO", "SEXO"], title_prop=PERSONA_NOMBRE_PROP)
+    finally:
+        store.close()
+    logger.info(f"📸 Snapshot guardado: {contratos} contratos y {personas} personas.")
+    return {'contratos': contratos, 'personas': personas}
+
+def validate_environment() -> bool:
+    """Verifica que estén las variables de entorno necesarias (.env) antes de crear nada."""
+    missing = [name for name in ("CONTRATOS_DB_ID", "PERSONAS_DB_ID") if not os.getenv(name)]
+    if not any(api_tokens()):
+        missing.insert(0, "NOTION_API_KEY")
+    if missing:
+        logger.error(f"❌ Variables de entorno faltantes: {', '.join(missing)}. Revisa el archivo .env (ver .env.example).")
+        return False
+    return True
+
+def nothing_to_link(snapshot: SnapshotStore, contratos_db_id: str) -> bool:
+    """Comprobación local previa: True si el snapshot cubre Contratos y no tiene contratos sin enlace.
+
+    Las consultas de contratos se leerían de ese mismo snapshot, así que es la respuesta
+    que daría la ejecución completa, sin cargar el cliente de Notion ni abrir los reportes.
+    """
+    if snapshot is None or not snapshot.covers(contratos_db_id): return False
+    try:
+        return snapshot.count(contratos_db_id, {"property": CONTRATO_RELACION_PROP, "relation": {"is_empty": True}}) == 0
+    except ValueError:  # El snapshot se tomó con otra propiedad de relación
+        return False
+
 def main():
     """Orquesta el proceso completo de sincronización y enriquecimiento de datos."""
     start_time = datetime.datetime.now()
     logger.info(f"🚀 Iniciando proceso: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
+    if not validate_environment():
+        return
     
     if DRY_RUN:
-        logger.warning("🧪 MODO DRY-RUN ACTIVADO - No se realizarán cambios en Notion.")
+        logger.warning(f"🧪 MODO DRY-RUN ACTIVADO - Se calculará el plan en {PLAN_FILE} sin realizar cambios en Notion.")
 
     contratos_db_id = os.getenv("CONTRATOS_DB_ID")
     personas_db_id = os.getenv("PERSONAS_DB_ID")
     
-    notion = NotionService(
-        contract_relation_prop=CONTRATO_RELACION_PROP,
-        requests_per_second=REQUESTS_PER_SECOND
-    )
-    analyzer = ProcessingAnalyzer()
+    snapshot = SnapshotStore(SNAPSHOT_FILE) if SNAPSHOT_FILE else None
+    if snapshot is not None:
+        for db_id in (contratos_db_id, personas_db_id):
+            if snapshot.covers(db_id):
+                logger.info(f"📸 Leyendo BD {db_id[:8]}... desde el snapshot del {snapshot.databases[db_id]['taken_at']}.")
+        if not (DRY_RUN or APPLY_PLAN or DAEMON_MODE or WEBHOOK_MODE) and nothing_to_link(snapshot, contratos_db_id):
+            logger.info("🎉 ¡Excelente! No se encontraron contratos pendientes de enlazar.")
+            snapshot.close()
+            return
+    notion = build_notion_service(snapshot)
+    analyzer = ProcessingAnalyzer(ReportWriter(events_jsonl=REPORT_EVENTS_JSONL, store_path=REPORT_DB_FILE,
+                                               csv_reports=LEGACY_REPORT_FILES or not REPORT_DB_FILE))
+    try:
+        run(notion, analyzer, contratos_db_id, personas_db_id)
+    finally:
+        analyzer.close()
+        notion.close()
+        if snapshot is not None: snapshot.close()
+
+def run(notion: NotionService, analyzer: ProcessingAnalyzer, contratos_db_id: str, personas_db_id: str):
+    """Ejecuta el modo configurado: plan (DRY_RUN), aplicación de un plan o sincronización."""
+    if DRY_RUN:
+        plan_backlog(notion, contratos_db_id, personas_db_id, PLAN_FILE)
+        return
+    if APPLY_PLAN:
+        run_plan(notion, analyzer, personas_db_id)
+        return
+    if DAEMON_MODE or WEBHOOK_MODE:
+        stop_event = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+        if WEBHOOK_MODE:
+            run_webhook(notion, analyzer, contratos_db_id, personas_db_id, stop_event)
+        else:
+            run_daemon(notion, analyzer, contratos_db_id, personas_db_id, stop_event)
+        return
     
-    logger.info(f"Iniciando la sincronización. Se procesarán hasta {BATCH_SIZE} contratos sin enlace.")
+    sync_state = SyncState(SYNC_STATE_FILE) if INCREMENTAL_SYNC else None
+    since = sync_state.get_watermark("contratos") if sync_state else None
+    if since:
+        logger.info(f"🔄 Sincronización incremental: contratos editados desde {since}.")
     
-    # 1. Obtener un lote de contratos que NO tengan la relación de persona
-    contracts_to_process = notion.get_unlinked_contracts(contratos_db_id, BATCH_SIZE)
+    # 1. Obtener los contratos que NO tengan la relación de persona
+    if STREAM_ALL_CONTRACTS:
+        logger.info("Iniciando la sincronización. Se procesarán todos los contratos sin enlace.")
+        contracts_to_process = notion.iter_unlinked_contracts(contratos_db_id, page_size=100, since=since)
+        total_label = "?"
+    else:
+        logger.info(f"Iniciando la sincronización. Se procesarán hasta {BATCH_SIZE} contratos sin enlace.")
+        contracts_to_process = notion.get_unlinked_contracts(contratos_db_id, BATCH_SIZE, since=since)
+        total_label = len(contracts_to_process)
+    if sync_state:
+        contracts_to_process = sync_state.track("contratos", contracts_to_process)
     
-    if not contracts_to_process:
+    contracts_iter = iter(contracts_to_process)
+    first_contract = next(contracts_iter, None)
+    if first_contract is None:
         logger.info("🎉 ¡Excelente! No se encontraron contratos pendientes de enlazar.")
+        if sync_state: sync_state.save()
         return
+    contracts_to_process = itertools.chain([first_contract], contracts_iter)
         
-    total_in_batch = len(contracts_to_process)
     analyzer.start_session()
-    analyzer.stats['total_processed'] = total_in_batch
+    if SHARD_WORKERS > 1:
+        if sync_state and PERSON_CACHE_FILE:
+            persistent_cache = open_person_cache()
+            try:
+                refresh_person_cache(notion, personas_db_id, persistent_cache, sync_state)
+            finally:
+                persistent_cache.close()
+        failed = {}
+        api_metrics = run_sharded(notion, analyzer, contracts_to_process, personas_db_id, failed=failed)
+        if sync_state:
+            hold_watermark(sync_state, failed)
+            sync_state.save()
+        finish_session(notion, analyzer, api_metrics)
+        return
 
-    person_cache = {}
+    person_index = build_person_index(notion, personas_db_id) if PRELOAD_PERSON_INDEX else None
+    persistent_cache = open_person_cache()
+    if sync_state and persistent_cache is not None:
+        refresh_person_cache(notion, personas_db_id, persistent_cache, sync_state)
+    journal = open_journal()
+    linker = ContractLinker(notion, analyzer, personas_db_id, person_index, persistent_cache, journal)
 
-    # 2. Iterar sobre cada contrato del lote
-    for idx, contract in enumerate(contracts_to_process):
-        contract_id = contract["id"]
-        properties = contract["properties"]
-        
-        person_name = clean_name(extract_property_value(properties, CONTRATO_NOMBRE_PROP))
-        
-        if not person_name:
-            analyzer.record_skipped_empty_name(contract_id)
-            continue
-            
-        correo = extract_property_value(properties, CONTRATO_CORREO_PROP).strip()
-        sexo = extract_property_value(properties, CONTRATO_SEXO_PROP)
-        
-        logger.info(f"⚙️ ({idx+1}/{total_in_batch}) Procesando: {person_name}")
-        person_page_id = None
-        
-        # 3. Buscar o crear la persona (con caché para eficiencia)
-        if person_name in person_cache:
-            person_page_id = person_cache[person_name]
-            logger.info("   -> Encontrado en caché.")
-            analyzer.record_cache_hit()
-        else:
-            person_page = notion.find_person_by_name(personas_db_id, PERSONA_NOMBRE_PROP, person_name)
-            
-            if person_page:  # La persona ya existe
-                person_page_id = person_page["id"]
-                analyzer.record_existing_person_found(person_name, person_page_id)
-                
-                # 4. Lógica de enriquecimiento: Actualizar si las propiedades están vacías
-                props_to_update = {}
-                person_props = person_page.get("properties", {})
-                
-                if correo and not extract_property_value(person_props, "CORREO"):
-                    props_to_update["CORREO"] = {"email": correo}
-                if sexo and not extract_property_value(person_props, "SEXO"):
-                    props_to_update["SEXO"] = {"select": {"name": sexo}}
-                
-                if props_to_update:
-                    logger.info(f"   -> Actualizando propiedades existentes: {list(props_to_update.keys())}")
-                    if not DRY_RUN:
-                        notion.update_person_properties(person_page_id, props_to_update)
-                    analyzer.record_properties_updated(person_page_id, person_name, list(props_to_update.keys()))
-            
-            else:  # La persona no existe, se debe crear
-                logger.info(f"   -> No encontrado. Creando persona con datos: Correo='{correo}', Sexo='{sexo}'")
-                if not DRY_RUN:
-                    new_person_page = notion.create_person(personas_db_id, PERSONA_NOMBRE_PROP, person_name, correo, sexo)
-                    if new_person_page: person_page_id = new_person_page.get("id")
-                else:
-                    person_page_id = "DRY_RUN_ID"
-                
-                if person_page_id: analyzer.record_new_person_created(person_name, person_page_id)
-            
-            if person_page_id and person_page_id != "DRY_RUN_ID":
-                person_cache[person_name] = person_page_id
-
-        # 5. Enlazar el contrato con la persona
-        if person_page_id:
-            if not DRY_RUN:
-                notion.link_person_to_contract(contract_id, person_page_id)
-            analyzer.record_successful_link(contract_id, person_name, person_page_id)
-        else:
-            analyzer.record_error(contract_id, person_name, "No se pudo encontrar o crear la persona.")
+    # 2. Iterar sobre cada contrato (en paralelo por persona si MAX_CONCURRENCY > 1)
+    try:
+        linker.process_all(contracts_to_process, total_label)
+        # La marca de agua y el checkpoint del journal solo se aplican si el recorrido terminó sin excepciones
+        if sync_state:
+            hold_watermark(sync_state, linker.failed)
+            sync_state.save()
+        if journal is not None: journal.checkpoint()
+    finally:
+        if persistent_cache is not None: persistent_cache.close()
+        if journal is not None: journal.close()
 
     # 6. Finalizar y generar reportes
+    finish_session(notion, analyzer)
+
+def hold_watermark(sync_state: SyncState, failed: dict):
+    """Deja la marca de agua de Contratos en el primer contrato que no se pudo enlazar (contract_id -> last_edited_time).
+
+    La consulta incremental usa `on_or_after`, así que la próxima sincronización lo vuelve a traer.
+    """
+    edited = [timestamp for timestamp in failed.values() if timestamp]
+    if not edited: return
+    sync_state.hold("contratos", min(edited))
+    logger.warning(f"⏪ {len(failed)} contratos no se pudieron enlazar: la próxima sincronización "
+                   f"los vuelve a consultar desde {min(edited)}.")
+
+def run_daemon(notion: NotionService, analyzer: ProcessingAnalyzer, contratos_db_id: str, personas_db_id: str,
+               stop_event: threading.Event = None, max_cycles: int = None):
+    """Modo daemon: consulta los contratos sin enlace en un intervalo adaptativo y los enlaza.
+
+    El cliente, el pool HTTP, el índice de Personas y los cachés se cargan una sola vez.
+    En cada ciclo se aplican primero las personas editadas en Notion desde el anterior
+    (para no completar datos con valores viejos) y luego se procesan los contratos nuevos,
+    con su propia sesión de reportes. Termina con `stop_event` (SIGTERM), Ctrl+C o tras
+    `max_cycles` ciclos. Trabaja en un solo proceso: SHARD_WORKERS no se aplica.
+    """
+    stop_event = stop_event or threading.Event()
+    sync_state = SyncState(SYNC_STATE_FILE) if INCREMENTAL_SYNC else None
+    poller = ContractPoller(notion, contratos_db_id, sync_state.get_watermark("contratos") if sync_state else None)
+    interval = AdaptiveInterval(POLL_MIN_SECONDS, POLL_MAX_SECONDS)
+    linker = open_resident_linker(notion, analyzer, personas_db_id)
+    journal = linker.journal
+    # Notion redondea last_edited_time al minuto: la ventana de personas editadas se solapa un minuto
+    personas_since = notion_timestamp(datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1))
+    logger.info(f"👀 Modo daemon: consultando contratos sin enlace cada {POLL_MIN_SECONDS}-{POLL_MAX_SECONDS}s.")
+    
+    cycles = 0
+    try:
+        while not stop_event.is_set():
+            cycles += 1
+            contracts = None
+            try:
+                polled_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1)
+                edited = notion.query_all_pages(personas_db_id, filter=notion.edited_since_filter(personas_since))
+                refreshed = linker.refresh_persons(edited)
+                if refreshed:
+                    logger.info(f"🔄 {refreshed} personas editadas en Notion actualizadas en caché.")
+                personas_since = notion_timestamp(polled_at)
+                
+                contracts = poller.poll()
+                first_contract = next(contracts, None)
+                if first_contract is not None:
+                    notion.reset_metrics()
+                    analyzer.start_session()
+                    linker.process_all(itertools.chain([first_contract], contracts))
+                    # La marca ya pasó a los contratos que fallaron: se reintentan en la próxima consulta
+                    poller.retry(linker.failed)
+                    if sync_state:
+                        sync_state.advance("contratos", poller.since)
+                        hold_watermark(sync_state, poller.retrying)
+                        sync_state.save()
+                    if journal is not None: journal.checkpoint()
+                    finish_session(notion, analyzer)
+            except Exception as e:
+                # Un ciclo fallido (red, API) no detiene el daemon: se reintenta con el intervalo creciente
+                logger.exception(f"❌ Error en el ciclo {cycles} del modo daemon: {e}")
+                if contracts is not None: poller.rollback()
+                poller.found = 0
+            finally:
+                linker.failed.clear()
+            wait = interval.next(poller.found)
+            if max_cycles is not None and cycles >= max_cycles: break
+            logger.debug(f"⏳ {poller.found} contratos nuevos; próxima consulta en {wait:.0f}s.")
+            stop_event.wait(wait)
+    except KeyboardInterrupt:
+        logger.info("⏹️ Modo daemon detenido por el usuario.")
+    finally:
+        close_resident_linker(linker)
+    logger.info(f"⏹️ Modo daemon finalizado tras {cycles} consultas.")
+
+def run_webhook(notion: NotionService, analyzer: ProcessingAnalyzer, contratos_db_id: str, personas_db_id: str,
+                stop_event: threading.Event = None, server: WebhookServer = None):
+    """Modo webhook: enlaza los contratos que Notion notifica, sin consultas periódicas a la BD.
+
+    Un WebhookServer local recibe los eventos de Contratos y Personas (suscripciones de la
+    integración o automatizaciones "Send webhook") y los agrupa por página durante
+    WEBHOOK_DEDUP_SECONDS. Cada grupo vencido pasa por el mismo enlazador residente que el
+    modo daemon. Termina con `stop_event` (SIGTERM) o Ctrl+C.
+    """
+    from webhook import EventBuffer, WebhookServer
+    stop_event = stop_event or threading.Event()
+    if server is None:
+        server = WebhookServer((WEBHOOK_HOST, WEBHOOK_PORT), EventBuffer(WEBHOOK_DEDUP_SECONDS),
+                               [contratos_db_id, personas_db_id], os.getenv("NOTION_WEBHOOK_SECRET"))
+    linker = open_resident_linker(notion, analyzer, personas_db_id)
+    threading.Thread(target=server.serve_forever, name="webhook-server", daemon=True).start()
+    logger.info(f"📬 Modo webhook: esperando eventos de Notion en {server.url}.")
+    try:
+        while not stop_event.wait(max(0.01, server.buffer.window / 4)):
+            events = server.buffer.due()
+            if not events: continue
+            try:
+                ingest_webhook_events(notion, analyzer, linker, server.buffer, events, contratos_db_id, personas_db_id)
+            except Exception as e:
+                logger.exception(f"❌ Error procesando {len(events)} eventos de webhook: {e}")
+    except KeyboardInterrupt:
+        logger.info("⏹️ Modo webhook detenido por el usuario.")
+    finally:
+        server.shutdown()
+        server.server_close()
+        close_resident_linker(linker)
+    logger.info(f"⏹️ Modo webhook finalizado: {dict(server.buffer.stats)}.")
+
+def ingest_webhook_events(notion: NotionService, analyzer: ProcessingAnalyzer, linker: ContractLinker,
+                          buffer: EventBuffer, events: list, contratos_db_id: str, personas_db_id: str) -> int:
+    """Enlaza los contratos sin enlace de un grupo de eventos; devuelve cuántos se procesaron.
+
+    Solo se leen las páginas cuyo evento no las trae completas. Las personas editadas se
+    aplican antes a los cachés, y los contratos procesados abren la ventana de eco para
+    ignorar el evento que genera el propio enlace. Los que fallaron se vacían de
+    `linker.failed` y vuelven una vez a la cola para releerlos y reintentarlos.
+    """
+    from webhook import normalize_id
+    missing = [page_id for page_id, page in events if page is None]
+    fetched = dict(zip(missing, notion.run_concurrently(notion.get_page, missing)))
+    contracts, persons = [], []
+    for page_id, page in events:
+        page = page or fetched.get(page_id)
+        if not page or page.get("archived") or page.get("in_trash"): continue
+        parent = normalize_id((page.get("parent") or {}).get("database_id"))
+        if parent == normalize_id(personas_db_id):
+            persons.append(page)
+        elif parent == normalize_id(contratos_db_id) and inline_relation_ids(page, CONTRATO_RELACION_PROP) == []:
+            contracts.append((page_id, page))
+    if persons:
+        logger.info(f"🔄 {linker.refresh_persons(persons)} personas editadas en Notion actualizadas en caché.")
+    if not contracts:
+        return 0
+    logger.info(f"📬 {len(contracts)} contratos sin enlace recibidos por webhook.")
+    notion.reset_metrics()
+    analyzer.start_session()
+    try:
+        linker.process_all([page for _, page in contracts], len(contracts))
+        if linker.journal is not None: linker.journal.checkpoint()
+    finally:
+        failed = [page_id for page_id, page in contracts if page["id"] in linker.failed]
+        linker.failed.clear()
+        buffer.mark_done(page_id for page_id, _ in contracts if page_id not in failed)
+        exhausted = buffer.requeue(failed)
+    if len(failed) > len(exhausted):
+        logger.info(f"🔁 {len(failed) - len(exhausted)} contratos con enlace fallido vuelven a la cola del webhook.")
+    if exhausted:
+        logger.warning(f"⚠️ {len(exhausted)} contratos siguen sin enlace tras reintentarlos: se enlazarán con la "
+                       f"próxima consulta (modo normal o daemon) o al volver a editarlos en Notion.")
+    finish_session(notion, analyzer)
+    return len(contracts)
+
+def open_resident_linker(notion: NotionService, analyzer: ProcessingAnalyzer, personas_db_id: str) -> ContractLinker:
+    """Crea el enlazador de los modos daemon y webhook, con índice, caché y journal abiertos mientras dure."""
+    person_index = build_person_index(notion, personas_db_id) if PRELOAD_PERSON_INDEX else None
+    return ContractLinker(notion, analyzer, personas_db_id, person_index, open_person_cache(), open_journal())
+
+def close_resident_linker(linker: ContractLinker):
+    if linker.persistent_cache is not None: linker.persistent_cache.close()
+    if linker.journal is not None: linker.journal.close()
+
+def open_person_cache(commit_every: int = 100):
+    """Abre el caché persistente de personas, o None si PERSON_CACHE_FILE no está configurado."""
+    if not PERSON_CACHE_FILE: return None
+    return PersistentPersonCache(PERSON_CACHE_FILE, PERSON_CACHE_TTL_DAYS, PERSON_CACHE_MAX_ENTRIES, commit_every)
+
+def open_journal(shard: int = None):
+    """Abre el journal de escrituras (si está configurado) e informa si se reanuda una ejecución.
+
+    Cada worker de shard usa su propio archivo (JOURNAL_FILE + ".shardN").
+    """
+    if not JOURNAL_FILE: return None
+    journal = WriteAheadJournal(JOURNAL_FILE if shard is None else shard_path(JOURNAL_FILE, shard))
+    if journal.created or journal.linked or journal.pending:
+        logger.info(f"♻️ Reanudando ejecución interrumpida: {len(journal.created)} personas creadas, "
+                    f"{len(journal.linked)} enlaces completados, {len(journal.pending)} operaciones sin confirmar.")
+    return journal
+
+def run_sharded(notion: NotionService, analyzer: ProcessingAnalyzer, contracts, personas_db_id: str,
+                workers: int = None, context=None, failed: dict = None) -> dict:
+    """Modo coordinador: reparte los contratos entre `workers` procesos por hash del nombre.
+
+    Cada worker tiene su propio NotionService (token de NOTION_API_KEYS y su parte del rate),
+    journal y caché de sesión. Como cada nombre pertenece a un solo shard, ninguna persona
+    se busca ni se crea en dos procesos. Los eventos de los workers se escriben con el
+    ReportWriter del coordinador y sus contadores se suman en `analyzer`. Devuelve las
+    métricas de la API de todos los procesos y deja en `failed` los contratos que no se
+    pudieron enlazar; lanza RuntimeError si algún worker falló.
+    """
+    workers = workers or SHARD_WORKERS
+    if context is None:
+        import multiprocessing
+        context = multiprocessing.get_context("spawn")
+    settings = {name: value for name, value in globals().items() if name.isupper()}
+    writer = analyzer.report_writer
+    event_kinds = [kind for kind in ReportWriter.EVENT_FIELDS if writer is not None and writer.wants(kind)]
+    events = context.Queue(maxsize=10000) if event_kinds else None
+    results = context.Queue()
+    tokens = assign_tokens(workers, api_tokens())
+    logger.info(f"🧩 Repartiendo contratos entre {workers} workers con {len({t for t, _ in tokens})} tokens.")
+    
+    queues, processes = [], []
+    for shard, (token, rate_share) in enumerate(tokens):
+        contract_queue = context.Queue(maxsize=4)
+        process = context.Process(target=shard_worker, name=f"shard-{shard}", args=(
+            shard, token, rate_share, personas_db_id, contract_queue, events, event_kinds, results, settings))
+        process.start()
+        queues.append(contract_queue)
+        processes.append(process)
+    relay = None
+    if events is not None:
+        def relay_events():
+            for kind, values in iter(events.get, None):
+                writer.write(kind, *values)
+        relay = threading.Thread(target=relay_events, name="shard-events", daemon=True)
+        relay.start()
+    
+    distributed = Counter()
+    buffers = [[] for _ in range(workers)]
+    try:
+        for contract in contracts:
+            name = clean_name(extract_property_value(contract["properties"], CONTRATO_NOMBRE_PROP))
+            shard = shard_for(name, workers)
+            buffers[shard].append(contract)
+            distributed[shard] += 1
+            if len(buffers[shard]) >= WRITE_BATCH_SIZE:
+                put_while_alive(queues[shard], buffers[shard], processes[shard])
+                buffers[shard] = []
+        for shard, buffer in enumerate(buffers):
+            if buffer: put_while_alive(queues[shard], buffer, processes[shard])
+    finally:
+        # Aun si la lectura falla, cada worker termina lo que recibió y entrega su reporte
+        for contract_queue, process in zip(queues, processes):
+            if process.is_alive(): put_while_alive(contract_queue, None, process)
+        reports = collect_shard_reports(results, processes)
+        for process in processes:
+            process.join()
+        if relay is not None:
+            events.put(None)
+            relay.join()
+    
+    api_metrics = dict(notion.get_api_metrics())
+    for shard in range(workers):
+        report = reports.get(shard)
+        if report is None: continue
+        analyzer.merge_stats(report['counters'], report['recent_errors'])
+        if failed is not None: failed.update(report['failed'])
+        api_metrics.update({f"w{shard} {endpoint}": m for endpoint, m in report['api_metrics'].items()})
+        logger.info(f"🧩 Shard {shard}: {distributed[shard]} contratos, "
+                    f"{report['counters'].get('successful_links', 0)} enlaces.")
+    failed = [shard for shard in range(workers) if shard not in reports or reports[shard]['error']]
+    if failed:
+        raise RuntimeError(f"Los shards {failed} no terminaron correctamente; vuelve a ejecutar para reanudarlos.")
+    return api_metrics
+
+def collect_shard_reports(results, processes: list) -> dict:
+    """Recibe el reporte final de cada worker; deja de esperar si ya no queda ninguno vivo."""
+    reports = {}
+    while len(reports) < len(processes):
+        try:
+            report = results.get(timeout=1.0)
+            reports[report['shard']] = report
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes) and results.empty():
+                break
+    return reports
+
+def shard_worker(shard: int, token: str, rate_share: int, personas_db_id: str, contracts, events,
+                 event_kinds: list, results, settings: dict):
+    """Proceso worker: enlaza los contratos de su shard que le envía el coordinador."""
+    globals().update(settings)  # Con "spawn" el módulo se reimporta: se aplica la configuración del coordinador
+    report = {'shard': shard, 'error': None}
+    reader = QueueReader(contracts)
+    snapshot = SnapshotStore(SNAPSHOT_FILE, commit_every=1) if SNAPSHOT_FILE else None
+    notion = build_notion_service(snapshot, auth=token, rate_share=rate_share)
+    analyzer = ProcessingAnalyzer(QueueReportWriter(events, event_kinds) if events is not None else None)
+    persistent_cache = journal = linker = None
+    try:
+        person_index = build_person_index(notion, personas_db_id) if PRELOAD_PERSON_INDEX else None
+        # Cachés y snapshot compartidos entre procesos: se confirma cada escritura para no bloquear a los demás
+        persistent_cache = open_person_cache(commit_every=1)
+        journal = open_journal(shard)
+        linker = ContractLinker(notion, analyzer, personas_db_id, person_index, persistent_cache, journal)
+        linker.process_all(reader)
+        if journal is not None: journal.checkpoint()
+    except Exception as e:
+        logger.exception(f"❌ Shard {shard}: error procesando contratos: {e}")
+        report['error'] = str(e)
+        reader.drain()
+    finally:
+        if persistent_cache is not None: persistent_cache.close()
+        if journal is not None: journal.close()
+        if snapshot is not None: snapshot.close()
+        notion.close()
+    report.update(counters=analyzer.counters(), recent_errors=list(analyzer.recent_errors),
+                  api_metrics=notion.get_api_metrics(), failed=linker.failed if linker is not None else {})
+    results.put(report)
+
+def run_plan(notion: NotionService, analyzer: ProcessingAnalyzer, personas_db_id: str):
+    """Modo aplicar: ejecuta las escrituras de PLAN_FILE sin volver a consultar las BD."""
+    planner, person_ids = read_link_plan(PLAN_FILE)
+    logger.info(f"📝 Aplicando {PLAN_FILE}: {len(planner.creates)} creaciones, {len(planner.updates)} actualizaciones, "
+                f"{len(planner.links)} enlaces.")
+    if not planner.links and not planner.updates:
+        logger.info("🎉 El plan no tiene escrituras pendientes.")
+        return
+    analyzer.start_session()
+    persistent_cache = open_person_cache()
+    journal = open_journal()
+    linker = ContractLinker(notion, analyzer, personas_db_id, persistent_cache=persistent_cache, journal=journal)
+    try:
+        linker.apply_plan(planner, person_ids)
+        if journal is not None: journal.checkpoint()
+    finally:
+        if persistent_cache is not None: persistent_cache.close()
+        if journal is not None: journal.close()
+    finish_session(notion, analyzer)
+
+def finish_session(notion: NotionService, analyzer: ProcessingAnalyzer, api_metrics: dict = None):
+    """Cierra la sesión y genera los reportes de consola, almacén SQLite (o CSV y tabla) y métricas."""
     analyzer.end_session()
+    analyzer.set_api_metrics(api_metrics or notion.get_api_metrics())
+    pool = notion.get_connection_pool_stats()
+    if pool.get('requests'):
+        logger.info(f"🔌 Conexiones HTTP: {pool['connections_opened']} abiertas para {pool['requests']} peticiones "
+                    f"({pool['reuse_ratio']:.0%} reutilizadas, {', '.join(pool['http_versions'])}).")
     analyzer.generate_console_report()
     analyzer.export_cumulative_reports()
-    analyzer.save_session_table_report()
+    if LEGACY_REPORT_FILES or not REPORT_DB_FILE:
+        analyzer.save_session_table_report()
+    analyzer.record_session()
+    if EXPORT_METRICS_JSON:
+        analyzer.export_metrics_json()
     
     logger.info("✅ Proceso de lote finalizado.")
 
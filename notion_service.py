@@ -1,70 +1,438 @@
 import os
 import time
+import heapq
 import logging
-from notion_client import Client, APIResponseError
+import itertools
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from schema_cache import SchemaCache
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Indica si el error de la API corresponde a un 429 (rate limited)."""
+    if getattr(error, "status", None) == 429 or getattr(error, "code", None) == "rate_limited":
+        return True
+    return "rate limit" in str(error).lower() or "429" in str(error)
+
+def get_retry_after(error: Exception):
+    """Devuelve los segundos indicados en la cabecera Retry-After, o None si no viene."""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+def endpoint_name(api_call) -> str:
+    """Nombre legible del endpoint de una llamada, p. ej. 'databases.query'."""
+    owner = getattr(api_call, "__self__", None)
+    name = getattr(api_call, "__name__", "call")
+    if owner is None: return name
+    return f"{type(owner).__name__.replace('Endpoint', '').lstrip('_').lower()}.{name}"
+
+class ApiMetrics:
+    """Métricas por endpoint de las llamadas a la API: conteos, reintentos, esperas e histograma de latencia."""
+    BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint: str, latency: float, limiter_wait: float, retries: int, throttled: int, failed: bool):
+        """Registra una llamada completa (todos sus intentos) a un endpoint."""
+        latency_ms = latency * 1000
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'throttled': 0,
+                'latency_total': 0.0, 'latency_max': 0.0, 'limiter_wait_total': 0.0,
+                'histogram': [0] * len(self.BUCKETS_MS),
+            })
+            stats['calls'] += 1
+            stats['errors'] += int(failed)
+            stats['retries'] += retries
+            stats['throttled'] += throttled
+            stats['latency_total'] += latency
+            stats['latency_max'] = max(stats['latency_max'], latency)
+            stats['limiter_wait_total'] += limiter_wait
+            bucket = next(i for i, upper in enumerate(self.BUCKETS_MS) if latency_ms <= upper)
+            stats['histogram'][bucket] += 1
+
+    def _percentile_ms(self, histogram: list, p: float, maximum_ms: float) -> float:
+        """Estima el percentil como el límite superior del bucket que lo contiene.
+
+        El último bucket no tiene límite: ahí se usa la latencia máxima observada, para que
+        el valor siga siendo finito (JSON válido).
+        """
+        target = sum(histogram) * p / 100
+        cumulative = 0
+        for upper, count in zip(self.BUCKETS_MS, histogram):
+            cumulative += count
+            if count and cumulative >= target:
+                return upper if upper != float("inf") else maximum_ms
+        return 0.0
+
+    def reset(self):
+        """Descarta las métricas acumuladas."""
+        with self.lock:
+            self.endpoints = {}
+
+    def snapshot(self) -> dict:
+        """Devuelve una copia serializable (JSON) de las métricas por endpoint."""
+        with self.lock:
+            result = {}
+            for endpoint, stats in self.endpoints.items():
+                labels = [f"<={int(upper)}ms" if upper != float("inf") else f">{int(self.BUCKETS_MS[-2])}ms"
+                          for upper in self.BUCKETS_MS]
+                maximum_ms = round(stats['latency_max'] * 1000, 2)
+                result[endpoint] = {
+                    'calls': stats['calls'], 'errors': stats['errors'],
+                    'retries': stats['retries'], 'throttled': stats['throttled'],
+                    'latency_avg_ms': round(stats['latency_total'] * 1000 / stats['calls'], 2),
+                    'latency_p50_ms': self._percentile_ms(stats['histogram'], 50, maximum_ms),
+                    'latency_p99_ms': self._percentile_ms(stats['histogram'], 99, maximum_ms),
+                    'latency_max_ms': maximum_ms,
+                    'api_time_s': round(stats['latency_total'], 3),
+                    'limiter_wait_s': round(stats['limiter_wait_total'], 3),
+                    'histogram': dict(zip(labels, stats['histogram'])),
+                }
+            return result
 
 class RateLimiter:
-    """Clase para manejar el rate limiting de la API de Notion."""
-    def __init__(self, requests_per_second=2.5):
-        self.min_interval = 1.0 / requests_per_second
-        self.last_request_time = 0
+    """Token bucket thread-safe compartido por todas las llamadas a la API de Notion.
+
+    En modo adaptativo ajusta el rate según la respuesta de la API: lo reduce de forma
+    multiplicativa ante un 429 y lo sube de forma aditiva tras una racha de éxitos.
+    """
+    def __init__(self, requests_per_second=2.5, burst=1, adaptive=False, min_rate=None, max_rate=None,
+                 decrease_factor=0.5, increase_step=None, increase_after=20):
+        self.configured_rate = requests_per_second
+        self.requests_per_second = requests_per_second
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+        self.adaptive = adaptive
+        # Por defecto el piso y el paso escalan con el rate configurado (0.5 y 0.1 req/s a 2.5 req/s)
+        self.min_rate = min(min_rate or requests_per_second * 0.2, requests_per_second)
+        self.max_rate = max(max_rate or requests_per_second, requests_per_second)
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step or requests_per_second * 0.04
+        self.increase_after = increase_after
+        self.consecutive_successes = 0
+        self.throttle_events = 0
     
     def wait_if_needed(self):
-        """Espera si es necesario para respetar el rate limit."""
-        time_since_last = time.time() - self.last_request_time
-        if time_since_last < self.min_interval:
-            time.sleep(self.min_interval - time_since_last)
-        self.last_request_time = time.time()
+        """Reserva un token y espera lo necesario para respetar el rate limit.
+
+        La reserva se hace bajo el lock y la espera fuera de él, de modo que varios
+        workers se reparten los turnos sin superar `requests_per_second` en régimen.
+        Si hay una pausa activa (Retry-After), `last_refill` está en el futuro y todas
+        las reservas esperan a que termine.
+        """
+        wait_time = self.reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+    def reserve(self) -> float:
+        """Reserva un token sin dormir; devuelve los segundos que hay que esperar para usarlo."""
+        with self.lock:
+            now = time.monotonic()
+            elapsed = max(0.0, now - self.last_refill)
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.requests_per_second)
+            self.last_refill = max(now, self.last_refill)
+            self.tokens -= 1
+            wait_time = self.last_refill - now
+            if self.tokens < 0:
+                wait_time += -self.tokens / self.requests_per_second
+        return wait_time
+
+    def record_success(self):
+        """Registra una llamada exitosa; tras `increase_after` seguidas sube el rate."""
+        if not self.adaptive: return
+        with self.lock:
+            self.consecutive_successes += 1
+            if self.consecutive_successes >= self.increase_after:
+                self.consecutive_successes = 0
+                self.requests_per_second = min(self.max_rate, self.requests_per_second + self.increase_step)
+
+    def record_throttle(self, retry_after: float):
+        """Registra un 429: pausa a todos los workers `retry_after` segundos y baja el rate.
+
+        El rate baja una sola vez por pausa: los 429 de las llamadas que ya estaban en vuelo
+        llegan mientras la pausa del primero sigue activa y solo la extienden.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.throttle_events += 1
+            self.consecutive_successes = 0
+            if self.adaptive and self.last_refill <= now:
+                self.requests_per_second = max(self.min_rate, self.requests_per_second * self.decrease_factor)
+            self.last_refill = max(self.last_refill, now + retry_after)
+            self.tokens = min(self.tokens, 0.0)
+
+RELATION_PAGE_SIZE = 25  # Relaciones que Notion incluye en la página; el resto se pagina
+
+def inline_relation_ids(page: dict, property_name: str):
+    """IDs de una relación tal como vienen en la página, o None si no hay página o Notion la truncó (has_more).
+
+    Las consultas devuelven todas las propiedades de cada página: si falta, la relación está vacía.
+    """
+    if page is None: return None
+    prop = page.get("properties", {}).get(property_name) or {}
+    if prop.get("has_more"): return None
+    return [item["id"] for item in prop.get("relation") or []]
+
+PRIORITY_RESOLVE = 0  # Consultas, búsquedas y creaciones: desbloquean los enlaces pendientes
+PRIORITY_LINK = 1
+PRIORITY_ENRICH = 2  # Actualizaciones de correo/sexo: no bloquean nada
+
+class CallScheduler:
+    """Reparte los turnos de llamada a la API por prioridad sobre el RateLimiter compartido.
+
+    Cada llamada pide turno con una prioridad (menor = antes; FIFO dentro de la misma).
+    Solo la primera de la cola reserva el siguiente token, así que una búsqueda que llega
+    tarde pasa delante de las actualizaciones que ya esperaban, y nunca hay más de
+    `max_in_flight` llamadas en curso. Un reintento espera su backoff fuera de la cola:
+    mientras tanto no ocupa turno, token ni lugar en vuelo.
+    """
+
+    def __init__(self, rate_limiter: RateLimiter, max_in_flight: int = 1):
+        self.rate_limiter = rate_limiter
+        self.max_in_flight = max(1, max_in_flight)
+        self.condition = threading.Condition()
+        self.queue = []
+        self.sequence = itertools.count()
+        self.in_flight = 0
+        self.dispatching = False
+        self.granted = Counter()
+
+    def acquire(self, priority: int = PRIORITY_RESOLVE, not_before: float = 0.0) -> float:
+        """Espera el turno y el token (y antes, si se indica, hasta `not_before`).
+
+        Devuelve los segundos esperados en la cola y en el limitador, sin contar el backoff.
+        """
+        delay = not_before - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        started = time.monotonic()
+        with self.condition:
+            entry = (priority, next(self.sequence))
+            heapq.heappush(self.queue, entry)
+            while self.queue[0] != entry or self.dispatching or self.in_flight >= self.max_in_flight:
+                self.condition.wait()
+            heapq.heappop(self.queue)
+            self.dispatching = True
+        try:
+            self.rate_limiter.wait_if_needed()
+        finally:
+            with self.condition:
+                self.dispatching = False
+                self.in_flight += 1
+                self.granted[priority] += 1
+                self.condition.notify_all()
+        return time.monotonic() - started
+
+    def release(self):
+        """Libera el lugar en vuelo de una llamada terminada."""
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
 
 class NotionService:
     """Servicio para interactuar con la API de Notion con manejo robusto de errores."""
     
-    def __init__(self, contract_relation_prop, max_retries=3, retry_delay=2, requests_per_second=2.5):
-        self.client = Client(auth=os.getenv("NOTION_API_KEY"))
+    def __init__(self, contract_relation_prop, max_retries=3, retry_delay=2, requests_per_second=2.5,
+                 burst=1, max_concurrency=1, adaptive_rate=False, max_requests_per_second=None, client=None,
+                 snapshot=None, auth=None, http_pool=None, schema_cache=None):
+        # notion_client (y con él httpx) se importa al crear el servicio, no al importar el módulo:
+        # una ejecución que termina antes (sin trabajo pendiente) no paga su carga
+        from notion_client import Client, APIResponseError
+        self.api_error = APIResponseError
+        auth = auth or os.getenv("NOTION_API_KEY")
+        # HttpConnectionPool opcional: conexiones keep-alive compartidas, HTTP/2 y timeouts por endpoint
+        self.http_pool = http_pool if client is None else None
+        self.client = client or (http_pool.notion_client(auth) if http_pool is not None else Client(auth=auth))
+        self.snapshot = snapshot  # SnapshotStore opcional: sirve las consultas de las BD que cubre
+        self.schema_cache = schema_cache or SchemaCache()
+        self.schema_lock = threading.Lock()
+        self.schemas_fetched = set()  # BD cuyo esquema se pidió a la API en esta ejecución
         self.contract_relation_prop = contract_relation_prop
         self.max_retries = max_retries
         self.retry_delay = retry_delay
-        self.rate_limiter = RateLimiter(requests_per_second)
+        self.rate_limiter = RateLimiter(requests_per_second, burst, adaptive=adaptive_rate,
+                                        max_rate=max_requests_per_second)
+        self.max_concurrency = max(1, max_concurrency)
+        self.scheduler = CallScheduler(self.rate_limiter, self.max_concurrency)
+        self.metrics = ApiMetrics()
         self.logger = logging.getLogger(__name__)
 
-    def _retry_api_call(self, api_call, *args, **kwargs):
-        """Ejecuta una llamada a la API con reintentos automáticos y rate limiting."""
-        for attempt in range(self.max_retries):
-            try:
-                self.rate_limiter.wait_if_needed()
-                return api_call(*args, **kwargs)
-            except APIResponseError as e:
-                self.logger.warning(f"Intento {attempt + 1}/{self.max_retries} falló: {e}")
-                if "rate limit" in str(e).lower() or "429" in str(e):
+    def run_concurrently(self, func, items):
+        """Ejecuta `func` sobre cada item con hasta `max_concurrency` llamadas a la API en vuelo.
+
+        Todas las tareas comparten el mismo RateLimiter, así que la latencia de red se
+        solapa con la espera del limitador sin superar el rate configurado. Hay el doble de
+        hilos que llamadas en vuelo (las limita el CallScheduler): una tarea que espera el
+        backoff de un reintento no deja a las demás sin turno.
+        """
+        items = list(items)
+        if self.max_concurrency <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency * 2, len(items))) as executor:
+            return list(executor.map(func, items))
+
+    def _retry_api_call(self, api_call, *args, _priority: int = PRIORITY_RESOLVE, **kwargs):
+        """Ejecuta una llamada a la API con reintentos automáticos, prioridad y rate limiting.
+
+        El turno lo da el CallScheduler según `_priority`; un intento fallido vuelve a la
+        cola cuando vence su backoff en vez de reintentar de inmediato. Cada llamada queda
+        registrada en `self.metrics`: latencia de red (suma de los intentos), tiempo de
+        espera por turno y token, reintentos y respuestas 429.
+        """
+        latency = limiter_wait = 0.0
+        throttled = 0
+        failed = True
+        attempt = 0
+        not_before = 0.0
+        try:
+            for attempt in range(self.max_retries):
+                limiter_wait += self.scheduler.acquire(_priority, not_before)
+                started = time.perf_counter()
+                try:
+                    result = api_call(*args, **kwargs)
+                    self.rate_limiter.record_success()
+                    failed = False
+                    return result
+                except self.api_error as e:
+                    self.logger.warning(f"Intento {attempt + 1}/{self.max_retries} falló: {e}")
                     wait_time = self.retry_delay * (2 ** attempt)
-                    self.logger.warning(f"Rate limit detectado, esperando {wait_time} segundos...")
-                    time.sleep(wait_time)
-                elif attempt >= self.max_retries - 1:
-                    self.logger.error("Todos los reintentos fallaron para la operación.")
-                    raise
-            except Exception as e:
-                self.logger.error(f"Error inesperado en la API: {e}"); raise
+                    if is_rate_limit_error(e):
+                        throttled += 1
+                        retry_after = get_retry_after(e)
+                        wait_time = retry_after if retry_after is not None else wait_time
+                        # La pausa la aplica el limitador compartido: el siguiente turno
+                        # de cualquier worker espera hasta que venza el Retry-After.
+                        self.rate_limiter.record_throttle(wait_time)
+                        self.logger.warning(f"Rate limit detectado, esperando {wait_time} segundos "
+                                            f"(rate efectivo: {self.rate_limiter.requests_per_second:.2f} req/s)...")
+                    if attempt >= self.max_retries - 1:
+                        self.logger.error("Todos los reintentos fallaron para la operación.")
+                        raise
+                    not_before = time.monotonic() + wait_time
+                except Exception as e:
+                    self.logger.error(f"Error inesperado en la API: {e}"); raise
+                finally:
+                    latency += time.perf_counter() - started
+                    self.scheduler.release()
+        finally:
+            self.metrics.record(endpoint_name(api_call), latency, limiter_wait, attempt, throttled, failed)
     
-    def get_unlinked_contracts(self, db_id: str, batch_size: int):
-        """Obtiene un lote de contratos donde la relación está vacía."""
+    def get_api_metrics(self) -> dict:
+        """Métricas por endpoint de las llamadas realizadas (serializables a JSON)."""
+        return self.metrics.snapshot()
+
+    def reset_metrics(self):
+        """Reinicia las métricas de la API y del pool HTTP, p. ej. entre ciclos del modo daemon."""
+        self.metrics.reset()
+        if self.http_pool is not None: self.http_pool.reset_stats()
+
+    @staticmethod
+    def edited_since_filter(since: str, base_filter: dict = None):
+        """Combina un filtro con la condición last_edited_time >= since (si hay marca de agua)."""
+        if not since: return base_filter
+        edited = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since}}
+        return {"and": [base_filter, edited]} if base_filter else edited
+
+    def _query_database(self, **query):
+        """Ejecuta databases.query en el snapshot local si cubre la BD; si no, en la API."""
+        if self.snapshot is not None and self.snapshot.covers(query["database_id"]):
+            try:
+                return self.snapshot.query(**query)
+            except ValueError as e:
+                self.logger.debug(f"{e}; consultando la API.")
+        return self._retry_api_call(self.client.databases.query, **query)
+
+    def query_all_pages(self, db_id: str, filter: dict = None, page_size: int = 100, sorts: list = None):
+        """Recorre todas las páginas de una consulta siguiendo start_cursor/has_more."""
+        query = {"database_id": db_id, "page_size": page_size}
+        if filter: query["filter"] = filter
+        if sorts: query["sorts"] = sorts
+        while True:
+            response = self._query_database(**query)
+            yield from response.get("results", [])
+            if not response.get("has_more") or not response.get("next_cursor"): break
+            query["start_cursor"] = response["next_cursor"]
+
+    def _unlinked_query(self, since: str = None):
+        """Filtro y orden de la consulta de contratos sin enlace (opcionalmente incremental).
+
+        `since=""` pide todos los contratos sin enlace, pero ordenados como en una consulta incremental.
+        """
+        unlinked_filter = {"property": self.contract_relation_prop, "relation": {"is_empty": True}}
+        query = {"filter": self.edited_since_filter(since, unlinked_filter)}
+        if since is not None:
+            # Orden ascendente para que la marca de agua avance sin saltarse contratos
+            query["sorts"] = [{"timestamp": "last_edited_time", "direction": "ascending"}]
+        return query
+
+    def get_unlinked_contracts(self, db_id: str, batch_size: int, since: str = None):
+        """Obtiene un lote de contratos donde la relación está vacía (editados desde `since`, si se indica)."""
         self.logger.info(f"Consultando lote de {batch_size} contratos sin enlace...")
         try:
-            response = self._retry_api_call(
-                self.client.databases.query,
+            response = self._query_database(
                 database_id=db_id,
-                filter={"property": self.contract_relation_prop, "relation": {"is_empty": True}},
-                page_size=batch_size
+                page_size=batch_size,
+                **self._unlinked_query(since)
             )
             return response.get("results", [])
         except Exception as e:
             self.logger.error(f"Fallo crítico al consultar contratos: {e}"); return []
 
+    def iter_unlinked_contracts(self, db_id: str, page_size: int = 100, since: str = None):
+        """Genera todos los contratos sin enlace, entregándolos a medida que llega cada página.
+
+        Se recorre en una sola pasada con paginación por clave: los contratos se piden ordenados
+        por last_edited_time y cada página es una consulta nueva desde la fecha del último
+        entregado, así que los que se enlazan y salen del filtro ``is_empty`` no desplazan el
+        cursor. Solo se recuerdan los IDs entregados con esa fecha (Notion la redondea al
+        minuto); una página sin contratos nuevos se salta con su cursor. Un error de la API a
+        mitad del recorrido se registra y se relanza, para que quien consume no lo tome por
+        el final de los contratos pendientes.
+        """
+        self.logger.info(f"Consultando todos los contratos sin enlace (páginas de {page_size})...")
+        boundary, at_boundary, cursor = since or "", set(), None
+        try:
+            while True:
+                query = {"database_id": db_id, "page_size": page_size, **self._unlinked_query(boundary)}
+                if cursor: query["start_cursor"] = cursor
+                response = self._query_database(**query)
+                delivered = 0
+                for contract in response.get("results", []):
+                    edited = contract.get("last_edited_time") or ""
+                    if edited > boundary:
+                        boundary, at_boundary = edited, set()
+                    elif contract["id"] in at_boundary:
+                        continue
+                    at_boundary.add(contract["id"])
+                    delivered += 1
+                    yield contract
+                if not response.get("has_more") or not response.get("next_cursor"): break
+                cursor = None if delivered else response["next_cursor"]
+        except Exception as e:
+            self.logger.error(f"Fallo crítico al recorrer contratos: {e}")
+            raise
+
+    def get_page(self, page_id: str):
+        """Lee una página completa (p. ej. la de un evento de webhook); None si falla."""
+        try:
+            return self._retry_api_call(self.client.pages.retrieve, page_id=page_id)
+        except Exception as e:
+            self.logger.error(f"No se pudo leer la página {page_id[:8]}...: {e}"); return None
+
     def find_person_by_name(self, db_id: str, name_prop: str, name: str):
         """Busca una persona por nombre y devuelve el objeto completo de la página."""
         self.logger.debug(f"Buscando persona: {name}")
         try:
-            response = self._retry_api_call(
-                self.client.databases.query,
+            response = self._query_database(
                 database_id=db_id,
                 filter={"property": name_prop, "title": {"equals": name}}
             )
@@ -83,11 +451,12 @@ class NotionService:
         self.logger.info(f"Creando nueva persona: {name} con propiedades {list(properties.keys())}")
         try:
             new_person = self._retry_api_call(
-                self.client.pages.create,
+                self.client.pages.create, _priority=PRIORITY_RESOLVE,
                 parent={"database_id": db_id},
                 properties=properties
             )
             self.logger.info(f"✅ Persona creada exitosamente: {name}")
+            if self.snapshot is not None: self.snapshot.put_page(db_id, new_person)
             return new_person
         except Exception as e:
             self.logger.error(f"❌ Fallo crítico al crear persona '{name}': {e}"); return None
@@ -100,45 +469,158 @@ class NotionService:
         
         self.logger.info(f"Actualizando propiedades {list(properties_to_update.keys())} para la página {page_id[:8]}...")
         try:
-            self._retry_api_call(
-                self.client.pages.update,
+            response = self._retry_api_call(
+                self.client.pages.update, _priority=PRIORITY_ENRICH,
                 page_id=page_id,
                 properties=properties_to_update
             )
+            if self.snapshot is not None:
+                self.snapshot.update_properties(page_id, properties_to_update, (response or {}).get("last_edited_time"))
             self.logger.info(f"✅ Propiedades actualizadas para {page_id[:8]}...")
             return True
         except Exception as e:
             self.logger.error(f"❌ Fallo crítico al actualizar propiedades para {page_id}: {e}")
             return False
 
-    def link_person_to_contract(self, contract_page_id: str, person_page_id: str):
-        """Enlaza una persona a un contrato."""
-        self.logger.debug(f"Enlazando contrato {contract_page_id[:8]}... con persona {person_page_id[:8]}...")
+    def get_relation_ids(self, page_id: str, property_name: str, page: dict = None) -> list:
+        """IDs de todas las páginas de una relación.
+
+        Usa la propiedad incluida en `page` (p. ej. el contrato devuelto por la consulta)
+        si viene completa; si Notion la truncó (`has_more`, más de 25 relaciones) o no se
+        pasa la página, la recorre con pages.properties.retrieve de 25 en 25.
+        """
+        ids = inline_relation_ids(page, property_name)
+        if ids is not None: return ids
+        property_id = (page or {}).get("properties", {}).get(property_name, {}).get("id") or property_name
+        ids, cursor = [], None
+        while True:
+            kwargs = {"page_size": RELATION_PAGE_SIZE}
+            if cursor: kwargs["start_cursor"] = cursor
+            response = self._retry_api_call(self.client.pages.properties.retrieve, page_id=page_id,
+                                            property_id=property_id, _priority=PRIORITY_LINK, **kwargs)
+            ids.extend(item["relation"]["id"] for item in response.get("results", []) if item.get("relation"))
+            if not response.get("has_more"):
+                return ids
+            cursor = response.get("next_cursor")
+
+    def with_full_relation(self, page: dict, property_name: str) -> dict:
+        """Devuelve la página con su relación completa; solo llama a la API si Notion la truncó."""
+        prop = page.get("properties", {}).get(property_name) or {}
+        if not prop.get("has_more"): return page
+        ids = self.get_relation_ids(page["id"], property_name, page)
+        full = {**prop, "relation": [{"id": page_id} for page_id in ids], "has_more": False}
+        return {**page, "properties": {**page["properties"], property_name: full}}
+
+    def link_person_to_contract(self, contract_page_id: str, person_page_id: str, current: list = None):
+        """Enlaza una persona a un contrato, conservando las que ya tenía."""
+        return self.add_contract_relations(contract_page_id, [person_page_id], current)
+
+    def add_contract_relations(self, contract_page_id: str, person_page_ids: list, current: list = None):
+        """Agrega personas a la relación de un contrato con una sola escritura.
+
+        `current` es la relación actual si ya se conoce (p. ej. de la página devuelta por la
+        consulta); si no, se lee con `get_relation_ids`. Se escribe la lista entera con los
+        IDs nuevos al final y sin repetir; si no hay ninguno nuevo no se escribe.
+        """
+        self.logger.debug(f"Enlazando contrato {contract_page_id[:8]}... con {len(person_page_ids)} personas")
         try:
-            self._retry_api_call(
-                self.client.pages.update,
-                page_id=contract_page_id,
-                properties={self.contract_relation_prop: {"relation": [{"id": person_page_id}]}}
-            )
-            self.logger.info(f"✅ Enlace exitoso: {contract_page_id[:8]}... -> {person_page_id[:8]}...")
+            if current is None:
+                current = self.get_relation_ids(contract_page_id, self.contract_relation_prop)
+            relation = list(dict.fromkeys([*current, *person_page_ids]))
+            if len(relation) == len(current):
+                self.logger.info(f"✅ Contrato {contract_page_id[:8]}... ya enlazado con esas personas.")
+                return True
+            properties = {self.contract_relation_prop: {"relation": [{"id": page_id} for page_id in relation]}}
+            response = self._retry_api_call(self.client.pages.update, page_id=contract_page_id, properties=properties,
+                                            _priority=PRIORITY_LINK)
+            if self.snapshot is not None:
+                self.snapshot.update_properties(contract_page_id, properties, (response or {}).get("last_edited_time"))
+            added = ", ".join(f"{page_id[:8]}..." for page_id in relation[len(current):])
+            self.logger.info(f"✅ Enlace exitoso: {contract_page_id[:8]}... -> {added}")
             return True
         except Exception as e:
             self.logger.error(f"❌ Fallo crítico al enlazar contrato '{contract_page_id}': {e}"); return False
 
+    def replace_contract_relations(self, contract_page_id: str, replacement: dict):
+        """Reemplaza en la relación de un contrato las personas de `replacement` ({id: id nuevo}).
+
+        La relación se lee en el momento con `get_relation_ids`, así que se conservan los enlaces
+        agregados después de planificar; se escribe sin repetir IDs y solo si algo cambió.
+        """
+        try:
+            current = self.get_relation_ids(contract_page_id, self.contract_relation_prop)
+            relation = list(dict.fromkeys(replacement.get(page_id, page_id) for page_id in current))
+            if relation == current:
+                self.logger.info(f"✅ Contrato {contract_page_id[:8]}... ya reenlazado.")
+                return True
+        except Exception as e:
+            self.logger.error(f"❌ Fallo crítico al leer la relación del contrato '{contract_page_id}': {e}"); return False
+        return self.set_contract_relations(contract_page_id, relation)
+
+    def set_contract_relations(self, contract_page_id: str, person_page_ids: list):
+        """Reemplaza la relación de personas de un contrato por la lista indicada."""
+        self.logger.debug(f"Reemplazando relación de {contract_page_id[:8]}... por {len(person_page_ids)} personas")
+        try:
+            properties = {self.contract_relation_prop: {"relation": [{"id": page_id} for page_id in person_page_ids]}}
+            response = self._retry_api_call(self.client.pages.update, page_id=contract_page_id, properties=properties,
+                                            _priority=PRIORITY_LINK)
+            if self.snapshot is not None:
+                self.snapshot.update_properties(contract_page_id, properties, (response or {}).get("last_edited_time"))
+            self.logger.info(f"✅ Relación actualizada: {contract_page_id[:8]}... -> {len(person_page_ids)} personas")
+            return True
+        except Exception as e:
+            self.logger.error(f"❌ Fallo crítico al actualizar la relación del contrato '{contract_page_id}': {e}"); return False
+
     # --- Métodos de validación y estadísticas ---
+    def get_database_schema(self, db_id: str, refresh: bool = False):
+        """Propiedades de la BD ({nombre: tipo}) desde el caché de esquemas; None si no se pudo obtener.
+
+        Solo llama a databases.retrieve si el esquema no está en caché, venció o se pide `refresh`.
+        """
+        with self.schema_lock:
+            entry = None if refresh else self.schema_cache.get(db_id)
+            if entry is None:
+                try:
+                    database = self._retry_api_call(self.client.databases.retrieve, database_id=db_id)
+                except Exception as e:
+                    self.logger.error(f"No se pudo obtener el esquema de la BD {db_id[:8]}...: {e}"); return None
+                entry = self.schema_cache.put(db_id, database)
+                self.schemas_fetched.add(db_id)
+        return entry['properties']
+
+    def get_property_type(self, db_id: str, property_name: str):
+        """Tipo de una propiedad ('title', 'relation', ...) o None si la BD no la tiene."""
+        schema = self.get_database_schema(db_id)
+        if schema is not None and property_name not in schema and db_id not in self.schemas_fetched:
+            # El esquema en caché puede ser anterior a la propiedad: se vuelve a pedir una vez por ejecución
+            schema = self.get_database_schema(db_id, refresh=True)
+        return (schema or {}).get(property_name)
+
     def validate_database_connection(self, db_id: str):
         self.logger.info(f"Validando conexión a BD: {db_id[:8]}...")
-        try:
-            self._retry_api_call(self.client.databases.retrieve, database_id=db_id)
-            return True
-        except Exception: return False
+        return self.get_database_schema(db_id) is not None
     
     def validate_property_exists(self, db_id: str, property_name: str):
         self.logger.debug(f"Validando propiedad '{property_name}' en BD {db_id[:8]}...")
-        try:
-            db = self._retry_api_call(self.client.databases.retrieve, database_id=db_id)
-            return property_name in db["properties"]
-        except Exception: return False
+        return self.get_property_type(db_id, property_name) is not None
         
     def get_rate_limit_stats(self):
-        return {'requests_per_second': self.rate_limiter.requests_per_second}
\ No newline at end of file
+        return {
+            'requests_per_second': self.rate_limiter.requests_per_second,
+            'configured_requests_per_second': self.rate_limiter.configured_rate,
+            'max_requests_per_second': self.rate_limiter.max_rate,
+            'adaptive': self.rate_limiter.adaptive,
+            'throttle_events': self.rate_limiter.throttle_events,
+            'burst': self.rate_limiter.capacity,
+            'max_concurrency': self.max_concurrency,
+            'calls_by_priority': dict(self.scheduler.granted),
+        }
+
+    def get_connection_pool_stats(self):
+        """Reutilización de conexiones HTTP del pool (vacío si el cliente no usa HttpConnectionPool)."""
+        return self.http_pool.stats() if self.http_pool is not None else {}
+
+    def close(self):
+        """Cierra las conexiones del pool HTTP, si hay uno."""
+        if self.http_pool is not None:
+            self.http_pool.close()
\ No newline at end of file
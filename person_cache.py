@@ -0,0 +1,96 @@
+import sqlite3
+import threading
+import time
+
+class PersistentPersonCache:
+    """Caché en disco nombre -> persona (id, correo, sexo) que sobrevive entre ejecuciones.
+
+    Las entradas expiran por TTL y, si se supera `max_entries`, se descartan las usadas
+    hace más tiempo (LRU). Los cambios se confirman en bloque cada `commit_every` escrituras.
+    """
+
+    def __init__(self, path: str = "person_cache.db", ttl_days: float = 30, max_entries: int = 100000,
+                 commit_every: int = 100):
+        self.ttl_seconds = ttl_days * 86400
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.pending_writes = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS persons (
+                name TEXT PRIMARY KEY, page_id TEXT NOT NULL,
+                correo TEXT NOT NULL DEFAULT '', sexo TEXT NOT NULL DEFAULT '',
+                stored_at REAL NOT NULL, last_used REAL NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_page_id ON persons(page_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_persons_last_used ON persons(last_used)")
+        self.conn.commit()
+
+    def _write(self, sql: str, params: tuple = ()):
+        """Ejecuta una escritura y confirma en bloque cada `commit_every` operaciones."""
+        self.conn.execute(sql, params)
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_every:
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def get(self, name: str):
+        """Devuelve {'id', 'correo', 'sexo'} si hay una entrada vigente para el nombre, o None."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT page_id, correo, sexo, stored_at FROM persons WHERE name = ?", (name,)
+            ).fetchone()
+            if not row: return None
+            if now - row[3] > self.ttl_seconds:
+                self._write("DELETE FROM persons WHERE name = ?", (name,))
+                return None
+            self._write("UPDATE persons SET last_used = ? WHERE name = ?", (now, name))
+        return {'id': row[0], 'correo': row[1], 'sexo': row[2]}
+
+    def put(self, name: str, page_id: str, correo: str = "", sexo: str = ""):
+        """Guarda o reemplaza la persona asociada a un nombre."""
+        now = time.time()
+        with self.lock:
+            self._write(
+                "INSERT OR REPLACE INTO persons (name, page_id, correo, sexo, stored_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (name, page_id, correo or "", sexo or "", now, now)
+            )
+
+    def update(self, name: str, **fields):
+        """Actualiza correo/sexo de una entrada existente (solo los valores no vacíos)."""
+        with self.lock:
+            for column in ("correo", "sexo"):
+                if fields.get(column):
+                    self._write(f"UPDATE persons SET {column} = ? WHERE name = ?", (fields[column], name))
+
+    def invalidate(self, name: str = None, page_id: str = None):
+        """Elimina la entrada por nombre o todas las que apunten a un page_id."""
+        with self.lock:
+            if name is not None:
+                self._write("DELETE FROM persons WHERE name = ?", (name,))
+            if page_id is not None:
+                self._write("DELETE FROM persons WHERE page_id = ?", (page_id,))
+
+    def prune(self):
+        """Elimina entradas expiradas y, si sobra, las menos usadas recientemente."""
+        with self.lock:
+            self.conn.execute("DELETE FROM persons WHERE stored_at < ?", (time.time() - self.ttl_seconds,))
+            self.conn.execute(
+                "DELETE FROM persons WHERE name IN (SELECT name FROM persons ORDER BY last_used DESC "
+                "LIMIT -1 OFFSET ?)", (self.max_entries,)
+            )
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM persons").fetchone()[0]
+
+    def close(self):
+        """Aplica la política de expulsión, confirma los cambios pendientes y cierra."""
+        self.prune()
+        self.conn.close()
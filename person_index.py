@@ -0,0 +1,138 @@
+import re
+import unicodedata
+from collections import Counter
+from itertools import chain, combinations, product
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+def match_key(name: str) -> str:
+    """Clave de comparación: sin acentos (NFKD), en mayúsculas y sin puntuación ni espacios repetidos.
+
+    Conserva el orden de las palabras: "María-José  Pérez" y "MARIA JOSE PEREZ" producen la
+    misma clave, pero "JOSE MARIA" no (suelen ser personas distintas).
+    """
+    if not name: return ""
+    decomposed = unicodedata.normalize("NFKD", name)
+    folded = "".join(c for c in decomposed if not unicodedata.combining(c)).upper()
+    return " ".join(_TOKEN_RE.findall(folded))
+
+def token_key(key: str) -> str:
+    """Clave con las palabras ordenadas, para encontrar nombres con los apellidos en otro orden."""
+    return " ".join(sorted(key.split(" ")))
+
+def conflicting(entry: dict, correo: str = "", sexo: str = "") -> bool:
+    """True si el correo o el sexo conocidos de una persona contradicen los indicados."""
+    if correo and entry.get('correo') and correo.strip().lower() != entry['correo'].strip().lower(): return True
+    return bool(sexo and entry.get('sexo') and sexo != entry['sexo'])
+
+def trigrams(key: str) -> set:
+    """Trigramas de una clave, con relleno para ponderar el inicio y el final."""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class PersonIndex:
+    """Índice en memoria de la BD de Personas, indexado por nombre normalizado.
+
+    Además de la búsqueda exacta por clave (`match_key` por defecto), `find_similar`
+    encuentra casi-duplicados y nombres con las palabras en otro orden. El índice de trigramas se construye sobre el vocabulario de
+    palabras (mucho menor que la cantidad de nombres): cada palabra de la consulta se expande
+    a sus variantes parecidas, las combinaciones se buscan como claves exactas y los
+    candidatos se verifican con la similitud de Dice sobre los trigramas del nombre completo.
+    """
+
+    def __init__(self, normalize=match_key, similarity_threshold: float = 0.85,
+                 max_variants: int = 5, max_substitutions: int = 2, token_threshold: float = 0.5):
+        """Recibe la función de normalización y los límites de la búsqueda aproximada."""
+        self.normalize = normalize
+        self.similarity_threshold = similarity_threshold
+        self.max_variants = max_variants
+        self.max_substitutions = max_substitutions
+        self.token_threshold = token_threshold
+        self.entries = {}        # clave -> {'id', 'correo', 'sexo'}
+        self.reordered = {}      # clave con palabras ordenadas -> claves exactas
+        self.token_sizes = {}    # palabra -> cantidad de trigramas
+        self.token_postings = {} # trigrama -> palabras que lo contienen
+        self._variants = {}      # palabra -> variantes parecidas (se vacía al crecer el vocabulario)
+
+    def add(self, name: str, page_id: str, correo: str = "", sexo: str = ""):
+        """Agrega una persona al índice; si el nombre ya existe se conserva la primera."""
+        key = self.normalize(name)
+        if not key or key in self.entries: return
+        self.entries[key] = {'id': page_id, 'correo': correo or "", 'sexo': sexo or ""}
+        self.reordered.setdefault(token_key(key), []).append(key)
+        for token in key.split(" "):
+            if token in self.token_sizes: continue
+            grams = trigrams(token)
+            self.token_sizes[token] = len(grams)
+            for gram in grams:
+                self.token_postings.setdefault(gram, []).append(token)
+            self._variants.clear()
+
+    def get(self, name: str):
+        """Devuelve el registro {'id', 'correo', 'sexo'} de una persona o None."""
+        return self.entries.get(self.normalize(name))
+
+    def token_variants(self, token: str) -> list:
+        """Palabras del vocabulario parecidas a `token` (Dice >= token_threshold), de mayor a menor similitud."""
+        if token in self._variants: return self._variants[token]
+        grams = trigrams(token)
+        shared = Counter(chain.from_iterable(self.token_postings.get(gram, ()) for gram in grams))
+        scored = []
+        for other, count in shared.items():
+            score = 2 * count / (len(grams) + self.token_sizes[other])
+            if other != token and score >= self.token_threshold:
+                scored.append((-score, other))
+        variants = [other for _, other in sorted(scored)[:self.max_variants]]
+        self._variants[token] = variants
+        return variants
+
+    def _candidate_keys(self, tokens: list):
+        """Claves con hasta `max_substitutions` palabras reemplazadas por variantes o una palabra menos."""
+        options = [self.token_variants(token) for token in tokens]
+        for count in range(1, self.max_substitutions + 1):
+            for positions in combinations(range(len(tokens)), count):
+                for replacement in product(*(options[i] for i in positions)):
+                    candidate = list(tokens)
+                    for i, token in zip(positions, replacement):
+                        candidate[i] = token
+                    yield token_key(" ".join(candidate))
+        if len(tokens) > 1:
+            for i in range(len(tokens)):
+                yield token_key(" ".join(tokens[:i] + tokens[i + 1:]))
+
+    def find_similar(self, name: str, threshold: float = None, correo: str = "", sexo: str = ""):
+        """Busca la persona más parecida; devuelve (registro, similitud, clave) o None.
+
+        Son candidatos los nombres con hasta `max_substitutions` palabras parecidas o una menos,
+        en cualquier orden ("JOSE MARIA" es candidato de "MARIA JOSE"). La similitud se mide
+        sobre las palabras ordenadas y se descartan los candidatos cuyo correo o sexo contradicen
+        `correo`/`sexo`: un nombre reordenado con otro sexo suele ser otra persona.
+        """
+        threshold = threshold or self.similarity_threshold
+        key = self.normalize(name)
+        if not key: return None
+        if key in self.entries: return self.entries[key], 1.0, key
+        tokens = token_key(key)
+        query = trigrams(tokens)
+        best = None
+        for candidate_tokens in {tokens, *self._candidate_keys(key.split(" "))}:
+            candidate_keys = [k for k in self.reordered.get(candidate_tokens, ())
+                              if not conflicting(self.entries[k], correo, sexo)]
+            if not candidate_keys: continue
+            candidate = trigrams(candidate_tokens)
+            score = 2 * len(query & candidate) / (len(query) + len(candidate))
+            for candidate_key in candidate_keys:
+                if score >= threshold and (best is None or (-score, candidate_key) < (-best[1], best[2])):
+                    best = (self.entries[candidate_key], score, candidate_key)
+        return best
+
+    def update(self, name: str, **fields):
+        """Actualiza los campos conocidos de una persona ya indexada."""
+        entry = self.get(name)
+        if entry: entry.update({k: v for k, v in fields.items() if v})
+
+    def __contains__(self, name: str):
+        return self.get(name) is not None
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,84 @@
+from notion_service import inline_relation_ids
+
+class AdaptiveInterval:
+    """Intervalo entre consultas del modo daemon.
+
+    Vuelve al mínimo apenas un ciclo encuentra trabajo y, mientras no aparezca, se
+    multiplica por `factor` en cada ciclo hasta llegar al máximo.
+    """
+
+    def __init__(self, minimum: float, maximum: float, factor: float = 2.0):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.factor = factor
+        self.current = minimum
+
+    def next(self, found: int) -> float:
+        """Segundos hasta la próxima consulta según cuántos contratos trajo la última."""
+        self.current = self.minimum if found else min(self.maximum, self.current * self.factor)
+        return self.current
+
+class ContractPoller:
+    """Consulta repetida de los contratos sin enlace nuevos o editados desde la anterior.
+
+    La marca de agua es el último last_edited_time visto; las consultas se ordenan por
+    esa fecha (también la primera, que recorre todo el backlog), así que si una falla a
+    medias la marca no se salta contratos. Notion redondea last_edited_time al minuto y
+    el filtro `on_or_after` devuelve otra vez los contratos de la marca: los ya entregados
+    con la misma fecha se omiten, y solo vuelven si alguien los edita.
+
+    La marca avanza al entregar cada contrato, así que los que no se pudieron enlazar
+    quedan atrás: se pasan a `retry` y la consulta siguiente los vuelve a leer uno a uno.
+    Si el ciclo se interrumpe, `rollback` deja la marca donde estaba antes de la consulta.
+    """
+
+    def __init__(self, notion, db_id: str, since: str = None, page_size: int = 100):
+        self.notion = notion
+        self.db_id = db_id
+        self.since = since or ""  # "" = recorrido completo, ordenado por last_edited_time
+        self.page_size = page_size
+        self.seen = {}  # contract_id -> last_edited_time entregado
+        self.retrying = {}  # contract_id -> last_edited_time de los contratos a reintentar
+        self.found = 0
+        self.checkpoint = (self.since, {}, {})
+
+    def retry(self, failed: dict):
+        """Reintenta en la próxima consulta los contratos que no se pudieron enlazar (contract_id -> last_edited_time)."""
+        for contract_id, edited in failed.items():
+            self.seen.pop(contract_id, None)
+            self.retrying[contract_id] = edited
+
+    def rollback(self):
+        """Vuelve al estado previo a la última consulta (p. ej. si el ciclo falló a medias)."""
+        self.since, seen, retrying = self.checkpoint
+        self.seen, self.retrying = dict(seen), dict(retrying)
+
+    def poll(self):
+        """Genera los contratos pendientes que no se entregaron antes; cuenta en `found` los de esta consulta.
+
+        Primero entrega los contratos a reintentar que siguen sin enlace (no cuentan en `found`,
+        para que uno que falla siempre no deje el intervalo en el mínimo).
+        """
+        self.found = 0
+        self.checkpoint = (self.since, dict(self.seen), dict(self.retrying))
+        retrying, self.retrying = self.retrying, {}
+        for contract_id, edited in retrying.items():
+            # Si su fecha no quedó atrás de la marca, la consulta lo vuelve a traer
+            if edited >= self.since: continue
+            contract = self.notion.get_page(contract_id)
+            if contract is None:
+                self.retrying[contract_id] = edited
+                continue
+            if contract.get("archived") or inline_relation_ids(contract, self.notion.contract_relation_prop) != []:
+                continue
+            self.seen[contract_id] = contract.get("last_edited_time") or ""
+            yield contract
+        for contract in self.notion.iter_unlinked_contracts(self.db_id, page_size=self.page_size, since=self.since):
+            edited = contract.get("last_edited_time") or ""
+            if self.seen.get(contract["id"]) == edited: continue
+            self.seen[contract["id"]] = edited
+            self.since = max(self.since, edited)
+            self.found += 1
+            yield contract
+        # Solo pueden repetirse los contratos con la fecha de la marca de agua
+        self.seen = {contract_id: edited for contract_id, edited in self.seen.items() if edited >= self.since}
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Almacén SQLite de los eventos y sesiones del enlazador, con consultas por fecha, error y persona.
+Consultar con: python report_store.py {summary,errors,person,sessions,session,export-csv,import-csv} [--db reportes.db]
+"""
+
+import csv
+import json
+import os
+import sqlite3
+
+# Columnas de los eventos de ReportWriter.EVENT_FIELDS que no se llaman igual en la tabla
+FIELD_COLUMNS = {'name': 'person_name', 'id': 'person_id', 'error': 'detail', 'updated_props': 'detail',
+                 'created_at': 'at', 'timestamp': 'at'}
+PERIOD_FORMATS = {'day': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}
+
+class ReportStore:
+    """Eventos (personas creadas, errores, actualizaciones, enlaces) y sesiones en SQLite.
+
+    Reemplaza a los CSV que crecen sin fin y a los reporte_sesion_*.txt: cada evento es
+    una fila de `events` indexada por tipo y fecha, persona y contrato, y cada sesión una
+    fila de `sessions` con sus contadores, métricas de la API y el texto de su reporte.
+    Los CSV y TXT se pueden seguir generando desde aquí (`export_csv`, `session_report`).
+    """
+
+    def __init__(self, path: str = "reportes.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY, kind TEXT NOT NULL, at TEXT NOT NULL,
+                contract_id TEXT, person_name TEXT, person_id TEXT, detail TEXT
+            );
+            CREATE INDEX IF NOT EXISTS events_kind_at ON events (kind, at);
+            CREATE INDEX IF NOT EXISTS events_person_name ON events (person_name);
+            CREATE INDEX IF NOT EXISTS events_person_id ON events (person_id);
+            CREATE INDEX IF NOT EXISTS events_contract ON events (contract_id);
+            CREATE TABLE IF NOT EXISTS sessions (
+                id INTEGER PRIMARY KEY, start_time TEXT NOT NULL, end_time TEXT,
+                total_processed INTEGER, successful_links INTEGER, errors INTEGER,
+                new_persons_created INTEGER, properties_updated INTEGER,
+                counters TEXT, api_metrics TEXT, report TEXT
+            );
+            CREATE INDEX IF NOT EXISTS sessions_start ON sessions (start_time);
+        """)
+
+    def add_events(self, kind: str, fieldnames: list, rows: list):
+        """Guarda filas de un tipo de evento (valores en el orden de `fieldnames`, fecha 'YYYY-MM-DD HH:MM:SS')."""
+        columns = [FIELD_COLUMNS.get(field, field) for field in fieldnames]
+        self.conn.executemany(
+            f"INSERT INTO events (kind, {', '.join(columns)}) VALUES (?{', ?' * len(columns)})",
+            [(kind, *row) for row in rows])
+        self.conn.commit()
+
+    def add_session(self, summary: dict):
+        """Guarda el resumen de una sesión: {'start_time', 'end_time', 'counters', 'api_metrics', 'report'}."""
+        counters = summary.get('counters', {})
+        self.conn.execute(
+            "INSERT INTO sessions (start_time, end_time, total_processed, successful_links, errors, "
+            "new_persons_created, properties_updated, counters, api_metrics, report) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (summary['start_time'], summary.get('end_time'), counters.get('total_processed', 0),
+             counters.get('successful_links', 0), counters.get('errors', 0), counters.get('new_persons_created', 0),
+             counters.get('properties_updated', 0), json.dumps(counters), json.dumps(summary.get('api_metrics', {})),
+             summary.get('report', "")))
+        self.conn.commit()
+
+    @staticmethod
+    def _range(since: str = None, until: str = None, column: str = "at"):
+        """Condición SQL para un rango de fechas (`until` inclusivo, a nivel de día si no trae hora)."""
+        clauses, params = [], []
+        if since:
+            clauses.append(f"{column} >= ?"); params.append(since)
+        if until:
+            clauses.append(f"{column} <= ?"); params.append(until if len(until) > 10 else f"{until} 23:59:59")
+        return clauses, params
+
+    def summary(self, since: str = None, until: str = None, period: str = "day") -> list:
+        """Cantidad de eventos por período y tipo: [(período, tipo, cantidad)]."""
+        clauses, params = self._range(since, until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self.conn.execute(
+            f"SELECT strftime('{PERIOD_FORMATS[period]}', at) AS period, kind, COUNT(*) FROM events {where} "
+            "GROUP BY period, kind ORDER BY period, kind", params).fetchall()
+
+    def error_counts(self, since: str = None, until: str = None) -> list:
+        """Errores agrupados por mensaje: [(error, cantidad, primera vez, última vez)]."""
+        clauses, params = self._range(since, until)
+        where = " AND ".join(["kind = 'error'", *clauses])
+        return self.conn.execute(
+            f"SELECT detail, COUNT(*), MIN(at), MAX(at) FROM events WHERE {where} "
+            "GROUP BY detail ORDER BY COUNT(*) DESC, detail", params).fetchall()
+
+    def person_history(self, person: str) -> list:
+        """Eventos de una persona por page_id exacto o parte del nombre: [(fecha, tipo, nombre, page_id, contrato, detalle)]."""
+        return self.conn.execute(
+            "SELECT at, kind, person_name, person_id, contract_id, detail FROM events "
+            "WHERE person_id = ? OR person_name LIKE ? ORDER BY at, id", (person, f"%{person}%")).fetchall()
+
+    def sessions(self, since: str = None, until: str = None, limit: int = 20) -> list:
+        """Últimas sesiones: [(id, inicio, fin, procesados, enlaces, errores, personas nuevas, actualizaciones)]."""
+        clauses, params = self._range(since, until, "start_time")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.conn.execute(
+            "SELECT id, start_time, end_time, total_processed, successful_links, errors, new_persons_created, "
+            f"properties_updated FROM sessions {where} ORDER BY start_time DESC, id DESC LIMIT ?", [*params, limit]).fetchall()
+        return rows[::-1]
+
+    def session_report(self, session_id: int = None):
+        """Texto del reporte de una sesión (la última si no se indica), como los reporte_sesion_*.txt."""
+        query = "SELECT start_time, report FROM sessions " + ("WHERE id = ?" if session_id else "ORDER BY id DESC LIMIT 1")
+        row = self.conn.execute(query, (session_id,) if session_id else ()).fetchone()
+        return row
+
+    def export_csv(self, directory: str = ".", since: str = None, until: str = None) -> dict:
+        """Genera los CSV acumulativos de siempre a partir del almacén; devuelve las filas por archivo."""
+        from analysis_service import ReportWriter
+        counts = {}
+        clauses, params = self._range(since, until)
+        for kind, (filename, fieldnames) in ReportWriter.CSV_REPORTS.items():
+            columns = [FIELD_COLUMNS.get(field, field) for field in fieldnames]
+            where = " AND ".join(["kind = ?", *clauses])
+            rows = self.conn.execute(f"SELECT {', '.join(columns)} FROM events WHERE {where} ORDER BY at, id",
+                                     [kind, *params])
+            with open(os.path.join(directory, filename), 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(fieldnames)
+                counts[filename] = 0
+                for row in rows:
+                    writer.writerow(row)
+                    counts[filename] += 1
+        return counts
+
+    def import_csv(self, directory: str = ".") -> dict:
+        """Carga en el almacén los CSV acumulativos escritos por versiones anteriores; devuelve las filas por archivo."""
+        from analysis_service import ReportWriter
+        counts = {}
+        for kind, (filename, fieldnames) in ReportWriter.CSV_REPORTS.items():
+            path = os.path.join(directory, filename)
+            if not os.path.isfile(path): continue
+            with open(path, newline='', encoding='utf-8') as f:
+                rows = [[row.get(field, "") for field in fieldnames] for row in csv.DictReader(f)]
+            self.add_events(kind, fieldnames, rows)
+            counts[filename] = len(rows)
+        return counts
+
+    def close(self):
+        self.conn.close()
+
+def print_rows(headers: list, rows: list):
+    """Imprime filas como tabla de texto con columnas alineadas."""
+    rows = [["" if value is None else str(value) for value in row] for row in rows]
+    widths = [max([len(header), *(len(row[i]) for row in rows)]) for i, header in enumerate(headers)]
+    print("  ".join(header.ljust(width) for header, width in zip(headers, widths)))
+    print("  ".join("-" * width for width in widths))
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+    if not rows: print("(sin resultados)")
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Consulta los reportes acumulados del enlazador.")
+    parser.add_argument("--db", default="reportes.db", help="Archivo SQLite de reportes (REPORT_DB_FILE)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    dated = argparse.ArgumentParser(add_help=False)
+    dated.add_argument("--since", help="Desde la fecha YYYY-MM-DD[ HH:MM:SS]")
+    dated.add_argument("--until", help="Hasta la fecha YYYY-MM-DD[ HH:MM:SS] (inclusive)")
+    summary = commands.add_parser("summary", parents=[dated], help="Eventos por día/mes/año y tipo")
+    summary.add_argument("--by", choices=PERIOD_FORMATS, default="day")
+    commands.add_parser("errors", parents=[dated], help="Errores agrupados por mensaje")
+    person = commands.add_parser("person", help="Historial de una persona (page_id o parte del nombre)")
+    person.add_argument("person")
+    sessions = commands.add_parser("sessions", parents=[dated], help="Últimas sesiones con sus contadores")
+    sessions.add_argument("--limit", type=int, default=20)
+    session = commands.add_parser("session", help="Reporte de una sesión (la última por defecto)")
+    session.add_argument("id", type=int, nargs="?")
+    session.add_argument("--output", help="Guardarlo en un archivo en vez de imprimirlo")
+    export = commands.add_parser("export-csv", parents=[dated], help="Genera los CSV acumulativos desde el almacén")
+    export.add_argument("--directory", default=".")
+    imported = commands.add_parser("import-csv", help="Carga los CSV acumulativos de versiones anteriores")
+    imported.add_argument("--directory", default=".")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    store = ReportStore(args.db)
+    try:
+        if args.command == "summary":
+            print_rows([{'day': "Día", 'month': "Mes", 'year': "Año"}[args.by], "Evento", "Cantidad"],
+                       store.summary(args.since, args.until, args.by))
+        elif args.command == "errors":
+            print_rows(["Error", "Cantidad", "Primera vez", "Última vez"], store.error_counts(args.since, args.until))
+        elif args.command == "person":
+            print_rows(["Fecha", "Evento", "Nombre", "Page ID", "Contrato", "Detalle"], store.person_history(args.person))
+        elif args.command == "sessions":
+            print_rows(["ID", "Inicio", "Fin", "Procesados", "Enlaces", "Errores", "Nuevas", "Actualizadas"],
+                       store.sessions(args.since, args.until, args.limit))
+        elif args.command == "session":
+            row = store.session_report(args.id)
+            if row is None:
+                print("No hay sesiones registradas.")
+            elif args.output:
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    f.write(row[1])
+                print(f"📋 Reporte de la sesión del {row[0]} guardado en: {args.output}")
+            else:
+                print(row[1])
+        elif args.command == "export-csv":
+            for filename, count in store.export_csv(args.directory, args.since, args.until).items():
+                print(f"📄 {filename}: {count} filas")
+        elif args.command == "import-csv":
+            for filename, count in store.import_csv(args.directory).items():
+                print(f"📥 {filename}: {count} filas importadas")
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
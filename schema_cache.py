@@ -0,0 +1,53 @@
+import json
+import os
+import threading
+import time
+
+class SchemaCache:
+    """Esquemas de las BD (propiedad -> tipo) guardados para no repetir databases.retrieve.
+
+    Cada esquema se reutiliza durante `ttl_seconds`, también entre ejecuciones si se
+    indica `path` (JSON escrito de forma atómica); sin `path` vive solo en memoria.
+    """
+
+    def __init__(self, path: str = None, ttl_seconds: float = 86400):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.schemas = {}
+        if path and os.path.isfile(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.schemas = json.load(f).get('schemas', {})
+            except (IOError, ValueError) as e:
+                print(f"Error leyendo el caché de esquemas {path}: {e}")
+
+    def get(self, database_id: str):
+        """Devuelve {'properties', 'last_edited_time', 'fetched_at'} si hay un esquema vigente, o None."""
+        with self.lock:
+            entry = self.schemas.get(database_id)
+        if entry is None or time.time() - entry['fetched_at'] > self.ttl_seconds:
+            return None
+        return entry
+
+    def put(self, database_id: str, database: dict) -> dict:
+        """Guarda el esquema de una respuesta de databases.retrieve y lo devuelve."""
+        entry = {
+            'properties': {name: prop.get("type") for name, prop in database.get("properties", {}).items()},
+            'last_edited_time': database.get("last_edited_time"),
+            'fetched_at': time.time(),
+        }
+        with self.lock:
+            self.schemas[database_id] = entry
+            self._save()
+        return entry
+
+    def _save(self):
+        if not self.path: return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'schemas': self.schemas}, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            print(f"Error guardando el caché de esquemas {self.path}: {e}")
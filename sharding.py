@@ -0,0 +1,62 @@
+import os
+import queue
+import zlib
+
+from person_index import match_key, token_key
+
+def shard_for(name: str, shards: int) -> int:
+    """Shard (0..shards-1) de un nombre, estable entre procesos y ejecuciones.
+
+    Se usa CRC32 de la clave `match_key` con las palabras ordenadas (no `hash()`, que cambia
+    por proceso), así que las variantes de un mismo nombre (tildes, orden de las palabras)
+    caen siempre en el mismo worker y una persona solo la busca o la crea un proceso.
+    """
+    if shards <= 1: return 0
+    return zlib.crc32(token_key(match_key(name)).encode('utf-8')) % shards
+
+def shard_path(path: str, shard: int) -> str:
+    """Archivo propio de un shard (p. ej. el journal): `notion_linker.journal.shard2`."""
+    return f"{path}.shard{shard}"
+
+def api_tokens() -> list:
+    """Tokens de integración para los workers: NOTION_API_KEYS (separados por coma) o NOTION_API_KEY."""
+    tokens = [token.strip() for token in os.getenv("NOTION_API_KEYS", "").split(",") if token.strip()]
+    return tokens or [os.getenv("NOTION_API_KEY")]
+
+def assign_tokens(workers: int, tokens: list) -> list:
+    """Reparte los tokens entre los workers en round-robin.
+
+    Devuelve (token, compartido_por) por worker: los workers que comparten un token se
+    dividen su rate para no superar entre todos el límite de esa integración.
+    """
+    return [(tokens[i % len(tokens)], len(range(i % len(tokens), workers, len(tokens))))
+            for i in range(workers)]
+
+def put_while_alive(target_queue, item, process, timeout: float = 1.0):
+    """Encola en la cola acotada de un worker; falla si el worker terminó en vez de esperar para siempre."""
+    while True:
+        try:
+            target_queue.put(item, timeout=timeout)
+            return
+        except queue.Full:
+            if not process.is_alive():
+                raise RuntimeError(f"El worker {process.name} terminó antes de recibir todos sus contratos.")
+
+class QueueReader:
+    """Itera los contratos que el coordinador envía en bloques a un worker, hasta el centinela None."""
+
+    def __init__(self, source):
+        self.source = source
+        self.done = False
+
+    def __iter__(self):
+        while not self.done:
+            chunk = self.source.get()
+            if chunk is None:
+                self.done = True
+                return
+            yield from chunk
+
+    def drain(self):
+        """Descarta lo que quede (tras un error) para que el coordinador no se bloquee."""
+        for _ in self: pass
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Snapshot local (SQLite) de las BD de Contratos y Personas.
+Crear o refrescar con: python snapshot_store.py [--output notion_snapshot.db]
+"""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+def compact_property(prop: dict) -> dict:
+    """Reduce una propiedad de Notion (formato de lectura o de escritura) a lo que usa el enlazador."""
+    prop_type = prop.get("type") or next((key for key in ("title", "rich_text", "email", "select", "relation")
+                                          if key in prop), None)
+    value = prop.get(prop_type)
+    if prop_type in ("title", "rich_text"):
+        text = "".join(part.get("plain_text") or part.get("text", {}).get("content", "") for part in value or [])
+        return {"type": prop_type, prop_type: [{"plain_text": text}] if text else []}
+    if prop_type == "email":
+        return {"type": "email", "email": value or None}
+    if prop_type == "select":
+        return {"type": "select", "select": {"name": value["name"]} if value and value.get("name") else None}
+    if prop_type == "relation":
+        compact = {"type": "relation", "relation": [{"id": item["id"]} for item in value or []]}
+        if prop.get("has_more"): compact["has_more"] = True  # Lista truncada por Notion (más de 25)
+        return compact
+    return {"type": prop_type}
+
+class SnapshotStore:
+    """Copia local de una o más BD de Notion, con solo las propiedades indicadas.
+
+    Las páginas se guardan en SQLite con índices por título, relación vacía y
+    last_edited_time, y `query` responde con el mismo formato que `databases.query`
+    para el subconjunto de filtros que usa el enlazador. NotionService la consulta en
+    vez de la API cuando cubre la BD, y le aplica sus propias escrituras (write-through).
+    """
+
+    def __init__(self, path: str = "notion_snapshot.db", commit_every: int = 1000):
+        self.path = path
+        self.commit_every = commit_every
+        self.pending_writes = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS databases (
+                database_id TEXT PRIMARY KEY, properties TEXT NOT NULL,
+                title_prop TEXT, relation_prop TEXT, taken_at TEXT NOT NULL, pages INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                page_id TEXT PRIMARY KEY, database_id TEXT NOT NULL, last_edited_time TEXT NOT NULL DEFAULT '',
+                title TEXT, linked INTEGER NOT NULL DEFAULT 0, properties TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_pages_title ON pages(database_id, title);
+            CREATE INDEX IF NOT EXISTS idx_pages_linked ON pages(database_id, linked, last_edited_time);
+            CREATE INDEX IF NOT EXISTS idx_pages_edited ON pages(database_id, last_edited_time);
+        """)
+        self.conn.commit()
+        self.databases = {}
+        for database_id, properties, title_prop, relation_prop, taken_at, pages in self.conn.execute(
+                "SELECT database_id, properties, title_prop, relation_prop, taken_at, pages FROM databases"):
+            self.databases[database_id] = {'properties': json.loads(properties), 'title_prop': title_prop,
+                                           'relation_prop': relation_prop, 'taken_at': taken_at, 'pages': pages}
+
+    # --- Escritura ---
+    def _row(self, database_id: str, page: dict, properties: dict = None) -> tuple:
+        meta = self.databases[database_id]
+        properties = properties if properties is not None else {
+            name: compact_property(prop) for name, prop in page.get("properties", {}).items()
+            if name in meta['properties']
+        }
+        title_prop, relation_prop = meta['title_prop'], meta['relation_prop']
+        title = None
+        if title_prop and properties.get(title_prop):
+            texts = properties[title_prop].get(properties[title_prop]["type"]) or [{}]
+            title = texts[0].get("plain_text", "")
+        linked = int(bool(relation_prop and properties.get(relation_prop, {}).get("relation")))
+        return (page["id"], database_id, page.get("last_edited_time", ""), title, linked,
+                json.dumps(properties, ensure_ascii=False, separators=(",", ":")))
+
+    def import_database(self, database_id: str, pages, properties: list, title_prop: str = None,
+                        relation_prop: str = None) -> int:
+        """Reemplaza el contenido de una BD con las páginas recibidas (iterable, se consume en streaming)."""
+        with self.lock:
+            self.databases[database_id] = {'properties': list(properties), 'title_prop': title_prop,
+                                           'relation_prop': relation_prop, 'taken_at': "", 'pages': 0}
+            self.conn.execute("DELETE FROM pages WHERE database_id = ?", (database_id,))
+            total, rows = 0, []
+            for page in pages:
+                rows.append(self._row(database_id, page))
+                if len(rows) >= self.commit_every:
+                    self.conn.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)", rows)
+                    total += len(rows)
+                    rows = []
+            self.conn.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)", rows)
+            total += len(rows)
+            meta = self.databases[database_id]
+            meta['taken_at'], meta['pages'] = datetime.now().isoformat(timespec='seconds'), total
+            self.conn.execute("INSERT OR REPLACE INTO databases VALUES (?, ?, ?, ?, ?, ?)",
+                              (database_id, json.dumps(meta['properties']), title_prop, relation_prop,
+                               meta['taken_at'], total))
+            self.conn.commit()
+            self.pending_writes = 0
+        return total
+
+    def _write(self, sql: str, params: tuple):
+        self.conn.execute(sql, params)
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_every:
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def put_page(self, database_id: str, page: dict):
+        """Agrega o reemplaza una página (p. ej. una persona recién creada)."""
+        if not self.covers(database_id) or not page or "id" not in page: return
+        with self.lock:
+            self._write("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)", self._row(database_id, page))
+
+    def update_properties(self, page_id: str, properties: dict, last_edited_time: str = None):
+        """Aplica a una página guardada las propiedades escritas con pages.update."""
+        with self.lock:
+            row = self.conn.execute("SELECT database_id, last_edited_time, properties FROM pages WHERE page_id = ?",
+                                    (page_id,)).fetchone()
+            if not row: return
+            database_id, edited, stored = row
+            merged = json.loads(stored)
+            merged.update({name: compact_property(prop) for name, prop in properties.items()
+                           if name in self.databases[database_id]['properties']})
+            page = {"id": page_id, "last_edited_time": last_edited_time or edited}
+            _, _, edited, title, linked, stored = self._row(database_id, page, merged)
+            # UPDATE en el lugar: conserva el rowid que usan los cursores de `query`
+            self._write("UPDATE pages SET last_edited_time = ?, title = ?, linked = ?, properties = ? WHERE page_id = ?",
+                        (edited, title, linked, stored, page_id))
+
+    # --- Lectura ---
+    def covers(self, database_id: str) -> bool:
+        """True si la BD fue importada en este snapshot."""
+        return database_id in self.databases
+
+    def _where(self, database_id: str, filter: dict, params: list) -> str:
+        """Traduce un filtro de Notion a SQL; lanza ValueError si no está soportado."""
+        meta = self.databases[database_id]
+        if not filter: return "1"
+        for op, joiner in (("and", " AND "), ("or", " OR ")):
+            if op in filter:
+                return "(" + joiner.join(self._where(database_id, f, params) for f in filter[op]) + ")"
+        if filter.get("timestamp") == "last_edited_time" and "on_or_after" in filter.get("last_edited_time", {}):
+            params.append(filter["last_edited_time"]["on_or_after"])
+            return "last_edited_time >= ?"
+        prop = filter.get("property")
+        if prop and prop == meta['title_prop'] and "equals" in filter.get("title", {}):
+            params.append(filter["title"]["equals"])
+            return "title = ?"
+        if prop and prop == meta['relation_prop'] and "relation" in filter:
+            if filter["relation"].get("is_empty"): return "linked = 0"
+            if filter["relation"].get("is_not_empty"): return "linked = 1"
+        raise ValueError(f"Filtro no soportado por el snapshot: {json.dumps(filter)}")
+
+    def query(self, database_id: str, filter: dict = None, sorts: list = None, start_cursor: str = None,
+              page_size: int = 100) -> dict:
+        """Responde como `databases.query` (results/has_more/next_cursor) leyendo del snapshot."""
+        if not self.covers(database_id):
+            raise ValueError(f"La BD {database_id} no está en el snapshot.")
+        params = [database_id]
+        where = self._where(database_id, filter, params)
+        by_edited = bool(sorts)
+        if sorts and sorts != [{"timestamp": "last_edited_time", "direction": "ascending"}]:
+            raise ValueError(f"Orden no soportado por el snapshot: {json.dumps(sorts)}")
+        order = "last_edited_time, rowid" if by_edited else "rowid"
+        if start_cursor:
+            # Cursor por clave (keyset): evita OFFSET, que recorrería todas las filas anteriores
+            if by_edited:
+                edited, rowid = start_cursor.rsplit("|", 1)
+                where += " AND (last_edited_time, rowid) > (?, ?)"
+                params += [edited, int(rowid)]
+            else:
+                where += " AND rowid > ?"
+                params.append(int(start_cursor))
+        page_size = min(page_size or 100, 100)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT rowid, page_id, last_edited_time, properties FROM pages "
+                f"WHERE database_id = ? AND {where} ORDER BY {order} LIMIT ?", params + [page_size + 1]
+            ).fetchall()
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        results = [{"object": "page", "id": page_id, "last_edited_time": edited, "properties": json.loads(properties)}
+                   for _, page_id, edited, properties in rows]
+        next_cursor = None
+        if has_more:
+            next_cursor = f"{rows[-1][2]}|{rows[-1][0]}" if by_edited else str(rows[-1][0])
+        return {"object": "list", "results": results, "has_more": has_more, "next_cursor": next_cursor}
+
+    def count(self, database_id: str, filter: dict = None) -> int:
+        """Cantidad de páginas de la BD que cumplen un filtro de Notion (mismo subconjunto que `query`)."""
+        if not self.covers(database_id):
+            raise ValueError(f"La BD {database_id} no está en el snapshot.")
+        params = [database_id]
+        where = self._where(database_id, filter, params)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM pages WHERE database_id = ? AND {where}", params).fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Descarga las BD de Contratos y Personas a un snapshot local.")
+    parser.add_argument("--output", help="Archivo SQLite del snapshot (por defecto SNAPSHOT_FILE de main.py)")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    import os
+    import main
+    args = parse_args()
+    main.export_snapshot(main.build_notion_service(), os.getenv("CONTRATOS_DB_ID"), os.getenv("PERSONAS_DB_ID"),
+                         args.output or main.SNAPSHOT_FILE or "notion_snapshot.db")
@@ -0,0 +1,51 @@
+import json
+import os
+from datetime import datetime, timezone
+
+def notion_timestamp(moment: datetime = None) -> str:
+    """Formatea un instante como los timestamps ISO (UTC) que devuelve Notion."""
+    moment = moment or datetime.now(timezone.utc)
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+class SyncState:
+    """Guarda en disco las marcas de agua (last_edited_time) de cada BD para la sincronización incremental."""
+
+    def __init__(self, path: str = "sync_state.json"):
+        self.path = path
+        self.watermarks = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.watermarks = json.load(f).get('watermarks', {})
+            except (IOError, ValueError) as e:
+                print(f"Error leyendo el estado de sincronización {path}: {e}")
+
+    def get_watermark(self, key: str):
+        """Devuelve el último last_edited_time procesado para la BD, o None."""
+        return self.watermarks.get(key)
+
+    def advance(self, key: str, timestamp: str):
+        """Avanza la marca de agua si el timestamp es posterior (nunca retrocede)."""
+        if timestamp and timestamp > self.watermarks.get(key, ""):
+            self.watermarks[key] = timestamp
+
+    def hold(self, key: str, timestamp: str):
+        """Retrocede la marca de agua hasta `timestamp` (p. ej. el de una página que falló)."""
+        if timestamp and key in self.watermarks and timestamp < self.watermarks[key]:
+            self.watermarks[key] = timestamp
+
+    def track(self, key: str, pages):
+        """Recorre páginas avanzando la marca de agua con su last_edited_time."""
+        for page in pages:
+            self.advance(key, page.get("last_edited_time"))
+            yield page
+
+    def save(self):
+        """Escribe el estado de forma atómica (archivo temporal + reemplazo)."""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'watermarks': self.watermarks, 'saved_at': notion_timestamp()}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            print(f"Error guardando el estado de sincronización {self.path}: {e}")
@@ -143,6 +143,1392 @@ def test_environment_validation():
     
     return not result1 and result2
 
+def test_person_index():
+    """Test para el índice precargado de Personas"""
+    print("\n🧪 Probando índice de Personas...")
+    
+    from main import build_person_index
+    
+    def page(page_id, nombre, correo=""):
+        return {"id": page_id, "properties": {
+            "NOMBRE": {"type": "title", "title": [{"plain_text": nombre}]},
+            "CORREO": {"type": "email", "email": correo},
+        }}
+    
+    class FakeNotion:
+        """Simula la paginación de query_all_pages."""
+        def query_all_pages(self, db_id, filter=None, page_size=100):
+            yield page("p1", "Juan Pérez", "juan@test.cl")
+            yield page("p2", "María José")
+            yield page("p3", "JUAN PEREZ")  # Duplicado: se conserva el primero
+    
+    index = build_person_index(FakeNotion(), "personas")
+    checks = [
+        (len(index), 2),
+        (index.get("juan pérez")["id"], "p1"),
+        (index.get("JUAN PEREZ")["correo"], "juan@test.cl"),
+        (index.get("MARIA JOSE")["correo"], ""),
+        (index.get("Pedro"), None),
+    ]
+    
+    passed = sum(1 for result, expected in checks if result == expected)
+    print(f"\n📊 Resultado: {passed}/{len(checks)} tests pasaron")
+    return passed == len(checks)
+
+def test_unlinked_contracts_streaming():
+    """Test para el recorrido completo de contratos sin enlace"""
+    print("\n🧪 Probando streaming de contratos sin enlace...")
+    
+    from notion_service import NotionService
+    from fake_notion import FakeNotionClient
+    
+    class FakeDatabases:
+        """Simula una BD paginada por offset donde los contratos enlazados salen del filtro."""
+        def __init__(self, edited):
+            self.unlinked = dict(edited)  # id -> last_edited_time
+            self.calls = 0
+        def query(self, database_id, filter=None, sorts=None, page_size=100, start_cursor=None):
+            self.calls += 1
+            floor = FakeNotionClient._edited_floor(filter)
+            matching = sorted((t, i) for i, t in self.unlinked.items() if t >= floor)
+            start = int(start_cursor or 0)
+            end = start + page_size
+            return {"results": [{"id": i, "last_edited_time": t, "properties": {}} for t, i in matching[start:end]],
+                    "has_more": end < len(matching), "next_cursor": str(end)}
+    
+    # Fechas con empates (Notion redondea al minuto); c3 no se logra enlazar y sigue en el filtro
+    edited = {"c0": "T1", "c1": "T1", "c2": "T2", "c3": "T2", "c4": "T2", "c5": "T3", "c6": "T3"}
+    notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000)
+    databases = FakeDatabases(edited)
+    notion.client.databases = databases
+    
+    streamed = []
+    for contract in notion.iter_unlinked_contracts("contratos", page_size=2):
+        streamed.append(contract["id"])
+        if contract["id"] != "c3": del databases.unlinked[contract["id"]]  # Enlazado: sale del filtro
+    
+    fake = FakeNotionClient(contracts=1000, persons=100)
+    client_notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, client=fake)
+    single_pass = len(list(client_notion.iter_unlinked_contracts("contratos", page_size=100)))
+    
+    checks = [
+        ("cada contrato una vez", sorted(streamed) == sorted(edited) and len(streamed) == len(set(streamed))),
+        # 1000 contratos en páginas de 100: cada consulta repite el último de la anterior (on_or_after)
+        ("una sola pasada", single_pass == 1000 and fake.calls["databases.query"] == 11),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label} ({len(streamed)} contratos en {databases.calls} consultas)")
+    return all(ok for _, ok in checks)
+
+def test_rate_limiter_concurrency():
+    """Test para el token bucket compartido entre workers"""
+    print("\n🧪 Probando token bucket concurrente...")
+    
+    import time
+    from notion_service import NotionService
+    
+    rps, burst, calls = 50.0, 5, 30
+    notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=rps,
+                           burst=burst, max_concurrency=8)
+    
+    def slow_call(_):
+        notion.rate_limiter.wait_if_needed()
+        time.sleep(0.05)  # Latencia de red mayor que 1/rps
+        return time.monotonic()
+    
+    start = time.monotonic()
+    notion.run_concurrently(slow_call, range(calls))
+    elapsed = time.monotonic() - start
+    
+    # Sin concurrencia tardaría calls * (1/rps + latencia) = 2.1s
+    min_expected = (calls - burst) / rps
+    ok = min_expected * 0.9 <= elapsed < 1.2
+    print(f"{'✅' if ok else '❌'} {calls} llamadas en {elapsed:.2f}s (mínimo por rate: {min_expected:.2f}s)")
+    return ok
+
+def test_adaptive_rate_limit():
+    """Test para el control adaptativo del rate ante respuestas 429"""
+    print("\n🧪 Probando rate adaptativo con Retry-After...")
+    
+    import time
+    import httpx
+    from notion_client import APIResponseError
+    from notion_service import NotionService
+    
+    notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=20,
+                           adaptive_rate=True, max_requests_per_second=30)
+    notion.rate_limiter.increase_after = 5
+    notion.rate_limiter.increase_step = 0.1
+    responses = ["429", "ok"] + ["ok"] * 5
+    
+    def api_call():
+        if responses.pop(0) == "429":
+            raise APIResponseError("rate_limited", 429, "Rate limited",
+                                   httpx.Headers({"Retry-After": "0.3"}), "")
+        return {"ok": True}
+    
+    start = time.monotonic()
+    first = notion._retry_api_call(api_call)
+    waited = time.monotonic() - start
+    after_throttle = notion.get_rate_limit_stats()['requests_per_second']
+    for _ in range(5): notion._retry_api_call(api_call)
+    after_successes = notion.get_rate_limit_stats()
+    
+    # Tres llamadas en vuelo reciben 429 en el mismo episodio: el rate baja una sola vez
+    from notion_service import RateLimiter
+    limiter = RateLimiter(2.5, adaptive=True)
+    for _ in range(3): limiter.record_throttle(0.2)
+    one_episode = limiter.requests_per_second
+    time.sleep(0.25)
+    limiter.record_throttle(0.2)
+    next_episode = limiter.requests_per_second
+    
+    checks = [
+        ("reintento exitoso", first == {"ok": True}),
+        ("respeta Retry-After", waited >= 0.3),
+        ("baja multiplicativa", after_throttle == 10),
+        ("sube aditiva", abs(after_successes['requests_per_second'] - 10.1) < 1e-9),
+        ("cuenta 429", after_successes['throttle_events'] == 1),
+        ("una baja por episodio de 429", one_episode == 1.25 and next_episode == 0.625 and limiter.throttle_events == 4),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_persistent_person_cache():
+    """Test para el caché persistente de personas"""
+    print("\n🧪 Probando caché persistente de personas...")
+    
+    import tempfile
+    from person_cache import PersistentPersonCache
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.db")
+        cache = PersistentPersonCache(path, ttl_days=30, max_entries=2)
+        cache.put("JUAN PEREZ", "p1", "juan@test.cl", "")
+        cache.update("JUAN PEREZ", sexo="M")
+        cache.put("MARIA JOSE", "p2")
+        cache.get("JUAN PEREZ")  # MARIA JOSE queda como la menos usada
+        cache.put("ANA", "p3")
+        cache.close()
+        
+        reopened = PersistentPersonCache(path, ttl_days=30, max_entries=2)
+        juan = reopened.get("JUAN PEREZ")
+        checks = [
+            ("sobrevive entre ejecuciones", juan == {'id': 'p1', 'correo': 'juan@test.cl', 'sexo': 'M'}),
+            ("expulsión LRU", reopened.get("MARIA JOSE") is None and len(reopened) == 2),
+        ]
+        reopened.invalidate(page_id="p3")
+        checks.append(("invalidación por page_id", reopened.get("ANA") is None))
+        reopened.ttl_seconds = -1
+        checks.append(("expiración por TTL", reopened.get("JUAN PEREZ") is None))
+        reopened.close()
+    
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_incremental_sync_state():
+    """Test para las marcas de agua de la sincronización incremental"""
+    print("\n🧪 Probando sincronización incremental...")
+    
+    import tempfile
+    from sync_state import SyncState
+    from notion_service import NotionService
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sync_state.json")
+        state = SyncState(path)
+        pages = [{"id": "a", "last_edited_time": "2025-07-29T20:51:00.000Z"},
+                 {"id": "b", "last_edited_time": "2025-07-30T10:00:00.000Z"},
+                 {"id": "c", "last_edited_time": "2025-07-29T22:00:00.000Z"}]
+        consumed = [p["id"] for p in state.track("contratos", pages)]
+        state.save()
+        watermark = SyncState(path).get_watermark("contratos")
+    
+    queries = []
+    class FakeDatabases:
+        def query(self, **kwargs):
+            queries.append(kwargs)
+            return {"results": []}
+    notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000)
+    notion.client.databases = FakeDatabases()
+    notion.get_unlinked_contracts("contratos", 10, since=watermark)
+    conditions = queries[0]["filter"].get("and", [])
+    
+    # Un enlace fallido no deja atrás su contrato: la marca de agua se queda en él
+    import main
+    from analysis_service import ProcessingAnalyzer
+    from fake_notion import FakeNotionClient, api_error, notion_time
+    fake = FakeNotionClient(contracts=6, persons=20)
+    update_page, failing = fake.update_page, [True]
+    def flaky_update(page_id, properties):
+        if page_id == "c-00000003" and failing[0]: raise api_error(502, "bad_gateway", "Bad Gateway")
+        return update_page(page_id, properties)
+    fake.update_page = flaky_update
+    with tempfile.TemporaryDirectory() as tmp:
+        overrides = {'INCREMENTAL_SYNC': True, 'SYNC_STATE_FILE': os.path.join(tmp, "sync_state.json"),
+                     'STREAM_ALL_CONTRACTS': True, 'SHARD_WORKERS': 1, 'PRELOAD_PERSON_INDEX': False,
+                     'JOURNAL_FILE': None, 'PERSON_CACHE_FILE': None, 'finish_session': lambda *args: None}
+        originals = {name: getattr(main, name) for name in overrides}
+        for name, value in overrides.items():
+            setattr(main, name, value)
+        try:
+            for failing[0] in (True, False):
+                service = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, burst=100,
+                                        retry_delay=0, client=fake)
+                main.run(service, ProcessingAnalyzer(), "contratos", "personas")
+                if failing[0]: held = SyncState(overrides['SYNC_STATE_FILE']).get_watermark("contratos")
+        finally:
+            for name, value in originals.items():
+                setattr(main, name, value)
+    
+    checks = [
+        ("recorre todas las páginas", consumed == ["a", "b", "c"]),
+        ("marca de agua = máximo persistido", watermark == "2025-07-30T10:00:00.000Z"),
+        ("filtro por last_edited_time", {"timestamp": "last_edited_time",
+                                         "last_edited_time": {"on_or_after": watermark}} in conditions),
+        ("orden ascendente", queries[0]["sorts"][0]["direction"] == "ascending"),
+        ("marca de agua retenida en el enlace fallido", held == notion_time(3)),
+        ("el contrato fallido se reintenta", sorted(fake.linked) == list(range(6))),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_write_coalescing():
+    """Test para la planificación coalescida de escrituras"""
+    print("\n🧪 Probando coalescencia de escrituras...")
+    
+    import main
+    from notion_service import NotionService
+    from analysis_service import ProcessingAnalyzer
+    
+    class FakePages:
+        def __init__(self):
+            self.created, self.updated = [], []
+        def create(self, parent, properties):
+            self.created.append(properties)
+            return {"id": f"new{len(self.created)}"}
+        def update(self, page_id, properties):
+            self.updated.append((page_id, properties))
+            return {}
+    
+    class FakeDatabases:
+        def query(self, database_id, filter=None, **kwargs):
+            if filter["title"]["equals"] == "ANA":
+                return {"results": [{"id": "ana", "properties": {}}]}
+            return {"results": []}
+    
+    def contract(contract_id, nombre, correo="", sexo=""):
+        return {"id": contract_id, "properties": {
+            "NOMBRE ORDENADO": {"type": "rich_text", "rich_text": [{"plain_text": nombre}]},
+            "CORREO": {"type": "email", "email": correo},
+            "SEXO": {"type": "select", "select": {"name": sexo} if sexo else None},
+        }}
+    
+    notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, max_concurrency=4)
+    notion.client.pages, notion.client.databases = FakePages(), FakeDatabases()
+    analyzer = ProcessingAnalyzer()
+    linker = main.ContractLinker(notion, analyzer, "personas")
+    linker.process_batch([
+        contract("c1", "Ana"), contract("c2", "Ana", "b@x.cl"), contract("c3", "Ana", "a@x.cl", "F"),
+        contract("c4", "Ana", "a@x.cl"), contract("c5", "Bob"), contract("c6", "bob", "bob@x.cl", "M"),
+    ])
+    
+    pages = notion.client.pages
+    person_updates = [(page_id, props) for page_id, props in pages.updated if "PERSONAS" not in props]
+    links = [page_id for page_id, props in pages.updated if "PERSONAS" in props]
+    checks = [
+        ("una creación por persona con datos fusionados", pages.created == [{
+            "NOMBRE": {"title": [{"text": {"content": "BOB"}}]},
+            "CORREO": {"email": "bob@x.cl"}, "SEXO": {"select": {"name": "M"}}}]),
+        ("una actualización por página con el valor más frecuente", person_updates == [
+            ("ana", {"CORREO": {"email": "a@x.cl"}, "SEXO": {"select": {"name": "F"}}})]),
+        ("un enlace por contrato", sorted(links) == ["c1", "c2", "c3", "c4", "c5", "c6"]),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_journal_resume():
+    """Test para la reanudación de ejecuciones desde el journal"""
+    print("\n🧪 Probando reanudación desde el journal...")
+    
+    import tempfile
+    import main
+    from journal import WriteAheadJournal
+    from notion_service import NotionService
+    from analysis_service import ProcessingAnalyzer
+    
+    class FakePages:
+        def __init__(self):
+            self.created, self.updated = [], []
+        def create(self, parent, properties):
+            self.created.append(properties)
+            return {"id": "new"}
+        def update(self, page_id, properties):
+            self.updated.append(page_id)
+            return {}
+    
+    class FakeDatabases:
+        def query(self, **kwargs):
+            return {"results": []}
+    
+    def contract(contract_id, nombre):
+        return {"id": contract_id, "properties": {
+            "NOMBRE ORDENADO": {"type": "rich_text", "rich_text": [{"plain_text": nombre}]}}}
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "run.journal")
+        # Ejecución interrumpida: ANA creada y c1 enlazado; BOB planificado sin confirmar
+        crashed = WriteAheadJournal(path)
+        crashed.plan('create', 'ANA')
+        crashed.complete('create', 'ANA', page_id='ana-id', correo='', sexo='')
+        crashed.complete('link', 'c1', page_id='ana-id')
+        crashed.plan('create', 'BOB')
+        crashed.close()
+        
+        journal = WriteAheadJournal(path)
+        notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000)
+        notion.client.pages, notion.client.databases = FakePages(), FakeDatabases()
+        analyzer = ProcessingAnalyzer()
+        linker = main.ContractLinker(notion, analyzer, "personas", journal=journal)
+        linker.process_batch([contract("c1", "Ana"), contract("c2", "Ana"), contract("c3", "Bob")])
+        pending_after = set(journal.pending)
+        journal.checkpoint()
+        journal.close()
+        empty_after_checkpoint = os.path.getsize(path) == 0
+    
+    checks = [
+        ("no recrea personas confirmadas", len(notion.client.pages.created) == 1),
+        ("no repite enlaces confirmados", sorted(notion.client.pages.updated) == ["c2", "c3"]),
+        ("todos los enlaces registrados", analyzer.stats['successful_links'] == 3),
+        ("sin operaciones pendientes", not pending_after),
+        ("checkpoint vacía el journal", empty_after_checkpoint),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_fake_notion_client():
+    """Test para la API de Notion simulada usada por el benchmark"""
+    print("\n🧪 Probando API de Notion simulada...")
+    
+    from fake_notion import FakeNotionClient, synthetic_name, synthetic_index
+    from notion_service import NotionService, is_rate_limit_error, get_retry_after
+    
+    fake = FakeNotionClient(contracts=250, persons=100)
+    notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, client=fake)
+    contracts = list(notion.iter_unlinked_contracts("contratos", page_size=100))
+    persons = list(notion.query_all_pages("personas"))
+    found = notion.find_person_by_name("personas", "NOMBRE", synthetic_name(42))
+    notion.link_person_to_contract(contracts[0]["id"], found["id"])
+    remaining = list(notion.iter_unlinked_contracts("contratos"))
+    
+    # Un error a mitad del recorrido se relanza en vez de cortar el recorrido como si hubiera terminado
+    failing = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, max_retries=1, client=fake)
+    queries = []
+    def flaky_query(**query):
+        queries.append(query)
+        if len(queries) == 2: raise RuntimeError("502 Bad Gateway")
+        return NotionService._query_database(failing, **query)
+    failing._query_database = flaky_query
+    streamed = []
+    try:
+        for contract in failing.iter_unlinked_contracts("contratos", page_size=100):
+            streamed.append(contract)
+        mid_stream_error = None
+    except RuntimeError as e:
+        mid_stream_error = e
+    
+    throttling = FakeNotionClient(rate_limit_probability=1.0, retry_after=2)
+    try:
+        throttling.databases.query(database_id="personas")
+        error = None
+    except Exception as e:
+        error = e
+    
+    checks = [
+        ("nombres sintéticos reversibles", all(synthetic_index(synthetic_name(j)) == j for j in (0, 7, 123456))),
+        ("paginación completa", len(contracts) == 250 and len(persons) == 100),
+        ("búsqueda por título", found["id"] == "p-00000042"),
+        ("el enlace saca el contrato del filtro", len(remaining) == 249),
+        ("error a mitad del recorrido se relanza", mid_stream_error is not None and len(streamed) == 100),
+        ("inyección de 429 con Retry-After", is_rate_limit_error(error) and get_retry_after(error) == 2),
+        ("métricas por endpoint", fake.calls["databases.query"] >= 7 and fake.calls["pages.update"] == 1),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_api_metrics():
+    """Test para la instrumentación de llamadas a la API"""
+    print("\n🧪 Probando métricas por endpoint...")
+    
+    import json
+    import tempfile
+    from fake_notion import FakeNotionClient
+    from notion_service import NotionService
+    from analysis_service import ProcessingAnalyzer
+    
+    fake = FakeNotionClient(contracts=10, persons=10, latency=0.02, rate_limit_probability=0.0)
+    notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, retry_delay=0, client=fake)
+    notion.get_unlinked_contracts("contratos", 5)
+    notion.find_person_by_name("personas", "NOMBRE", "NADIE")
+    fake.rate_limit_probability, fake.retry_after = 1.0, 0
+    notion.find_person_by_name("personas", "NOMBRE", "NADIE")  # Falla tras 3 intentos con 429
+    metrics = notion.get_api_metrics()
+    query = metrics.get("databases.query", {})
+    
+    # Una llamada de más de 5 s cae en el último bucket (sin límite): el percentil sigue siendo finito
+    from notion_service import ApiMetrics
+    slow = ApiMetrics()
+    slow.record("pages.update", 7.5, 0.0, 0, 0, False)
+    slow_stats = slow.snapshot()["pages.update"]
+    
+    analyzer = ProcessingAnalyzer()
+    analyzer.end_session()
+    analyzer.set_api_metrics(metrics)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = analyzer.export_metrics_json(os.path.join(tmp, "metricas.json"))
+        with open(path, encoding='utf-8') as f:
+            exported = json.load(f)
+    
+    checks = [
+        ("conteo por endpoint", query.get('calls') == 3 and query.get('errors') == 1),
+        ("reintentos y 429", query.get('retries') == 2 and query.get('throttled') == 3),
+        ("histograma de latencia", sum(query.get('histogram', {}).values()) == 3 and query.get('latency_p50_ms') in (25, 50)),
+        ("desglose de tiempos", exported['time_breakdown']['api_calls'] == 3),
+        ("exportación JSON", exported['api_metrics']['databases.query']['calls'] == 3),
+        ("percentil del último bucket finito", slow_stats['latency_p99_ms'] == slow_stats['latency_max_ms'] == 7500.0
+         and json.dumps(slow_stats, allow_nan=False) is not None),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_fuzzy_person_matching():
+    """Test para la coincidencia de nombres sin acentos, desordenados y aproximados"""
+    print("\n🧪 Probando coincidencia aproximada de nombres...")
+    
+    import time
+    from person_index import PersonIndex, match_key
+    from fake_notion import synthetic_name
+    
+    index = PersonIndex()
+    index.add("JUAN PÉREZ", "p1")
+    index.add("Günther  Müller", "p2")
+    index.add("MARIA JOSE SALINAS SANTELICES", "p3")
+    index.add("MARIA JOSE", "p4", sexo="F")
+    typo = index.find_similar("JUAN PERES", 0.8)
+    index.update("JUAN PEREZ", correo="juan@example.cl")
+    
+    checks = [
+        ("acentos y diéresis", index.get("JUAN PEREZ")["id"] == "p1" and index.get("GUNTHER MULLER")["id"] == "p2"),
+        ("espacios y puntuación", match_key("  María-José ") == match_key("MARIA JOSE")),
+        ("orden de las palabras en la clave exacta", index.get("JOSE MARIA") is None and match_key("JOSE MARIA") != match_key("MARIA JOSE")),
+        ("apellidos reordenados como candidato aproximado", index.get("SALINAS SANTELICES MARIA JOSE") is None and
+         index.find_similar("SALINAS SANTELICES MARIA JOSE", 0.85)[0]["id"] == "p3"),
+        ("reordenado con otro sexo descartado", index.find_similar("JOSE MARIA", 0.85, sexo="M") is None and
+         index.find_similar("JOSE MARIA", 0.85, sexo="F")[0]["id"] == "p4"),
+        ("casi-duplicado con otro correo descartado", typo[0]["id"] == "p1" and
+         index.find_similar("JUAN PERES", 0.8, correo="otro@example.cl") is None),
+        ("casi-duplicado sobre el umbral", index.find_similar("MARIA JOSE SALINAS SANTELISES", 0.85)[0]["id"] == "p3"),
+        ("distinto bajo el umbral", index.find_similar("PEDRO GONZALEZ", 0.85) is None),
+    ]
+    
+    large = PersonIndex()
+    for j in range(100000):
+        large.add(synthetic_name(j * 37), f"p{j}")
+    queries = [synthetic_name(j * 37)[:-1] + "X" for j in range(0, 100000, 1000)]
+    start = time.perf_counter()
+    found = sum(1 for q in queries if large.find_similar(q, 0.85))
+    per_lookup_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    checks.append((f"búsqueda aproximada en 100k nombres ({per_lookup_ms:.3f} ms)", found == len(queries) and per_lookup_ms < 5))
+    
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_offline_plan():
+    """Test para el modo plan (DRY_RUN) y la aplicación posterior del plan"""
+    print("\n🧪 Probando plan offline y aplicación...")
+    
+    import json
+    import tempfile
+    import main
+    from fake_notion import FakeNotionClient
+    from notion_service import NotionService
+    from analysis_service import ProcessingAnalyzer
+    from link_plan import read_link_plan
+    
+    fake = FakeNotionClient(contracts=300, persons=100, new_person_ratio=0.5)
+    notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, max_concurrency=4, client=fake)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "plan.jsonl")
+        counts = main.plan_backlog(notion, "contratos", "personas", path)
+        reads_only = set(fake.calls) == {"databases.query"}
+        plan_queries = fake.calls["databases.query"]
+        with open(path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        planner, person_ids = read_link_plan(path)
+        # Un enlace hecho a mano entre el plan y su aplicación se conserva
+        manual = next(r['contract_id'] for r in records if r['op'] == 'link')
+        notion.link_person_to_contract(manual, "p-00000099")
+        
+        previous = main.JOURNAL_FILE, main.PERSON_CACHE_FILE
+        main.JOURNAL_FILE, main.PERSON_CACHE_FILE = os.path.join(tmp, "plan.journal"), None
+        try:
+            linker = main.ContractLinker(notion, ProcessingAnalyzer(), "personas", journal=main.open_journal())
+            fake.reset_metrics()
+            linker.apply_plan(planner, person_ids)
+            linker.journal.checkpoint()
+            apply_calls = dict(fake.calls)
+            relations = dict(fake.linked)
+            # Aplicar otra vez el mismo plan (journal ya vacío) no duplica personas ni cambia los enlaces
+            fake.reset_metrics()
+            planner, person_ids = read_link_plan(path)
+            linker.apply_plan(planner, person_ids)
+            linker.journal.close()
+        finally:
+            main.JOURNAL_FILE, main.PERSON_CACHE_FILE = previous
+        reapply_calls = dict(fake.calls)
+        remaining = list(notion.iter_unlinked_contracts("contratos"))
+    
+    creates = [r for r in records if r['op'] == 'create']
+    checks = [
+        # 300 contratos y 100 personas en páginas de 100: una sola pasada por cada BD
+        ("el plan solo lee (consultas paginadas)", reads_only and plan_queries == 3 + 1),
+        ("un enlace por contrato", counts['link'] == 300 and len(planner.links) == 300),
+        ("una creación por persona nueva", len(creates) == len({r['name'] for r in creates}) == counts['create'] > 0),
+        ("sin IDs de marcador", all(r.get('page_id') != "DRY_RUN_ID" for r in records)),
+        ("el plan no guarda la relación actual", not any('current' in r for r in records)),
+        ("conserva enlaces posteriores al plan", relations[int(manual[2:])][0] == "p-00000099"
+         and len(relations[int(manual[2:])]) == 2),
+        ("la aplicación solo busca los nombres a crear", apply_calls.get("databases.query") == counts['create']),
+        ("la aplicación enlaza todo", apply_calls.get("pages.create") == counts['create'] and not remaining),
+        ("reaplicar no duplica personas", "pages.create" not in reapply_calls
+         and len(fake.created_order) == counts['create'] and fake.linked == relations),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_snapshot_store():
+    """Test para el snapshot local de Contratos y Personas"""
+    print("\n🧪 Probando snapshot local...")
+    
+    import tempfile
+    import main
+    from fake_notion import FakeNotionClient, synthetic_name
+    from notion_service import NotionService
+    from snapshot_store import SnapshotStore
+    
+    fake = FakeNotionClient(contracts=250, persons=120)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot.db")
+        source = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, client=fake)
+        counts = main.export_snapshot(source, "contratos", "personas", path)
+        fake.reset_metrics()
+        
+        store = SnapshotStore(path)
+        notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, client=fake, snapshot=store)
+        unlinked = list(notion.iter_unlinked_contracts("contratos", page_size=100))
+        batch = notion.get_unlinked_contracts("contratos", 10)
+        found = notion.find_person_by_name("personas", "NOMBRE", synthetic_name(42))
+        edited = list(notion.query_all_pages("contratos", filter=notion.edited_since_filter(unlinked[200]["last_edited_time"])))
+        reads_from_api = fake.total_calls
+        
+        created = notion.create_person("personas", "NOMBRE", "PERSONA NUEVA", "nueva@example.cl", "F")
+        notion.link_person_to_contract(unlinked[0]["id"], created["id"])
+        notion.update_person_properties(found["id"], {"CORREO": {"email": "cambio@example.cl"}})
+        store.close()
+        
+        reopened = SnapshotStore(path)
+        notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, client=fake, snapshot=reopened)
+        new_person = notion.find_person_by_name("personas", "NOMBRE", "PERSONA NUEVA")
+        updated = notion.find_person_by_name("personas", "NOMBRE", synthetic_name(42))
+        remaining = len(list(notion.iter_unlinked_contracts("contratos")))
+        calls_before = fake.total_calls
+        notion.query_all_pages("personas", filter={"property": "SEXO", "select": {"equals": "F"}}).__next__()
+        fallback = fake.total_calls == calls_before + 1
+        reopened.close()
+    
+    properties = unlinked[0]["properties"]
+    checks = [
+        ("importa ambas BD", counts == {'contratos': 250, 'personas': 120}),
+        ("solo las propiedades usadas", set(properties) == {"NOMBRE ORDENADO", "CORREO", "SEXO", "PERSONAS"}),
+        ("lecturas sin llamar a la API", reads_from_api == 0),
+        ("consultas equivalentes", len(unlinked) == 250 and len(batch) == 10 and found["id"] == "p-00000042"),
+        ("filtro por last_edited_time", len(edited) == 50),
+        ("extract_property_value compatible",
+         main.extract_property_value(properties, "NOMBRE ORDENADO") == fake.contract_page(0)["properties"]["NOMBRE ORDENADO"]["rich_text"][0]["plain_text"]),
+        ("escrituras aplicadas al snapshot",
+         new_person is not None and updated and main.extract_property_value(updated["properties"], "CORREO") == "cambio@example.cl"
+         and remaining == 249),
+        ("filtros no soportados van a la API", fallback),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_duplicate_merge_plan():
+    """Test para la detección de personas duplicadas y el plan de reenlace"""
+    print("\n🧪 Probando detección de duplicados y plan de fusión...")
+    
+    import json
+    import tempfile
+    import main
+    from fake_notion import FakeNotionClient, synthetic_name
+    from notion_service import NotionService
+    from duplicates import find_duplicate_groups, apply_merge_plan
+    
+    fake = FakeNotionClient(contracts=40, persons=30)
+    notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, max_concurrency=4, client=fake)
+    exact = notion.create_person("personas", "NOMBRE", synthetic_name(3), "tres@example.cl")  # p-00000003 sin correo
+    variant = notion.create_person("personas", "NOMBRE", synthetic_name(5).lower().replace(" ", " - ", 1), "", "F")
+    reordered = notion.create_person("personas", "NOMBRE", " ".join(reversed(synthetic_name(9).split())), "", "F")
+    same_email = notion.create_person("personas", "NOMBRE", synthetic_name(7).lower(), "Persona7@example.cl")
+    shared_email = notion.create_person("personas", "NOMBRE", "OTRO NOMBRE", "Persona8@example.cl")
+    homonym = notion.create_person("personas", "NOMBRE", synthetic_name(10), "otra@example.cl")
+    notion.link_person_to_contract("c-00000000", exact["id"])
+    notion.set_contract_relations("c-00000001", [variant["id"], "p-00000005", "p-00000020"])
+    notion.link_person_to_contract("c-00000002", homonym["id"])
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "merge.jsonl")
+        counts = main.plan_person_merges(notion, "contratos", "personas", path)
+        with open(path, encoding='utf-8') as f:
+            operations = [json.loads(line) for line in f]
+        notion.link_person_to_contract("c-00000001", "p-00000021")  # enlace agregado después de planificar
+        results = apply_merge_plan(notion, path, batch_size=1)
+        writes = fake.calls.get("pages.update", 0)
+        again = apply_merge_plan(notion, path, batch_size=1)
+        rewrites = fake.calls.get("pages.update", 0) - writes
+    
+    canonical = {op['page_id']: op['canonical_id'] for op in operations if op['op'] == 'duplicate'}
+    updates = [op for op in operations if op['op'] == 'update']
+    
+    # Agrupación lineal: 100k personas con 10k duplicados exactos
+    import time
+    persons = [{'id': f"x{i}", 'name': f"PERSONA {i % 90000}", 'correo': "", 'sexo': ""} for i in range(100000)]
+    start = time.perf_counter()
+    groups, _ = find_duplicate_groups(persons)
+    elapsed = time.perf_counter() - start
+    family = [{'id': "a", 'name': "ANA SOTO", 'correo': "casa@example.cl"},
+              {'id': "b", 'name': "LUIS SOTO", 'correo': "Casa@example.cl"}]
+    family_groups, family_conflicts = find_duplicate_groups(family)
+    sexes = [{'id': "f", 'name': "María José", 'sexo': "F"}, {'id': "m", 'name': "MARIA JOSE", 'sexo': "M"},
+             {'id': "r", 'name': "José María", 'sexo': "M"}]
+    sex_groups, sex_conflicts = find_duplicate_groups(sexes)
+    
+    checks = [
+        ("duplicado exacto", canonical.get(exact["id"]) == "p-00000003"),
+        ("variante con minúsculas y puntuación", canonical.get(variant["id"]) == "p-00000005"),
+        ("apellidos reordenados no se fusionan", reordered["id"] not in canonical),
+        ("mismo correo y nombre", canonical.get(same_email["id"]) == "p-00000007"),
+        ("mismo correo con otro nombre no se fusiona", shared_email["id"] not in canonical),
+        ("correo compartido reportado como conflicto", family_groups == [] and
+         [[p['id'] for p in group] for group in family_conflicts] == [["a", "b"]]),
+        ("homónimos con sexo distinto no se fusionan", sex_groups == [] and
+         [[p['id'] for p in group] for group in sex_conflicts] == [["f", "m"]]),
+        ("homónimos con correos distintos no se fusionan", homonym["id"] not in canonical),
+        ("completa campos de la canónica", updates == [{'op': 'update', 'page_id': "p-00000003", 'name': synthetic_name(3),
+                                                         'correo': "tres@example.cl", 'sexo': ""}]),
+        ("reenlaces sin IDs repetidos", fake.linked[0] == ["p-00000003"] and fake.linked[1][:2] == ["p-00000005", "p-00000020"]),
+        ("conserva enlaces posteriores al plan", fake.linked[1] == ["p-00000005", "p-00000020", "p-00000021"]),
+        ("reaplicar no reescribe contratos", rewrites == again['update_ok'] and again['relink_ok'] == 2),
+        ("contrato del homónimo intacto", fake.linked[2] == [homonym["id"]]),
+        ("resumen del plan", counts['duplicate'] == 3 and counts['relink'] == 2 and results['relink_ok'] == 2),
+        (f"agrupación en una pasada ({elapsed:.2f}s para 100k)", len(groups) == 10000 and elapsed < 5),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_streaming_reports():
+    """Test para la escritura de reportes en segundo plano"""
+    print("\n🧪 Probando reportes en streaming...")
+    
+    import csv
+    import json
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from analysis_service import ProcessingAnalyzer, ReportWriter
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        for session in range(2):
+            writer = ReportWriter(directory=tmp, events_jsonl="eventos.jsonl", flush_every=100)
+            analyzer = ProcessingAnalyzer(writer)
+            def work(k):
+                analyzer.record_successful_link(f"c{k}", f"PERSONA {k}", f"p{k}")
+                if k % 10 == 0: analyzer.record_new_person_created(f"PERSONA {k}", f"p{k}")
+                if k % 100 == 0: analyzer.record_error(f"c{k}", f"PERSONA {k}", "falló")
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(work, range(5000)))
+            analyzer.export_cumulative_reports()
+            flushed = sum(1 for _ in open(os.path.join(tmp, "reporte_nuevas_personas.csv"), encoding='utf-8'))
+            analyzer.close()
+        with open(os.path.join(tmp, "reporte_nuevas_personas.csv"), encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        with open(os.path.join(tmp, "reporte_errores.csv"), encoding='utf-8') as f:
+            errors = list(csv.reader(f))
+        with open(os.path.join(tmp, "eventos.jsonl"), encoding='utf-8') as f:
+            events = [json.loads(line) for line in f]
+    
+    checks = [
+        ("solo contadores en memoria", not any(isinstance(v, list) for v in analyzer.stats.values())),
+        ("errores recientes acotados", len(analyzer.recent_errors) == ProcessingAnalyzer.RECENT_ERRORS),
+        ("flush deja todo en disco", flushed == 1 + 2 * 500),
+        ("encabezado una sola vez entre sesiones", rows[0] == ['name', 'id', 'created_at'] and len(rows) == 1 + 2 * 500),
+        ("filas CSV completas", len(errors) == 1 + 2 * 50 and errors[1][2] == "falló" and len(errors[1][3]) == 19),
+        ("eventos JSONL con enlaces", sum(1 for e in events if e['event'] == 'link') == 10000
+         and events[0].keys() >= {'event', 'timestamp'}),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_sharded_linking():
+    """Test para el modo coordinador con workers por shard"""
+    print("\n🧪 Probando reparto por shards...")
+    
+    import multiprocessing
+    import multiprocessing.dummy
+    import tempfile
+    import main
+    from fake_notion import FakeNotionClient, synthetic_name
+    from notion_service import NotionService
+    from analysis_service import ProcessingAnalyzer
+    from sharding import shard_for, shard_path, assign_tokens
+    
+    shards = [shard_for(synthetic_name(j), 4) for j in range(2000)]
+    fake = FakeNotionClient(contracts=400, persons=150, new_person_ratio=0.5)
+    services = []
+    def service_factory(**kwargs):
+        services.append(kwargs)
+        return NotionService(client=fake, **kwargs)
+    
+    overrides = {'NotionService': service_factory, 'JOURNAL_FILE': None, 'PERSON_CACHE_FILE': None,
+                 'REQUESTS_PER_SECOND': 1000, 'MAX_REQUESTS_PER_SECOND': 1000}
+    originals = {name: getattr(main, name) for name in overrides}
+    previous_keys = os.environ.get("NOTION_API_KEYS")
+    os.environ["NOTION_API_KEYS"] = "token-a, token-b"
+    for name, value in overrides.items():
+        setattr(main, name, value)
+    try:
+        coordinator = main.build_notion_service()
+        analyzer = ProcessingAnalyzer()
+        contracts = coordinator.iter_unlinked_contracts("contratos", page_size=100)
+        metrics = main.run_sharded(coordinator, analyzer, contracts, "personas", workers=3,
+                                   context=multiprocessing.dummy)
+    finally:
+        for name, value in originals.items():
+            setattr(main, name, value)
+    
+    # Humo con procesos "spawn" reales: los workers reimportan main, reciben la configuración y los
+    # contratos serializados y devuelven su reporte. Los contratos sin nombre no hacen llamadas a la API.
+    blank = {main.CONTRATO_NOMBRE_PROP: {"type": "rich_text", "rich_text": []}}
+    unnamed = [{**page, "properties": {**page["properties"], **blank}} for page in map(fake.contract_page, range(6))]
+    spawn_overrides = {'PERSON_CACHE_FILE': None, 'SNAPSHOT_FILE': None, 'PRELOAD_PERSON_INDEX': False}
+    spawn_originals = {name: getattr(main, name) for name in [*spawn_overrides, 'JOURNAL_FILE', 'SCHEMA_CACHE_FILE']}
+    with tempfile.TemporaryDirectory() as tmp:
+        spawn_overrides.update(JOURNAL_FILE=os.path.join(tmp, "journal"), SCHEMA_CACHE_FILE=os.path.join(tmp, "schemas.json"))
+        for name, value in spawn_overrides.items():
+            setattr(main, name, value)
+        try:
+            spawned = ProcessingAnalyzer()
+            main.run_sharded(NotionService(contract_relation_prop="PERSONAS", client=fake), spawned, iter(unnamed),
+                             "personas", workers=2, context=multiprocessing.get_context("spawn"))
+            # Con la configuración del coordinador, cada worker abre su journal en el directorio temporal
+            spawn_journals = all(os.path.exists(shard_path(main.JOURNAL_FILE, shard)) for shard in range(2))
+        finally:
+            for name, value in spawn_originals.items():
+                setattr(main, name, value)
+            if previous_keys is None: os.environ.pop("NOTION_API_KEYS")
+            else: os.environ["NOTION_API_KEYS"] = previous_keys
+    
+    checks = [
+        ("shard estable ante tildes y orden", shard_for("JOSÉ PÉREZ", 7) == shard_for("perez jose", 7)),
+        ("reparto parejo", min(shards.count(i) for i in range(4)) > 400),
+        ("tokens en round-robin", assign_tokens(3, ["a", "b"]) == [("a", 2), ("b", 1), ("a", 2)]),
+        ("cada worker con su token y su parte del rate",
+         sorted((s['auth'], s['requests_per_second']) for s in services[1:]) == [("token-a", 500), ("token-a", 500), ("token-b", 1000)]),
+        ("todos los contratos enlazados", len(fake.linked) == 400 and analyzer.stats['successful_links'] == 400),
+        ("contadores sumados", analyzer.stats['total_processed'] == 400),
+        ("sin personas duplicadas", len(fake.created) == len(fake.created_order) == analyzer.stats['new_persons_created'] > 0),
+        ("métricas por worker", any(key.startswith("w2 ") for key in metrics)),
+        ("workers spawn reciben configuración y contratos", spawn_journals and spawned.stats['total_processed'] == 6
+         and spawned.stats['skipped_empty_names'] == 6),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_http_connection_pool():
+    """Test para el pool HTTP compartido (keep-alive y timeouts por endpoint)"""
+    print("\n🧪 Probando pool de conexiones HTTP...")
+    
+    import json
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from notion_service import NotionService, endpoint_name
+    from http_pool import HttpConnectionPool, request_endpoint
+    
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+        def log_message(self, *args): pass
+        def reply(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.command == "PATCH": time.sleep(0.5)
+            data = json.dumps({"object": "list", "results": [], "has_more": False, "next_cursor": None,
+                               "id": "p1", "echo": len(body)}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        do_GET = do_POST = do_PATCH = reply
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    pool = HttpConnectionPool(max_connections=2, endpoint_timeouts={'pages.update': 0.1},
+                              base_url=f"http://127.0.0.1:{server.server_address[1]}")
+    try:
+        notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, max_retries=1,
+                               auth="token", http_pool=pool)
+        other = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, auth="otro", http_pool=pool)
+        reads = [notion.validate_database_connection(f"bd{i}") for i in range(4)]  # BD distintas: sin caché de esquemas
+        created = notion.create_person("personas", "NOMBRE", "ANA")
+        other_ok = other.validate_database_connection("contratos")
+        started = time.perf_counter()
+        updated = notion.update_person_properties("p1", {"CORREO": {"email": "a@b.cl"}})
+        timeout_elapsed = time.perf_counter() - started
+        stats = notion.get_connection_pool_stats()
+        relation_read = notion.client.pages.properties.retrieve
+    finally:
+        pool.close()
+        server.shutdown()
+        server.server_close()
+    
+    checks = [
+        ("nombres de endpoint", request_endpoint("POST", "/v1/databases/x/query") == "databases.query"
+         and request_endpoint("PATCH", "/v1/pages/x") == "pages.update"),
+        ("lectura de relaciones con el nombre de ApiMetrics",
+         request_endpoint("GET", "/v1/pages/x/properties/y") == endpoint_name(relation_read) == "pagesproperties.retrieve"
+         and request_endpoint("GET", "/v1/pages/x") == "pages.retrieve"),
+        ("peticiones respondidas por el pool", all(reads) and created["id"] == "p1" and other_ok),
+        ("conexión reutilizada entre clientes", stats['requests'] == 6 and stats['connections_opened'] == 1),
+        ("proporción de reutilización", stats['reuse_ratio'] == round(5 / 6, 3)),
+        ("timeout por endpoint", updated is False and timeout_elapsed < 0.45),
+        ("sin cliente pool no hay estadísticas", NotionService("PERSONAS", client=object()).get_connection_pool_stats() == {}),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_schema_cache():
+    """Test para el caché de esquemas de las BD"""
+    print("\n🧪 Probando caché de esquemas...")
+    
+    import tempfile
+    from fake_notion import FakeNotionClient
+    from notion_service import NotionService
+    from schema_cache import SchemaCache
+    
+    fake = FakeNotionClient(contracts=10, persons=10)
+    def service(path, ttl=3600):
+        return NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, client=fake,
+                             schema_cache=SchemaCache(path, ttl))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "schema_cache.json")
+        notion = service(path)
+        first = [notion.validate_database_connection("contratos"), notion.validate_database_connection("personas")]
+        first += [notion.validate_property_exists("contratos", prop) for prop in ("NOMBRE ORDENADO", "CORREO", "SEXO", "PERSONAS")]
+        first += [notion.validate_property_exists("personas", prop) for prop in ("NOMBRE", "CORREO", "SEXO")]
+        first_calls = fake.calls.get("databases.retrieve", 0)
+        
+        fake.reset_metrics()
+        cached = service(path)
+        second = cached.validate_property_exists("contratos", "PERSONAS") and cached.get_property_type("personas", "NOMBRE") == "title"
+        second_calls = fake.total_calls
+        missing = [cached.validate_property_exists("contratos", "NO EXISTE") for _ in range(3)]
+        missing_calls = fake.calls.get("databases.retrieve", 0)
+        
+        fake.reset_metrics()
+        expired = service(path, ttl=0)
+        expired.validate_property_exists("personas", "CORREO")
+        expired_calls = fake.total_calls
+        unknown = notion.validate_database_connection("otra")
+    
+    checks = [
+        ("una llamada por BD al validar", all(first) and first_calls == 2),
+        ("siguiente ejecución sin llamadas", second and second_calls == 0),
+        ("propiedad faltante: un solo refresco", missing == [False] * 3 and missing_calls == 1),
+        ("esquema vencido se vuelve a pedir", expired_calls == 1),
+        ("BD inexistente", unknown is False),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_batch_normalization():
+    """Test para la normalización por columnas de una página de contratos"""
+    print("\n🧪 Probando normalización por lotes...")
+    
+    import main
+    from fake_notion import FakeNotionClient
+    
+    fake = FakeNotionClient(contracts=300, persons=100)
+    pages = [fake.contract_page(i) for i in range(300)]
+    pages[3]["properties"]["NOMBRE ORDENADO"]["rich_text"] = [{"plain_text": "  maría josé ñúñez "}]
+    pages[4]["properties"]["NOMBRE ORDENADO"]["rich_text"] = []
+    pages[5]["properties"]["CORREO"]["email"] = " ana@example.cl  "
+    
+    def per_item(contracts):
+        return [(c["id"], main.clean_name(main.extract_property_value(c["properties"], "NOMBRE ORDENADO")),
+                 main.extract_property_value(c["properties"], "CORREO").strip(),
+                 main.extract_property_value(c["properties"], "SEXO")) for c in contracts]
+    
+    title_pages = [{"id": "t1", "properties": {"NOMBRE ORDENADO": {"type": "title", "title": [{"plain_text": "Ñandú"}]},
+                                                "CORREO": {"type": "email", "email": None},
+                                                "SEXO": {"type": "select", "select": {"name": "F"}}}}]
+    mixed = [dict(pages[0]), {"id": "x", "properties": {"NOMBRE ORDENADO": {"type": "rich_text", "rich_text": [{"plain_text": "ana"}]}}},
+             {"id": "y", "properties": {"NOMBRE ORDENADO": {"type": "rich_text", "rich_text": [{"plain_text": "luz"}]},
+                                        "CORREO": {"type": "rich_text", "rich_text": [{"plain_text": "luz@example.cl"}]},
+                                        "SEXO": {"type": "select", "select": None}}}]
+    columns = main.extract_contract_columns(pages)
+    
+    checks = [
+        ("clean_name con tildes", main.clean_name("  maría josé ñúñez ") == "MARIA JOSE NUNEZ" and main.clean_name("ana") == "ANA"),
+        ("columnas paralelas", [len(column) for column in columns] == [300] * 4),
+        ("igual que por contrato", list(zip(*columns)) == per_item(pages)),
+        ("título en vez de texto", list(zip(*main.extract_contract_columns(title_pages))) == per_item(title_pages)),
+        ("formato distinto: extracción genérica", list(zip(*main.extract_contract_columns(mixed))) == per_item(mixed)),
+        ("página vacía", main.extract_contract_columns([]) == ([], [], [], [])),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_priority_scheduler():
+    """Test para el scheduler de llamadas por prioridad y los reintentos re-encolados"""
+    print("\n🧪 Probando scheduler por prioridad...")
+    
+    import time
+    import threading
+    from fake_notion import api_error
+    from notion_service import NotionService
+    
+    # Con el único turno ocupado, las llamadas en espera salen por prioridad (y FIFO dentro de cada una)
+    notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, burst=10)
+    scheduler = notion.scheduler
+    scheduler.acquire()
+    granted = []
+    def call(priority):
+        scheduler.acquire(priority)
+        granted.append(priority)
+        scheduler.release()
+    threads = []
+    for priority in [2, 1, 0, 2, 0]:
+        thread = threading.Thread(target=call, args=(priority,))
+        thread.start()
+        threads.append(thread)
+        while len(scheduler.queue) < len(threads): time.sleep(0.001)
+    scheduler.release()
+    for thread in threads: thread.join()
+    
+    # Un reintento espera su backoff fuera de la cola: las demás llamadas no se frenan
+    notion = NotionService(contract_relation_prop="PERSONAS", max_retries=2, retry_delay=0.3,
+                           requests_per_second=1000, burst=10, max_concurrency=2)
+    failures = ["c0"]
+    finished = {}
+    start = time.monotonic()
+    def api_call(contract_id):
+        if contract_id in failures:
+            failures.remove(contract_id)
+            raise api_error(500, "internal_server_error", "Error temporal")
+        time.sleep(0.02)
+        return contract_id
+    def link(contract_id):
+        result = notion._retry_api_call(api_call, contract_id)
+        finished[contract_id] = time.monotonic() - start
+        return result
+    results = notion.run_concurrently(link, [f"c{i}" for i in range(6)])
+    others = max(elapsed for contract_id, elapsed in finished.items() if contract_id != "c0")
+    
+    checks = [
+        ("orden por prioridad", granted == [0, 0, 1, 2, 2]),
+        ("reintento exitoso", results == [f"c{i}" for i in range(6)]),
+        ("respeta el backoff", finished["c0"] >= 0.3),
+        ("las demás no esperan el backoff", others < 0.3),
+        ("turnos contados por prioridad", notion.get_rate_limit_stats()['calls_by_priority'] == {0: 7}),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_relation_batching():
+    """Test para agregar personas a la relación de un contrato sin perder las existentes"""
+    print("\n🧪 Probando enlaces que agregan a la relación...")
+    
+    from fake_notion import FakeNotionClient
+    from notion_service import NotionService, inline_relation_ids
+    from write_planner import WritePlanner
+    
+    fake = FakeNotionClient(contracts=3, persons=100)
+    existing = [f"p-{j:08d}" for j in range(30)]
+    fake.linked[0] = list(existing)
+    notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, burst=10, client=fake)
+    
+    page = fake.contract_page(0)
+    truncated = inline_relation_ids(page, "PERSONAS") is None and len(page["properties"]["PERSONAS"]["relation"]) == 25
+    full = notion.get_relation_ids("c-00000000", "PERSONAS", page)
+    reads = fake.calls.get("pages.properties.retrieve", 0)
+    
+    fake.reset_metrics()
+    added = notion.add_contract_relations("c-00000000", ["p-00000050", "p-00000051", existing[3]])
+    calls_added = dict(fake.calls)
+    fake.reset_metrics()
+    repeated = notion.link_person_to_contract("c-00000000", "p-00000050", current=fake.linked[0])
+    calls_repeated = dict(fake.calls)
+    fake.reset_metrics()
+    notion.link_person_to_contract("c-00000001", "p-00000060", current=[])
+    calls_known = dict(fake.calls)
+    
+    planner = WritePlanner()
+    planner.plan_link("c1", "Ana Pérez", ["p-1"])
+    planner.plan_link("c2", "Ana Pérez", [])
+    planner.plan_link("c1", "Luis Soto")
+    planner.plan_link("c1", "Ana Pérez")
+    
+    checks = [
+        ("relación truncada en la página", truncated),
+        ("relación completa paginada de 25 en 25", full == existing and reads == 2),
+        ("agrega sin perder las existentes", added and fake.linked[0] == existing + ["p-00000050", "p-00000051"]),
+        ("una lectura y una escritura", calls_added == {"pages.properties.retrieve": 2, "pages.update": 1}),
+        ("sin personas nuevas no escribe", repeated and calls_repeated == {}),
+        ("relación conocida: sin lectura", calls_known == {"pages.update": 1} and fake.linked[1] == ["p-00000060"]),
+        ("un enlace por contrato", planner.link_operations() == [
+            {'contract_id': "c1", 'names': ["Ana Pérez", "Luis Soto"], 'current': ["p-1"]},
+            {'contract_id': "c2", 'names': ["Ana Pérez"], 'current': []}]),
+        ("relación completa para reenlazar",
+         notion.with_full_relation(fake.contract_page(0), "PERSONAS")["properties"]["PERSONAS"]["relation"][-1] == {"id": "p-00000051"}),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_daemon_mode():
+    """Test para el modo daemon con intervalo adaptativo y cachés persistentes entre ciclos"""
+    print("\n🧪 Probando modo daemon...")
+    
+    import threading
+    import time
+    import main
+    from datetime import datetime, timezone
+    from fake_notion import FakeNotionClient, synthetic_name, api_error
+    from notion_service import NotionService
+    from analysis_service import ProcessingAnalyzer
+    from polling import AdaptiveInterval, ContractPoller
+    
+    interval = AdaptiveInterval(5, 60)
+    steps = [interval.next(found) for found in (0, 0, 0, 0, 0, 3, 0)]
+    
+    fake = FakeNotionClient(contracts=30, persons=20)
+    # Un ciclo interrumpido a mitad de la consulta no deja la marca de agua avanzada
+    poller = ContractPoller(NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, client=fake), "contratos")
+    partial = poller.poll()
+    next(partial); next(partial)
+    partial.close()
+    poller.rollback()
+    rolled_back = poller.since == "" and poller.seen == {}
+    
+    # El primer enlace del contrato 3 falla: la marca ya lo pasó, así que debe reintentarse
+    update_page, failing = fake.update_page, [True]
+    def flaky_update(page_id, properties):
+        if page_id == "c-00000003" and failing[0]: raise api_error(400, "validation_error", "Invalid relation")
+        return update_page(page_id, properties)
+    fake.update_page = flaky_update
+    notion = NotionService(contract_relation_prop="PERSONAS", requests_per_second=1000, burst=10, client=fake)
+    analyzer = ProcessingAnalyzer()
+    sessions = []
+    def finish_session(notion, analyzer, api_metrics=None):
+        sessions.append(analyzer.stats['successful_links'])
+        failing[0] = False  # El reintento del ciclo siguiente ya puede enlazarlo
+    overrides = {'finish_session': finish_session,
+                 'JOURNAL_FILE': None, 'PERSON_CACHE_FILE': None, 'INCREMENTAL_SYNC': False,
+                 'PRELOAD_PERSON_INDEX': False, 'POLL_MIN_SECONDS': 0.01, 'POLL_MAX_SECONDS': 0.05}
+    originals = {name: getattr(main, name) for name in overrides}
+    
+    def wait_until(condition, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline: time.sleep(0.005)
+        return condition()
+    
+    stop = threading.Event()
+    for name, value in overrides.items():
+        setattr(main, name, value)
+    try:
+        daemon = threading.Thread(target=main.run_daemon, args=(notion, analyzer, "contratos", "personas", stop))
+        daemon.start()
+        backlog_done = wait_until(lambda: len(fake.linked) == 30 and len(sessions) >= 2)
+        time.sleep(0.2)  # Ciclos sin trabajo
+        idle_sessions = len(sessions)
+        
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        with fake.lock:
+            for i in range(30, 35): fake.edit_contract(i, now)
+            fake.contracts = 35
+        started = time.monotonic()
+        new_linked = wait_until(lambda: len(fake.linked) == 35 and len(sessions) > idle_sessions)
+        latency = time.monotonic() - started
+    finally:
+        stop.set()
+        daemon.join(5)
+        for name, value in originals.items():
+            setattr(main, name, value)
+    
+    linker = main.ContractLinker(notion, analyzer, "personas")
+    refreshed = linker.refresh_persons([fake.person_page("p-x", synthetic_name(3), "nuevo@example.cl", "F")])
+    
+    checks = [
+        ("intervalo se duplica sin trabajo y vuelve al mínimo", steps == [10, 20, 40, 60, 60, 5, 10]),
+        ("ciclo interrumpido vuelve a la marca anterior", rolled_back),
+        ("backlog enlazado en una sesión", sessions[0] == 29),
+        ("contrato fallido se reintenta tras pasar la marca", backlog_done and sessions[1] == 1 and 3 in fake.linked),
+        ("ciclos sin trabajo no abren sesión", idle_sessions == 2),
+        ("contratos nuevos enlazados en segundos", new_linked and sessions[-1] == 5 and latency < 2),
+        ("se detiene con el evento", not daemon.is_alive()),
+        ("personas editadas al caché", refreshed == 1 and
+         linker.person_cache[main.clean_name(synthetic_name(3))] == {'id': "p-x", 'correo': "nuevo@example.cl", 'sexo': "F"}),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_webhook_ingestion():
+    """Test para el receptor de webhooks con deduplicación y enlace sin consultas a Contratos"""
+    print("\n🧪 Probando ingesta por webhooks...")
+    
+    import threading
+    import time
+    import urllib.error
+    import main
+    from fake_notion import FakeNotionClient, api_error
+    from notion_service import NotionService
+    from analysis_service import ProcessingAnalyzer
+    from webhook import EventBuffer, WebhookServer, post_event, sample_event
+    
+    now = [0.0]
+    buffer = EventBuffer(window=2.0, clock=lambda: now[0])
+    first = buffer.add("a")
+    repeated = buffer.add("a", {"id": "a"})
+    early = buffer.due()
+    now[0] = 2.5
+    ready = buffer.due()
+    buffer.mark_done(["a"])
+    echo = buffer.add("a")
+    now[0] = 5.0
+    after_window = buffer.add("a")
+    dedup_ok = first and not repeated and early == [] and ready == [("a", {"id": "a"})] and not echo and after_window
+    # Un fallo vuelve una vez a la cola (sin la página, para releerla); el segundo ya no
+    buffer.due()
+    first_retry = buffer.requeue(["a"])
+    now[0] = 7.5
+    retried = buffer.due()
+    second_retry = buffer.requeue(["a"])
+    requeue_ok = first_retry == [] and retried == [("a", None)] and second_retry == ["a"] and buffer.pending == {}
+    
+    fake = FakeNotionClient(contracts=10, persons=10)
+    update_page, failing = fake.update_page, [True]
+    def flaky_update(page_id, properties):
+        if page_id == "c-00000002" and failing[0]:
+            failing[0] = False
+            raise api_error(400, "validation_error", "Invalid relation")
+        return update_page(page_id, properties)
+    fake.update_page = flaky_update
+    notion = NotionService(contract_relation_prop="PERSONAS", max_retries=1, requests_per_second=1000, burst=10,
+                           client=fake)
+    analyzer = ProcessingAnalyzer()
+    sessions = []
+    overrides = {'finish_session': lambda notion, analyzer, api_metrics=None: sessions.append(analyzer.stats['successful_links']),
+                 'JOURNAL_FILE': None, 'PERSON_CACHE_FILE': None, 'PRELOAD_PERSON_INDEX': False}
+    originals = {name: getattr(main, name) for name in overrides}
+    server = WebhookServer(("127.0.0.1", 0), EventBuffer(window=0.3), ["contratos", "personas"], secret="secreto")
+    stop = threading.Event()
+    for name, value in overrides.items():
+        setattr(main, name, value)
+    try:
+        receiver = threading.Thread(target=main.run_webhook, args=(notion, analyzer, "contratos", "personas", stop, server))
+        receiver.start()
+        responses = []
+        for i in range(5):
+            responses.append(post_event(server.url, sample_event(f"c-{i:08d}", "contratos"), "secreto"))
+            responses.append(post_event(server.url, sample_event(f"c-{i:08d}", "contratos", "page.properties_updated"), "secreto"))
+        automation = {"source": {"type": "automation"}, "data": {**fake.contract_page(5), "parent": {"database_id": "contratos"}}}
+        responses.append(post_event(server.url, automation, "secreto"))
+        other_db = post_event(server.url, sample_event("x-1", "otra-bd"), "secreto")
+        try:
+            post_event(server.url, sample_event("c-00000006", "contratos"), "otro-secreto")
+            rejected = False
+        except urllib.error.HTTPError as e:
+            rejected = e.code == 401
+        deadline = time.monotonic() + 10
+        while len(fake.linked) < 6 and time.monotonic() < deadline: time.sleep(0.01)
+        # El contrato 2 se enlaza al final, en el reintento: su evento de eco cae dentro de la ventana
+        echo = post_event(server.url, sample_event("c-00000002", "contratos", "page.properties_updated"), "secreto")
+        time.sleep(0.5)
+    finally:
+        stop.set()
+        receiver.join(5)
+        for name, value in originals.items():
+            setattr(main, name, value)
+    
+    checks = [
+        ("ventana de deduplicación y de eco", dedup_ok),
+        ("enlace fallido reencolado una vez", requeue_ok),
+        ("un evento encolado por página", [r['queued'] for r in responses] == [True, False] * 5 + [True]),
+        ("otras BD ignoradas", other_db == {"ok": True, "queued": False}),
+        ("firma inválida rechazada", rejected),
+        ("contratos enlazados", sorted(fake.linked) == list(range(6)) and sum(sessions) == 6),
+        ("eco del enlace ignorado", echo['queued'] is False and sum(sessions) == 6),
+        ("fallo reintentado desde la cola", server.buffer.stats['requeued'] == 1 and 2 in fake.linked
+         and not server.buffer.retried),
+        ("sin consultas de contratos", fake.calls.get("pages.retrieve") == 6 and server.buffer.stats['rejected'] == 1),
+        ("receptor detenido", not receiver.is_alive()),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_report_store():
+    """Test para el almacén SQLite de reportes y su CLI de consultas"""
+    print("\n🧪 Probando almacén de reportes en SQLite...")
+    
+    import contextlib
+    import csv
+    import io
+    import tempfile
+    from analysis_service import ProcessingAnalyzer, ReportWriter
+    from report_store import ReportStore, main as report_main
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        for session in range(2):
+            analyzer = ProcessingAnalyzer(ReportWriter(directory=tmp, store_path="reportes.db", csv_reports=False))
+            for k in range(50):
+                analyzer.record_contract_processed()
+                analyzer.record_successful_link(f"c{k}", f"PERSONA {k}", f"p{k}")
+                if k % 10 == 0: analyzer.record_new_person_created(f"PERSONA {k}", f"p{k}")
+                if k % 25 == 0: analyzer.record_error(f"c{k}", f"PERSONA {k}", "sin permisos" if k else "timeout")
+            analyzer.record_properties_updated("p7", "PERSONA 7", ["Cédula"])
+            analyzer.end_session()
+            analyzer.export_cumulative_reports()
+            analyzer.record_session()
+            analyzer.close()
+        legacy_files = [name for name in os.listdir(tmp) if name.endswith((".csv", ".txt"))]
+        
+        store = ReportStore(os.path.join(tmp, "reportes.db"))
+        summary = {kind: count for _, kind, count in store.summary()}
+        errors = store.error_counts()
+        history = store.person_history("PERSONA 7")
+        sessions = store.sessions()
+        last_report = store.session_report()
+        exported = store.export_csv(tmp)
+        with open(os.path.join(tmp, "reporte_errores.csv"), encoding='utf-8') as f:
+            error_rows = list(csv.reader(f))
+        copy = ReportStore(os.path.join(tmp, "copia.db"))
+        imported = copy.import_csv(tmp)
+        copied_errors = copy.error_counts()
+        copy.close(); store.close()
+        
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            report_main(["--db", os.path.join(tmp, "reportes.db"), "errors"])
+            report_main(["--db", os.path.join(tmp, "reportes.db"), "summary", "--by", "month"])
+    
+    checks = [
+        ("sin CSV ni TXT por sesión", legacy_files == []),
+        ("eventos por tipo", summary == {'link': 100, 'new_person': 10, 'error': 4, 'properties_updated': 2}),
+        ("errores agrupados por mensaje", [(e[0], e[1]) for e in errors] == [("sin permisos", 2), ("timeout", 2)]),
+        ("historial de una persona", [h[1] for h in history] == ['link', 'properties_updated'] * 2
+         and history[1][5] == "Cédula"),
+        ("una fila por sesión", len(sessions) == 2 and sessions[-1][3] == 50 and sessions[-1][5] == 2),
+        ("reporte de sesión en tabla", last_report is not None and "REPORTE DE SESIÓN" in last_report[1]),
+        ("CSV generados como vista", exported["reporte_errores.csv"] == 4
+         and error_rows[0] == ['contract_id', 'person_name', 'error', 'timestamp'] and error_rows[1][2] == "timeout"),
+        ("CSV importables", imported["reporte_nuevas_personas.csv"] == 10 and copied_errors[0][1] == 2),
+        ("CLI de consultas", "sin permisos" in output.getvalue() and "link" in output.getvalue()),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
+def test_lazy_startup():
+    """Test para el arranque sin trabajo: comprobación local e imports diferidos"""
+    print("\n🧪 Probando arranque diferido...")
+    
+    import subprocess
+    import sys
+    import tempfile
+    import main
+    from analysis_service import ReportWriter
+    from fake_notion import FakeNotionClient
+    from snapshot_store import SnapshotStore
+    
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, main; print(sorted(m for m in ('notion_client', 'httpx', 'http.server') if m in sys.modules))"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True).stdout.strip()
+    
+    fake = FakeNotionClient(contracts=20, persons=0)
+    fake.linked.update((i, ["persona"]) for i in range(19))
+    built = []
+    original_env = os.environ.copy()
+    overrides = {'SNAPSHOT_FILE': None, 'build_notion_service': lambda *args, **kwargs: built.append(args) or 1 / 0}
+    originals = {name: getattr(main, name) for name in overrides}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "snapshot.db")
+        store = SnapshotStore(path)
+        store.import_database("contratos", (fake.contract_page(i) for i in range(19)),
+                              [main.CONTRATO_RELACION_PROP], relation_prop=main.CONTRATO_RELACION_PROP)
+        all_linked = main.nothing_to_link(store, "contratos")
+        other_db = main.nothing_to_link(store, "personas")
+        store.import_database("contratos", (fake.contract_page(i) for i in range(20)),
+                              [main.CONTRATO_RELACION_PROP], relation_prop=main.CONTRATO_RELACION_PROP)
+        one_pending = main.nothing_to_link(store, "contratos")
+        store.import_database("contratos", (fake.contract_page(i) for i in range(19)),
+                              [main.CONTRATO_RELACION_PROP], relation_prop=main.CONTRATO_RELACION_PROP)
+        store.close()
+        
+        os.environ.update({"NOTION_API_KEY": "test", "CONTRATOS_DB_ID": "contratos", "PERSONAS_DB_ID": "personas"})
+        for name, value in overrides.items():
+            setattr(main, name, value)
+        main.SNAPSHOT_FILE = path
+        try:
+            main.main()
+        finally:
+            for name, value in originals.items():
+                setattr(main, name, value)
+            os.environ.clear()
+            os.environ.update(original_env)
+        
+        writer = ReportWriter(directory=tmp, store_path="reportes.db")
+        writer.flush(); writer.close()
+        idle_writer = not writer.started and not os.path.exists(os.path.join(tmp, "reportes.db"))
+    
+    checks = [
+        ("import sin notion_client, httpx ni http.server", loaded == "[]"),
+        ("snapshot sin contratos pendientes", all_linked and not one_pending),
+        ("BD fuera del snapshot no se da por vacía", not other_db),
+        ("main() termina sin crear el servicio", built == []),
+        ("ReportWriter sin eventos no inicia su hilo", idle_writer),
+    ]
+    for label, ok in checks:
+        print(f"{'✅' if ok else '❌'} {label}")
+    return all(ok for _, ok in checks)
+
 def run_all_tests():
     """Ejecuta todos los tests"""
     print("🚀 Iniciando tests del Notion Linker...\n")
@@ -151,6 +1537,31 @@ def run_all_tests():
         ("clean_name", test_clean_name),
         ("extract_property_value", test_extract_property_value),
         ("environment_validation", test_environment_validation),
+        ("person_index", test_person_index),
+        ("unlinked_contracts_streaming", test_unlinked_contracts_streaming),
+        ("rate_limiter_concurrency", test_rate_limiter_concurrency),
+        ("adaptive_rate_limit", test_adaptive_rate_limit),
+        ("persistent_person_cache", test_persistent_person_cache),
+        ("incremental_sync_state", test_incremental_sync_state),
+        ("write_coalescing", test_write_coalescing),
+        ("journal_resume", test_journal_resume),
+        ("fake_notion_client", test_fake_notion_client),
+        ("api_metrics", test_api_metrics),
+        ("fuzzy_person_matching", test_fuzzy_person_matching),
+        ("offline_plan", test_offline_plan),
+        ("snapshot_store", test_snapshot_store),
+        ("duplicate_merge_plan", test_duplicate_merge_plan),
+        ("streaming_reports", test_streaming_reports),
+        ("sharded_linking", test_sharded_linking),
+        ("http_connection_pool", test_http_connection_pool),
+        ("schema_cache", test_schema_cache),
+        ("batch_normalization", test_batch_normalization),
+        ("priority_scheduler", test_priority_scheduler),
+        ("relation_batching", test_relation_batching),
+        ("daemon_mode", test_daemon_mode),
+        ("webhook_ingestion", test_webhook_ingestion),
+        ("report_store", test_report_store),
+        ("lazy_startup", test_lazy_startup),
     ]
     
     passed = 0
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Receptor local de webhooks de Notion para enlazar contratos sin consultar la BD.
+Enviar un evento de prueba: python webhook.py --page <page_id> --database <contratos_db_id>
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+PAGE_EVENTS = ("page.created", "page.properties_updated", "page.undeleted", "page.moved")
+
+def normalize_id(notion_id: str) -> str:
+    """ID de Notion comparable, con o sin guiones."""
+    return (notion_id or "").replace("-", "").lower()
+
+def parse_event(payload: dict):
+    """Extrae (page_id, database_id, página o None) de un evento de Notion, o None si no es de una página.
+
+    Acepta los eventos de las suscripciones de webhooks de una integración (`entity` con
+    el ID de la página: hay que leerla) y los de la acción "Send webhook" de las
+    automatizaciones de una BD (`data` trae la página completa con sus propiedades).
+    """
+    data = payload.get("data") or {}
+    if data.get("object") == "page" and data.get("id"):
+        parent = data.get("parent") or {}
+        return data["id"], parent.get("database_id") or parent.get("data_source_id"), data
+    entity = payload.get("entity") or {}
+    if entity.get("type") != "page" or payload.get("type") not in PAGE_EVENTS:
+        return None
+    parent = data.get("parent") or {}
+    return entity["id"], parent.get("id"), None
+
+def sign(body: bytes, secret: str) -> str:
+    """Firma de un cuerpo como la cabecera X-Notion-Signature (HMAC-SHA256 con el verification_token)."""
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+class EventBuffer:
+    """Agrupa los eventos de cada página durante `window` segundos antes de entregarlos.
+
+    Notion envía varios eventos por una misma edición (y uno más cuando el enlazador
+    escribe la relación): dentro de la ventana se conserva solo el último de cada página,
+    y los eventos que llegan dentro de la ventana posterior a su procesamiento se descartan.
+    """
+
+    def __init__(self, window: float = 2.0, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.pending = {}  # page_id -> [primer evento, página o None]
+        self.done = {}     # page_id -> instante en que se procesó
+        self.retried = set()  # page_ids reencolados tras un procesamiento fallido
+        self.stats = Counter()
+
+    def add(self, page_id: str, page: dict = None) -> bool:
+        """Registra un evento; devuelve False si se descartó por duplicado."""
+        now = self.clock()
+        with self.lock:
+            self.stats['received'] += 1
+            if now - self.done.get(page_id, float("-inf")) < self.window:
+                self.stats['duplicates'] += 1
+                return False
+            if page_id in self.pending:
+                self.stats['duplicates'] += 1
+                if page is not None: self.pending[page_id][1] = page
+                return False
+            self.pending[page_id] = [now, page]
+            return True
+
+    def due(self) -> list:
+        """Saca los eventos cuya ventana venció: [(page_id, página o None)]."""
+        now = self.clock()
+        with self.lock:
+            ready = [page_id for page_id, (first, _) in self.pending.items() if now - first >= self.window]
+            self.done = {page_id: at for page_id, at in self.done.items() if now - at < self.window}
+            return [(page_id, self.pending.pop(page_id)[1]) for page_id in ready]
+
+    def mark_done(self, page_ids):
+        """Abre la ventana de eco de las páginas procesadas (p. ej. los contratos recién enlazados)."""
+        now = self.clock()
+        with self.lock:
+            for page_id in page_ids:
+                self.done[page_id] = now
+                self.retried.discard(page_id)
+
+    def requeue(self, page_ids) -> list:
+        """Vuelve a encolar, sin la página, los contratos que no se pudieron enlazar.
+
+        Cada página se reintenta una sola vez por evento: devuelve las que ya se habían
+        reintentado, que quedan fuera de la cola hasta el próximo evento.
+        """
+        now, exhausted = self.clock(), []
+        with self.lock:
+            for page_id in page_ids:
+                if page_id in self.retried:
+                    self.retried.discard(page_id)
+                    exhausted.append(page_id)
+                    continue
+                self.retried.add(page_id)
+                self.done.pop(page_id, None)
+                self.pending.setdefault(page_id, [now, None])
+                self.stats['requeued'] += 1
+        return exhausted
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        if self.path.split("?")[0] != server.path:
+            return self._reply(404, {"error": "not_found"})
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if server.secret and not hmac.compare_digest(sign(body, server.secret), self.headers.get("X-Notion-Signature", "")):
+            server.buffer.stats['rejected'] += 1
+            return self._reply(401, {"error": "invalid_signature"})
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return self._reply(400, {"error": "invalid_json"})
+        if "verification_token" in payload:
+            logger.warning(f"🔑 Token de verificación de la suscripción: {payload['verification_token']} "
+                           f"(guárdalo en NOTION_WEBHOOK_SECRET y confírmalo en Notion).")
+            return self._reply(200, {"ok": True})
+        event = parse_event(payload)
+        if event is None or (event[1] and normalize_id(event[1]) not in server.database_ids):
+            server.buffer.stats['ignored'] += 1
+            return self._reply(200, {"ok": True, "queued": False})
+        queued = server.buffer.add(event[0], event[2])
+        return self._reply(200, {"ok": True, "queued": queued})
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Webhook {self.address_string()}: {format % args}")
+
+class WebhookServer(ThreadingHTTPServer):
+    """Endpoint HTTP local que recibe los eventos de Notion y los deja en un EventBuffer.
+
+    Solo encola eventos de páginas de `database_ids` (los que no traen la BD se filtran
+    al leer la página). Con `secret` se exige la firma X-Notion-Signature. Responde de
+    inmediato: el enlace lo hace quien consume el buffer.
+    """
+    daemon_threads = True
+
+    def __init__(self, address: tuple, buffer: EventBuffer, database_ids, secret: str = None, path: str = "/webhook"):
+        super().__init__(address, WebhookHandler)
+        self.buffer = buffer
+        self.database_ids = {normalize_id(db_id) for db_id in database_ids if db_id}
+        self.secret = secret
+        self.path = path
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{self.path}"
+
+def sample_event(page_id: str, database_id: str, event_type: str = "page.created") -> dict:
+    """Evento de ejemplo con el formato de las suscripciones de webhooks de Notion."""
+    return {"type": event_type, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "entity": {"id": page_id, "type": "page"},
+            "data": {"parent": {"id": database_id, "type": "database"}}}
+
+def post_event(url: str, payload: dict, secret: str = None, timeout: float = 10.0) -> dict:
+    """Envía un evento al receptor como lo haría Notion (firmado si se indica `secret`)."""
+    import urllib.request
+    body = json.dumps(payload).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if secret: headers["X-Notion-Signature"] = sign(body, secret)
+    request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    from dotenv import load_dotenv
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Envía eventos de prueba al receptor de webhooks.")
+    parser.add_argument("--url", default="http://127.0.0.1:8787/webhook")
+    parser.add_argument("--page", action="append", required=True, help="ID de la página (se puede repetir)")
+    parser.add_argument("--database", default=os.getenv("CONTRATOS_DB_ID"))
+    parser.add_argument("--type", default="page.created", choices=PAGE_EVENTS)
+    args = parser.parse_args()
+    for page_id in args.page:
+        print(post_event(args.url, sample_event(page_id, args.database, args.type), os.getenv("NOTION_WEBHOOK_SECRET")))
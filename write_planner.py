@@ -0,0 +1,92 @@
+import threading
+from collections import Counter
+
+PERSON_FIELDS = ("correo", "sexo")
+
+def person_properties(correo: str = "", sexo: str = "") -> dict:
+    """Construye las propiedades de Notion de una persona a partir de correo/sexo."""
+    properties = {}
+    if correo:
+        properties["CORREO"] = {"email": correo}
+    if sexo:
+        properties["SEXO"] = {"select": {"name": sexo}}
+    return properties
+
+def resolve_value(candidates: Counter) -> str:
+    """Elige el valor más frecuente; los empates se resuelven por orden alfabético.
+
+    Así el resultado no depende del orden en que llegaron los contratos.
+    """
+    if not candidates: return ""
+    return min(candidates.items(), key=lambda item: (-item[1], item[0]))[0]
+
+class WritePlanner:
+    """Reúne las mutaciones de un lote y las reduce a una escritura por página.
+
+    Las creaciones se agrupan por nombre y las actualizaciones por page_id; cada
+    contrato aporta candidatos para correo/sexo y el valor final se decide con
+    `resolve_value`. Los enlaces se agrupan por contrato: todas las personas de un
+    contrato se agregan a su relación con una sola escritura.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.creates = {}   # nombre -> {campo: Counter}
+        self.updates = {}   # page_id -> {'name': nombre, 'fields': {campo: Counter}}
+        self.links = []     # (contract_id, nombre)
+        self.relations = {}  # contract_id -> IDs ya enlazados, si la página los traía completos
+
+    @staticmethod
+    def _add_candidates(fields: dict, values: dict):
+        for field in PERSON_FIELDS:
+            if values.get(field):
+                fields.setdefault(field, Counter())[values[field]] += 1
+
+    def plan_create(self, name: str, correo: str = "", sexo: str = ""):
+        """Planifica la creación de una persona (una sola por nombre en el lote)."""
+        with self.lock:
+            self._add_candidates(self.creates.setdefault(name, {}), {'correo': correo, 'sexo': sexo})
+
+    def plan_update(self, page_id: str, name: str, correo: str = "", sexo: str = ""):
+        """Planifica valores para campos vacíos de una persona existente."""
+        if not (correo or sexo): return
+        with self.lock:
+            entry = self.updates.setdefault(page_id, {'name': name, 'fields': {}})
+            self._add_candidates(entry['fields'], {'correo': correo, 'sexo': sexo})
+
+    def plan_link(self, contract_id: str, person_name: str, current: list = None):
+        """Planifica el enlace de un contrato con la persona de ese nombre.
+
+        `current` es la relación actual del contrato si se conoce; si no, se lee al enlazar.
+        """
+        with self.lock:
+            self.links.append((contract_id, person_name))
+            if current is not None:
+                self.relations.setdefault(contract_id, list(current))
+
+    def create_operations(self) -> list:
+        """Devuelve las creaciones resueltas: [{'name', 'correo', 'sexo'}]."""
+        return [
+            {'name': name, **{field: resolve_value(fields.get(field)) for field in PERSON_FIELDS}}
+            for name, fields in self.creates.items()
+        ]
+
+    def update_operations(self) -> list:
+        """Devuelve una actualización resuelta por página: [{'page_id', 'name', 'correo', 'sexo'}]."""
+        return [
+            {'page_id': page_id, 'name': entry['name'],
+             **{field: resolve_value(entry['fields'].get(field)) for field in PERSON_FIELDS}}
+            for page_id, entry in self.updates.items()
+        ]
+
+    def link_operations(self) -> list:
+        """Devuelve un enlace por contrato: [{'contract_id', 'names', 'current'}], en orden de llegada.
+
+        `names` son las personas a agregar (sin repetir) y `current` la relación conocida o None.
+        """
+        grouped = {}
+        for contract_id, name in self.links:
+            names = grouped.setdefault(contract_id, [])
+            if name not in names: names.append(name)
+        return [{'contract_id': contract_id, 'names': names, 'current': self.relations.get(contract_id)}
+                for contract_id, names in grouped.items()]